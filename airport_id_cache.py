@@ -0,0 +1,93 @@
+"""
+Caches airport ids (Place ids) for city-country pairs in memory and in local JSON file,
+so autosuggest API is not requested for the same city on every run.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+
+class AirportIdCache:
+    """
+    City-country -> airport ids cache with TTL, stored in memory and persisted into JSON file
+    """
+
+    stage_name = "AIRPORT_ID_CACHE"
+
+    def __init__(self, file_path: str, logger: logging.Logger, ttl_days: float = 30):
+        self.file_path = file_path
+        self.logger = logger
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    @staticmethod
+    def build_key(search_city: str, search_country: str, locale_lang: str) -> str:
+        return f"{search_city}-{search_country}-{locale_lang}".lower()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.file_path, "r") as file:
+                entries = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            self.logger.warning(f"{self.stage_name} - Couldn't read '{self.file_path}', starting with empty cache. "
+                                f"Occurred exception - '{exc}'")
+            return {}
+        self.logger.debug("%s - Loaded %s entries from '%s'", self.stage_name, len(entries), self.file_path)
+        return entries
+
+    def _save(self) -> None:
+        # write into temp file and rename it, so crash mid-write doesn't corrupt the cache
+        tmp_file_path = f"{self.file_path}.tmp"
+        try:
+            with open(tmp_file_path, "w") as file:
+                json.dump(self._entries, file)
+            os.replace(tmp_file_path, self.file_path)
+        except OSError as exc:
+            self.logger.warning(f"{self.stage_name} - Couldn't record cache into '{self.file_path}'. "
+                                f"Occurred exception - '{exc}'")
+
+    def get(self, search_city: str, search_country: str, locale_lang: str) -> list or None:
+        """
+        Returns cached airport ids or None if they are missing or expired
+        """
+
+        key = self.build_key(search_city, search_country, locale_lang)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["cached_at"] > self.ttl_seconds:
+                self.logger.debug("%s - Entry for %s-%s is expired", self.stage_name, search_city, search_country)
+                return None
+            return entry["airport_ids"]
+
+    def set(self, search_city: str, search_country: str, locale_lang: str, airport_ids: list) -> None:
+        """
+        Caches airport ids and persists them into file
+        """
+
+        key = self.build_key(search_city, search_country, locale_lang)
+        with self._lock:
+            self._entries[key] = {"airport_ids": airport_ids, "cached_at": time.time()}
+            self._save()
+
+    def invalidate(self, search_city: str = None, search_country: str = None, locale_lang: str = None) -> None:
+        """
+        Removes entry for city-country pair or all entries if city is not passed
+        """
+
+        with self._lock:
+            if search_city is None:
+                self._entries.clear()
+                self.logger.info(f"{self.stage_name} - Invalidated all entries")
+            else:
+                key = self.build_key(search_city, search_country, locale_lang)
+                self._entries.pop(key, None)
+                self.logger.info(f"{self.stage_name} - Invalidated entry for {search_city}-{search_country}")
+            self._save()
@@ -0,0 +1,106 @@
+"""
+All-airports mode: every origin x destination airport pair of the city pair is fetched (e.g. Tokyo has NRT and HND,
+the cheapest fares can be from either of them). Itineraries returned by several pairs (e.g. city code 'TYOA-sky'
+returns flights of NRT and HND as well) are recorded only once, min price of every date is kept across all pairs.
+"""
+
+import logging
+import threading
+from price_facts import get_browse_quote_leg_id
+
+
+def build_airport_pairs(airport_ids_orig: list, airport_ids_dest: list, max_pairs: int = None) -> list:
+    """
+    Returns (origin, destination) airport id pairs, pairs of the most relevant airports first
+    (airport ids are in autosuggest order), cut to max_pairs
+    """
+
+    pairs = [(orig_number, dest_number, airport_id_orig, airport_id_dest)
+             for orig_number, airport_id_orig in enumerate(airport_ids_orig)
+             for dest_number, airport_id_dest in enumerate(airport_ids_dest)
+             if airport_id_orig != airport_id_dest]
+    pairs.sort(key=lambda pair: max(pair[0], pair[1]))  # stable - 1st x 1st, then pairs with 2nd airports etc.
+    return [(airport_id_orig, airport_id_dest) for _, _, airport_id_orig, airport_id_dest in pairs[:max_pairs]]
+
+
+def get_itineraries_field(document: dict) -> tuple:
+    """
+    Returns name of result's itineraries field and function returning key of itinerary
+    (Live API - outbound and inbound leg ids, Browse Quotes - outbound leg)
+    """
+
+    if "Itineraries" in document:
+        return "Itineraries", lambda itinerary: (itinerary.get("OutboundLegId"), itinerary.get("InboundLegId"))
+    return "Quotes", lambda quote: (get_browse_quote_leg_id(quote.get("OutboundLeg", {})), None)
+
+
+class ItineraryDeduplicator:
+    """
+    Remembers which airport pair (route) recorded every itinerary of the date first
+    and drops it from results of the other pairs before they are recorded
+    """
+
+    stage_name = "DEDUPLICATE_ITINERARIES"
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self._owners = {}  # {outbound date: {itinerary key: route}}
+        self._lock = threading.Lock()
+
+    def filter_results(self, all_results: list, outbound_date: str, route: str) -> list:
+        """
+        Returns results without itineraries already recorded for the date by other routes
+        (repeats within route's own results, e.g. in several polls of Live API session, are kept)
+        """
+
+        filtered_results = []
+        dropped_count = 0
+        with self._lock:
+            owners = self._owners.setdefault(outbound_date, {})
+            for document in all_results:
+                items_name, get_key = get_itineraries_field(document)
+                kept_items = []
+                for item in document.get(items_name, []):
+                    owner = owners.setdefault(get_key(item), route)
+                    if owner == route:
+                        kept_items.append(item)
+                    else:
+                        dropped_count += 1
+                filtered_results.append(dict(document, **{items_name: kept_items}) if items_name in document
+                                        else document)
+
+        if dropped_count:
+            self.logger.debug("%s - %s %s - dropped %s itineraries recorded by other airport pairs",
+                              self.stage_name, route, outbound_date, dropped_count)
+        return filtered_results
+
+
+class CityPairMinPrices:
+    """
+    Collects min prices of every date from all airport pairs.
+    Date is completed once all pairs have completed it, its min price is the cheapest one across the pairs.
+    """
+
+    def __init__(self, pairs_count: int):
+        self.pairs_count = pairs_count
+        self.min_prices = {}  # {outbound date: (min price, route)} of completed dates
+        self._pending = {}  # {outbound date: [completed pairs count, min price, route]}
+        self._lock = threading.Lock()
+
+    def add(self, route: str, min_prices: dict) -> dict:
+        """
+        Adds min prices of 1 airport pair. Returns {date: min price across city pair} of dates completed by it.
+        """
+
+        completed_min_prices = {}
+        with self._lock:
+            for outbound_date, min_price in min_prices.items():
+                pending = self._pending.setdefault(outbound_date, [0, None, None])
+                pending[0] += 1
+                if min_price is not None and (pending[1] is None or min_price < pending[1]):
+                    pending[1], pending[2] = min_price, route
+                if pending[0] >= self.pairs_count:
+                    del self._pending[outbound_date]
+                    self.min_prices[outbound_date] = (pending[1], pending[2])
+                    completed_min_prices[outbound_date] = pending[1]
+        return completed_min_prices
@@ -0,0 +1,140 @@
+"""
+Archives results into daily rolling compressed NDJSON files (1 result per line), streaming them record by record,
+so memory doesn't grow with the size of Live API session and files take a fraction of pretty-printed JSON.
+"""
+
+import contextlib
+import datetime
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+from bson import json_util  # to record JSON to file after mongodb
+from service_methods import timer
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+FILE_EXTENSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+LOCK_FILE_NAME = ".archive.lock"  # appends of all processes writing into the folder are serialized with it
+
+
+class ArchiveWriter:
+    """
+    Appends results to '<day>_<name>.ndjson.gz' (or .zst) files in the folder, new file is started every day.
+    Every write is compressed into temp file first and then appended to the daily file as separate gzip member /
+    zstd frame (concatenated members are valid compressed file), failed append is truncated back,
+    so the daily file never ends with partially written results.
+    Appends are serialized across threads and processes (e.g. workers) with lock file in the folder.
+    """
+
+    stage_name = "ARCHIVE_WRITER"
+
+    def __init__(self, folder_path: str, logger: logging.Logger, compression: str = "gzip", max_retries: int = 3,
+                 retry_delay: float = 1):
+        if compression == "zstd" and zstandard is None:
+            logger.warning(f"{self.stage_name} - 'zstandard' package is not installed, falling back to gzip")
+            compression = "gzip"
+        if compression not in FILE_EXTENSIONS:
+            raise ValueError(f"Unsupported compression '{compression}', expected one of {list(FILE_EXTENSIONS)}")
+        self.folder_path = folder_path
+        self.logger = logger
+        self.compression = compression
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        os.makedirs(folder_path, exist_ok=True)
+
+    def get_file_path(self, name: str) -> str:
+        file_name = f"{datetime.datetime.now().strftime('%Y-%m-%d')}_{name}{FILE_EXTENSIONS[self.compression]}"
+        return os.path.join(self.folder_path, file_name)
+
+    def _open_compressed(self, file):
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor().stream_writer(file, closefd=False)
+        return gzip.GzipFile(fileobj=file, mode="wb")
+
+    def _write_temp_file(self, records: iter) -> tuple:
+        # compress records 1 by 1 into temp file in the same folder (rename into daily file is atomic then)
+        file_descriptor, tmp_file_path = tempfile.mkstemp(dir=self.folder_path, suffix=".tmp")
+        records_count = 0
+        try:
+            with os.fdopen(file_descriptor, "wb") as file, self._open_compressed(file) as compressed_file:
+                for record in records:
+                    compressed_file.write(json.dumps(record, default=json_util.default).encode() + b"\n")
+                    records_count += 1
+        except BaseException:
+            os.remove(tmp_file_path)
+            raise
+        return tmp_file_path, records_count
+
+    @contextlib.contextmanager
+    def _lock_folder(self):
+        # thread lock for threads of this process, file lock for other processes (e.g. workers) writing into folder
+        with self._lock, open(os.path.join(self.folder_path, LOCK_FILE_NAME), "ab") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _append_temp_file(self, tmp_file_path: str, file_path: str) -> None:
+        with self._lock_folder():
+            if not os.path.exists(file_path):
+                os.replace(tmp_file_path, file_path)
+                return
+
+            with open(file_path, "ab") as file, open(tmp_file_path, "rb") as tmp_file:
+                file_size = file.tell()
+                try:
+                    while chunk := tmp_file.read(1024 * 1024):
+                        file.write(chunk)
+                    file.flush()
+                    os.fsync(file.fileno())
+                except OSError:
+                    file.truncate(file_size)
+                    raise
+            os.remove(tmp_file_path)
+
+    def write(self, name: str, records: list) -> bool:
+        """
+        Appends records (1 per line) to today's file of the name, retries up to max_retries times.
+        Returns False if records couldn't be recorded (results are in MongoDB anyway, so run goes on).
+        """
+
+        file_path = self.get_file_path(name)
+        for try_number in range(1, self.max_retries + 1):
+            try:
+                tmp_file_path, records_count = self._write_temp_file(records)
+                try:
+                    self._append_temp_file(tmp_file_path, file_path)
+                finally:
+                    if os.path.exists(tmp_file_path):
+                        os.remove(tmp_file_path)
+                self.logger.info(f"{self.stage_name} - Recorded {records_count} results into "
+                                 f"'{os.path.basename(file_path)}'.")
+                return True
+            except OSError as exc:
+                self.logger.warning(f"{self.stage_name} - Try #{try_number} - Couldn't record results into "
+                                    f"'{os.path.basename(file_path)}', occurred exception - '{exc}'")
+                if try_number < self.max_retries:
+                    timer(wait_time=self.retry_delay, logger=self.logger)
+        self.logger.error(f"{self.stage_name} - Results are not recorded into '{os.path.basename(file_path)}'")
+        return False
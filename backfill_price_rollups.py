@@ -0,0 +1,143 @@
+"""
+Backfills daily price rollups (and optionally price facts) from results already recorded by record_json_to_mongodb
+and from snapshots recorded by record_snapshot_changes (if 'store_changes_only' is set, results are stored only there).
+Run: python backfill_price_rollups.py [--with-facts] [--batch-size 500]
+"""
+
+import argparse
+import os
+from bson import ObjectId
+from config import *
+from logger import create_logger
+from mongodb_methods import (build_route, connect_to_mongodb, create_price_facts_indexes, create_price_rollups_indexes,
+                             get_fetch_bucket, iter_snapshots, record_price_facts, update_price_rollups)
+from price_facts import normalize_results
+
+
+def get_place_code(places: list, place_id, id_field: str, code_field: str) -> str or None:
+    for place in places:
+        if str(place.get(id_field)) == str(place_id):
+            return f"{place.get(code_field)}-sky"
+    return None
+
+
+def get_document_route_and_date(document: dict) -> tuple:
+    """
+    Returns route and outbound date of the recorded result.
+    Older documents have no Route field, so it's restored from Live API Query or Browse Quotes legs.
+    """
+
+    if "Route" in document:
+        return document["Route"], document["OutboundDate"]
+
+    places = document.get("Places", [])
+    if "Query" in document:  # Live API
+        query = document["Query"]
+        origin = get_place_code(places, query.get("OriginPlace"), "Id", "Code")
+        destination = get_place_code(places, query.get("DestinationPlace"), "Id", "Code")
+        outbound_date = query.get("OutboundDate")
+    elif document.get("Quotes"):  # Browse Quotes
+        outbound_leg = document["Quotes"][0].get("OutboundLeg", {})
+        origin = get_place_code(places, outbound_leg.get("OriginId"), "PlaceId", "SkyscannerCode")
+        destination = get_place_code(places, outbound_leg.get("DestinationId"), "PlaceId", "SkyscannerCode")
+        outbound_date = (outbound_leg.get("DepartureDate") or "")[:10] or None
+    else:
+        return None, None
+
+    if not (origin and destination and outbound_date):
+        return None, None
+    return build_route(origin, destination), outbound_date
+
+
+def iter_recorded_results(collection, snapshots_collection, batch_size: int) -> iter:
+    """
+    Yields (route, outbound date, fetch time, results) of every recorded result and snapshot
+    (route is None for results it can't be restored for)
+    """
+
+    for document in collection.find({}, batch_size=batch_size):
+        route, outbound_date = get_document_route_and_date(document)
+
+        # fetch time is recorded since dedup keys were introduced, older documents have it in ObjectId
+        fetched_at = document.get("FetchedAt")
+        if fetched_at is None and isinstance(document["_id"], ObjectId):
+            fetched_at = document["_id"].generation_time
+        yield (route if fetched_at is not None else None), outbound_date, fetched_at, [document]
+
+    yield from iter_snapshots(collection=snapshots_collection,
+                              batch_size=batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--with-facts", action="store_true", help="also record price facts for older documents")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    stage_name = "BACKFILL_ROLLUPS"
+    logger = create_logger(log_file_folder_path=os.path.join(os.getcwd(), log_files_folder),
+                           log_file_name=log_file,
+                           level=log_level,
+                           json_lines=log_json_lines)
+
+    collection = connect_to_mongodb(mongodb_instance=instance,
+                                    mongodb=db,
+                                    mongodb_collection=db_collection,
+                                    logger=logger,
+                                    write_concern=mongodb_write_concern)
+    price_facts_collection = collection.database.get_collection(db_price_facts_collection,
+                                                                write_concern=collection.write_concern)
+    price_rollups_collection = collection.database.get_collection(db_price_rollups_collection,
+                                                                  write_concern=collection.write_concern)
+    snapshots_collection = collection.database.get_collection(db_snapshots_collection)
+    create_price_facts_indexes(collection=price_facts_collection, logger=logger)
+    create_price_rollups_indexes(collection=price_rollups_collection, logger=logger)
+
+    processed_count = 0
+    skipped_count = 0
+    facts_batch = []
+    for route, outbound_date, fetched_at, json_data in iter_recorded_results(collection=collection,
+                                                                             snapshots_collection=snapshots_collection,
+                                                                             batch_size=args.batch_size):
+        if route is None:
+            skipped_count += 1
+            continue
+
+        if args.with_facts:
+            facts = record_price_facts(json_data=json_data,
+                                       collection=price_facts_collection,
+                                       max_retries=max_retries,
+                                       logger=logger,
+                                       route=route,
+                                       outbound_date=outbound_date,
+                                       fetched_at=fetched_at,
+                                       fetch_bucket_minutes=fetch_bucket_minutes)
+        else:
+            facts = normalize_results(json_data=json_data,
+                                      route=route,
+                                      outbound_date=outbound_date,
+                                      fetched_at=fetched_at,
+                                      fetch_bucket=get_fetch_bucket(fetched_at, fetch_bucket_minutes))
+        facts_batch.extend(facts)
+        processed_count += 1
+
+        if processed_count % args.batch_size == 0:
+            update_price_rollups(facts=facts_batch,
+                                 collection=price_rollups_collection,
+                                 max_retries=max_retries,
+                                 logger=logger)
+            facts_batch = []
+            logger.info(f"{stage_name} - Processed {processed_count} documents")
+
+    if facts_batch:
+        update_price_rollups(facts=facts_batch,
+                             collection=price_rollups_collection,
+                             max_retries=max_retries,
+                             logger=logger)
+
+    logger.info(f"{stage_name} - Backfilled rollups from {processed_count} documents, "
+                f"skipped {skipped_count} documents without route, date or fetch time.")
+
+
+if __name__ == "__main__":
+    main()
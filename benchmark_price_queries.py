@@ -0,0 +1,144 @@
+"""
+Benchmarks price queries over price facts collection filled with synthetic history (a year of dates for many routes).
+Requires running MongoDB, uses separate db (dropped before and after the run).
+Run: python benchmark_price_queries.py --instance mongodb://localhost:27017/ --routes 10 --days 365
+"""
+
+import argparse
+import datetime
+import logging
+import random
+import statistics
+import time
+import pymongo
+from mongodb_methods import (create_price_facts_indexes, find_cheapest_flights, find_flights_under_threshold_price,
+                             find_min_price_per_day)
+from price_facts import get_price_fact_id
+
+
+def generate_price_facts(routes: int, days: int, offers_per_day: int, fetches_per_day: int,
+                         start_date: datetime.date) -> iter:
+    """
+    Yields synthetic price facts (same offers are re-fetched several times with slightly changed prices)
+    """
+
+    fetched_at = datetime.datetime.now(datetime.timezone.utc)
+    for route_number in range(routes):
+        route = f"R{route_number}-sky:D{route_number}-sky"
+        for day in range(days):
+            outbound_date = (start_date + datetime.timedelta(days=day)).strftime("%Y-%m-%d")
+            for fetch_number in range(fetches_per_day):
+                fetch_time = fetched_at - datetime.timedelta(hours=fetch_number * 6)
+                for offer_number in range(offers_per_day):
+                    fact = {"Route": route,
+                            "OutboundDate": outbound_date,
+                            "FetchedAt": fetch_time,
+                            "FetchBucket": fetch_time.strftime("%Y-%m-%dT%H:00"),
+                            "Source": "live_api",
+                            "OutboundLegId": f"{route_number}-{day}-{offer_number}",
+                            "InboundLegId": None,
+                            "AgentId": offer_number % 7,
+                            "AgentName": f"Agent {offer_number % 7}",
+                            "Price": random.randint(8000, 60000),
+                            "DeeplinkUrl": f"https://example.com/book/{route_number}/{day}/{offer_number}",
+                            "Departure": f"{outbound_date}T{offer_number % 24:02d}:00:00",
+                            "Arrival": f"{outbound_date}T23:00:00",
+                            "Duration": 600 + offer_number,
+                            "Stops": offer_number % 3,
+                            "CarrierId": offer_number % 11,
+                            "CarrierName": f"Carrier {offer_number % 11}"}
+                    fact["_id"] = get_price_fact_id(fact)
+                    yield fact
+
+
+def time_query(query, repeats: int) -> tuple:
+    """
+    Runs query several times and returns median time (ms) and last result
+    """
+
+    timings = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = query()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def get_winning_plan_stages(explain: dict) -> list:
+    """
+    Returns stage names of the winning query plan (e.g. ['LIMIT', 'FETCH', 'IXSCAN'])
+    """
+
+    stages = []
+    plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)  # slot based execution engine wraps the plan
+    while plan:
+        stages.append(plan.get("stage"))
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instance", default="mongodb://localhost:27017/")
+    parser.add_argument("--db", default="skyskanner_benchmark")
+    parser.add_argument("--routes", type=int, default=10)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--offers-per-day", type=int, default=30)
+    parser.add_argument("--fetches-per-day", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger(__name__)
+
+    client = pymongo.MongoClient(args.instance)
+    client.drop_database(args.db)
+    collection = client[args.db]["price_facts"]
+
+    # seed synthetic history
+    start_date = datetime.date.today()
+    start = time.perf_counter()
+    batch = []
+    for fact in generate_price_facts(args.routes, args.days, args.offers_per_day, args.fetches_per_day, start_date):
+        batch.append(fact)
+        if len(batch) == 10000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    create_price_facts_indexes(collection=collection, logger=logger)
+    print(f"Seeded {collection.estimated_document_count()} price facts "
+          f"in {time.perf_counter() - start:.1f} sec")
+
+    route = f"R{args.routes // 2}-sky:D{args.routes // 2}-sky"
+    date_from = start_date.strftime("%Y-%m-%d")
+    date_to = (start_date + datetime.timedelta(days=args.days - 1)).strftime("%Y-%m-%d")
+    fetched_after = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=24)
+
+    query_params = dict(route=route, date_from=date_from, date_to=date_to, collection=collection, logger=logger)
+    queries = {
+        "cheapest 10 over date range":
+            lambda: find_cheapest_flights(limit=10, **query_params),
+        "under threshold over date range":
+            lambda: find_flights_under_threshold_price(threshold=9000, **query_params),
+        "under threshold, fetched last 24h":
+            lambda: find_flights_under_threshold_price(threshold=9000, fetched_after=fetched_after, **query_params),
+        "min price per day":
+            lambda: find_min_price_per_day(**query_params),
+    }
+    for name, query in queries.items():
+        median_ms, result = time_query(query, args.repeats)
+        print(f"{name:<40} {median_ms:>9.1f} ms  ({len(result)} results)")
+
+    # show that threshold query is index range scan
+    explain = collection.find({"Route": route, "OutboundDate": {"$gte": date_from, "$lte": date_to},
+                               "Price": {"$lt": 9000}}).sort([("OutboundDate", 1), ("Price", 1)]).explain()
+    print(f"Threshold query plan: {' <- '.join(get_winning_plan_stages(explain))}")
+
+    client.drop_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+End-to-end throughput benchmark: runs get_api_results_for_n_days against fake Skyscanner API
+(fake_skyscanner_server.py, started in separate process) and MongoDB (uses separate db, drops it afterwards).
+Without MongoDB server, run with --mongomock (in-memory stand-in, requires 'mongomock' package): its upserts scan
+the whole collection, so 'record' stage is much slower than with real MongoDB and only API stages are comparable.
+Reports dates/sec, requests per date, p50/p99 latency per stage and peak RSS.
+Save results of the run before the change and compare the run after it against them:
+Run: python benchmark_throughput.py --mode live_api --days 30 --concurrency 4 --output baseline.json
+     python benchmark_throughput.py --mode live_api --days 30 --concurrency 4 --baseline baseline.json
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import pymongo
+import requests
+import get_api_results_for_n_days as fetching
+from archive_writer import ArchiveWriter
+from fake_skyscanner_server import add_api_arguments, create_api, create_server
+from http_client import HttpClient
+from job_ledger import JobLedger
+from mongodb_methods import create_price_facts_indexes, create_price_rollups_indexes, create_snapshots_indexes
+from response_cache import ResponseCache
+from retry_policy import RetryPolicy, set_default_retry_policy
+
+try:
+    import mongomock
+except ImportError:  # only needed for --mongomock runs
+    mongomock = None
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak RSS isn't reported there
+    resource = None
+
+# stages of HTTP requests by url part (checked in this order)
+HTTP_STAGES = (("autosuggest", "autosuggest"), ("browsequotes", "browse_quotes"),
+               ("pricing/uk2", "poll_session"), ("pricing", "create_session"))
+
+
+class StageTimings:
+    """
+    Collects durations (ms) per stage from all threads
+    """
+
+    def __init__(self):
+        self.timings = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, duration_ms: float) -> None:
+        with self._lock:
+            self.timings[stage].append(duration_ms)
+
+    def time_function(self, module, function_name: str, stage: str) -> callable:
+        """
+        Replaces module function with timed one, returns the original (to restore it after the run)
+        """
+
+        function = getattr(module, function_name)
+
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage, (time.perf_counter() - start) * 1000)
+
+        setattr(module, function_name, timed_function)
+        return function
+
+
+class TimedHttpClient(HttpClient):
+    """
+    HTTP client recording duration of every request as stage of its endpoint
+    """
+
+    def __init__(self, stage_timings: StageTimings, **kwargs):
+        super().__init__(**kwargs)
+        self.stage_timings = stage_timings
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        try:
+            return super().request(method, url, **kwargs)
+        finally:
+            stage = next((stage for url_part, stage in HTTP_STAGES if url_part in url), "other_request")
+            self.stage_timings.add(stage, (time.perf_counter() - start) * 1000)
+
+
+def get_percentile(values: list, percent: float) -> float:
+    """
+    Returns nearest-rank percentile of values
+    """
+
+    sorted_values = sorted(values)
+    rank = max(round(percent / 100 * len(sorted_values) + 0.5) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def get_peak_rss_mb() -> float or None:
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def run_fake_server(args: argparse.Namespace, port_queue: multiprocessing.Queue) -> None:
+    server = create_server(create_api(args))
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def get_collections(args: argparse.Namespace, logger: logging.Logger) -> tuple:
+    """
+    Returns (client, results, price facts, price rollups and snapshots collections) of clean benchmark db
+    """
+
+    if not args.mongomock:
+        client = pymongo.MongoClient(args.instance)
+    elif mongomock is not None:
+        client = mongomock.MongoClient()
+    else:
+        raise ImportError("--mongomock requires 'mongomock' package (pip install mongomock)")
+    client.drop_database(args.db)
+    database = client[args.db]
+    price_facts_collection = database["price_facts"]
+    create_price_facts_indexes(collection=price_facts_collection,
+                               logger=logger)
+    price_rollups_collection = database["price_rollups"]
+    create_price_rollups_indexes(collection=price_rollups_collection,
+                                 logger=logger)
+    snapshots_collection = None
+    if args.store_changes_only:
+        snapshots_collection = database["snapshots"]
+        create_snapshots_indexes(collection=snapshots_collection,
+                                 logger=logger)
+    return client, database["itineraries"], price_facts_collection, price_rollups_collection, snapshots_collection
+
+
+def run_benchmark(args: argparse.Namespace, base_url: str, work_folder: str, logger: logging.Logger) -> dict:
+    """
+    Fetches args.days dates of 1 route and returns benchmark results
+    """
+
+    stage_timings = StageTimings()
+    set_default_retry_policy(RetryPolicy(base_delay=args.retry_base_delay,
+                                         max_delay=args.retry_max_delay))
+    response_cache = None
+    if args.response_cache:
+        response_cache = ResponseCache(file_path=os.path.join(work_folder, "http_cache.sqlite"),
+                                       endpoint_ttls={"browsequotes": 60 * 60, "autosuggest": 7 * 24 * 60 * 60},
+                                       logger=logger)
+    http_client = TimedHttpClient(stage_timings=stage_timings,
+                                  pool_maxsize=max(args.concurrency, 10),
+                                  response_cache=response_cache)
+    job_ledger = JobLedger(file_path=os.path.join(work_folder, "job_ledger.sqlite"),
+                           logger=logger)
+    archive_writer = ArchiveWriter(folder_path=os.path.join(work_folder, "json_files"),
+                                   logger=logger) if args.archive else None
+    client, collection, price_facts_collection, price_rollups_collection, snapshots_collection = \
+        get_collections(args, logger)
+
+    original_functions = [(name, stage_timings.time_function(fetching, name, stage))
+                          for name, stage in (("get_api_results_for_date", "date"),
+                                              ("get_browse_quotes_for_month", "month"),
+                                              ("record_results_for_date", "record"))]
+    outbound_date = (datetime.date.today() + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+    start = time.perf_counter()
+    try:
+        fetching.get_api_results_for_n_days(days=args.days,
+                                            job_ledger=job_ledger,
+                                            base_url=base_url,
+                                            headers={},
+                                            cabin_class="Economy",
+                                            country="PL",
+                                            currency="UAH",
+                                            locale_lang="en-US",
+                                            city_from=args.city_from,
+                                            city_to=args.city_to,
+                                            country_from=args.countries.split(",")[0],
+                                            country_to=args.countries.split(",")[-1],
+                                            outbound_date=outbound_date,
+                                            adults_count=1,
+                                            max_retries=args.max_retries,
+                                            collection=collection,
+                                            live_api_mode=args.mode == "live_api",
+                                            logger=logger,
+                                            archive_writer=archive_writer,
+                                            max_concurrent_dates=args.concurrency,
+                                            http_client=http_client,
+                                            poll_params={"poll_initial_interval": args.poll_interval,
+                                                         "poll_max_interval": args.poll_interval * 10,
+                                                         "poll_session_budget": 120},
+                                            price_facts_collection=price_facts_collection,
+                                            price_rollups_collection=price_rollups_collection,
+                                            snapshots_collection=snapshots_collection,
+                                            browse_quotes_by_month=args.by_month,
+                                            hybrid_mode=args.mode == "hybrid",
+                                            price_threshold=15000)
+        elapsed = time.perf_counter() - start
+        status_counts = job_ledger.get_status_counts(f"{args.city_from}-{args.city_to}")
+    finally:
+        for name, function in original_functions:
+            setattr(fetching, name, function)
+        http_client.close()
+        job_ledger.close()
+        if response_cache is not None:
+            response_cache.close()
+        client.drop_database(args.db)
+
+    request_counts = requests.get(f"{base_url}stats").json()
+    api_requests_count = sum(count for key, count in request_counts.items() if not key.startswith("stats"))
+    done_dates_count = status_counts.get("done", 0)
+    return {"params": {name: value for name, value in vars(args).items() if name not in ("output", "baseline")},
+            "elapsed_sec": round(elapsed, 3),
+            "done_dates": done_dates_count,
+            "failed_dates": sum(count for status, count in status_counts.items() if status != "done"),
+            "dates_per_sec": round(done_dates_count / elapsed, 3),
+            "requests_per_date": round(api_requests_count / max(done_dates_count, 1), 2),
+            "request_counts": request_counts,
+            "peak_rss_mb": get_peak_rss_mb(),
+            "stages": {stage: {"count": len(timings),
+                               "p50_ms": round(get_percentile(timings, 50), 2),
+                               "p99_ms": round(get_percentile(timings, 99), 2)}
+                       for stage, timings in sorted(stage_timings.timings.items())}}
+
+
+def format_change(value: float, baseline_value: float) -> str:
+    if value is None or not baseline_value:
+        return ""
+    return f"{(value - baseline_value) / baseline_value * 100:+.1f}%"
+
+
+def print_results(results: dict, baseline: dict = None) -> None:
+    baseline = baseline or {}
+    print(f"Done {results['done_dates']} dates ({results['failed_dates']} failed) in {results['elapsed_sec']} sec")
+    for metric in ("dates_per_sec", "requests_per_date", "peak_rss_mb"):
+        baseline_value = baseline.get(metric)
+        print(f"{metric:<20} {results[metric]!s:>12} {baseline_value if baseline_value is not None else '':>12} "
+              f"{format_change(results[metric], baseline_value):>9}")
+
+    print(f"{'stage':<20} {'count':>7} {'p50 ms':>10} {'p99 ms':>10} {'base p50':>10} {'base p99':>10}")
+    baseline_stages = baseline.get("stages", {})
+    for stage, stats in results["stages"].items():
+        baseline_stats = baseline_stages.get(stage, {})
+        print(f"{stage:<20} {stats['count']:>7} {stats['p50_ms']:>10} {stats['p99_ms']:>10} "
+              f"{baseline_stats.get('p50_ms', ''):>10} {baseline_stats.get('p99_ms', ''):>10} "
+              f"{format_change(stats['p50_ms'], baseline_stats.get('p50_ms')):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["browse_quotes", "live_api", "hybrid"], default="live_api")
+    parser.add_argument("--by-month", action="store_true", help="Browse Quotes for the whole month at once")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=4, help="max concurrent dates")
+    parser.add_argument("--city-from", default="Krakow")
+    parser.add_argument("--city-to", default="Tokyo")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--retry-base-delay", type=float, default=0.1)
+    parser.add_argument("--retry-max-delay", type=float, default=2)
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="initial Live API poll interval (sec)")
+    parser.add_argument("--store-changes-only", action="store_true", help="record snapshots changes")
+    parser.add_argument("--archive", action="store_true", help="archive results into daily files")
+    parser.add_argument("--response-cache", action="store_true")
+    parser.add_argument("--instance", default="mongodb://localhost:27017/")
+    parser.add_argument("--mongomock", action="store_true", help="use in-memory MongoDB stand-in instead of instance")
+    parser.add_argument("--db", default="skyskanner_throughput_benchmark")
+    parser.add_argument("--output", help="save results into JSON file")
+    parser.add_argument("--baseline", help="compare with results saved before")
+    add_api_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger(__name__)
+
+    port_queue = multiprocessing.Queue()
+    server_process = multiprocessing.Process(target=run_fake_server, args=(args, port_queue), daemon=True)
+    server_process.start()
+    try:
+        base_url = f"http://127.0.0.1:{port_queue.get(timeout=30)}/apiservices/"
+        with tempfile.TemporaryDirectory() as work_folder:
+            results = run_benchmark(args, base_url, work_folder, logger)
+    finally:
+        server_process.terminate()
+        server_process.join()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
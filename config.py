@@ -3,14 +3,57 @@ from config_private_keys import *
 
 # RAPID_API
 live_api_mode = False
+browse_quotes_by_month = False  # Browse Quotes mode: 1 request per month instead of 1 request per date
+hybrid_mode = False  # Browse Quotes for all dates, then Live API only for the dates selected by price
+hybrid_price_margin = 0.1  # Live API for dates with Browse Quotes min price <= price_threshold * (1 + margin)
+hybrid_top_n = 5  # Live API for N cheapest dates (by Browse Quotes min price) as well
+all_airports_mode = False  # fetch every origin x destination airport pair of the cities (e.g. Tokyo - NRT and HND)
+all_airports_max_pairs = 6  # pairs of the most relevant airports are kept if there are more
+all_airports_request_budget = 500  # max estimated requests of all pairs per run (see scheduler_requests_per_task)
 base_url = "https://skyscanner-skyscanner-flight-search-v1.p.rapidapi.com/apiservices/"
 headers = {'x-rapidapi-host': "skyscanner-skyscanner-flight-search-v1.p.rapidapi.com",
            'x-rapidapi-key': rapidapi_key}  # use private api key
 
+# HTTP_CLIENT
+http_connect_timeout = 5  # sec
+http_read_timeout = 30  # sec
+http_pool_maxsize = 10  # max open connections per host (should be >= max_concurrent_dates)
+response_cache_file = 'http_cache.sqlite'  # successful GET responses are cached into this file
+response_cache_ttls = {"browsequotes": 60 * 60, "autosuggest": 7 * 24 * 60 * 60}  # sec, per endpoint (url part)
+response_cache_max_size_mb = 100
+
+# RATE_LIMIT & RETRIES (size rate limit to RapidAPI plan quota)
+rate_limit_requests_per_minute = 60
+rate_limit_burst = 5  # requests that can be sent at once after idle period
+rate_limit_requests_per_day = None  # daily request budget (UTC day), None - no limit
+retry_base_delay = 2  # sec, doubled on every next try (with jitter) unless server sends Retry-After
+retry_max_delay = 60  # sec
+
+# LIVE_API_POLLING (session is polled more often while results keep coming, less often when they stop)
+poll_initial_interval = 1  # sec
+poll_max_interval = 10  # sec
+poll_session_budget = 120  # sec, max time spent on polling 1 session
+keep_delta_log = False  # store compact log of changes per poll along with merged session result
+project_live_api_results = False  # keep only fields needed for price facts (drops Segments, Places etc.)
+
 # MONGODB
 instance = 'mongodb://localhost:27017/'
 db = 'skyskanner'
 db_collection = 'itineraries'
+db_price_facts_collection = 'price_facts'  # flattened itinerary x agent prices for fast queries
+db_price_rollups_collection = 'price_rollups'  # route x outbound date x fetch day price stats
+mongodb_write_concern = {"w": 1, "j": False}
+fetch_bucket_minutes = 60  # results for the same date fetched within 1 bucket replace each other (no duplicates)
+store_changes_only = False  # record only changes of repeated results of the same date instead of full copies
+db_snapshots_collection = 'snapshots'  # changes of results (route x outbound date x fetch bucket)
+snapshot_checkpoint_every = 24  # full snapshot is recorded every N snapshots of the date, changes - in between
+db_jobs_collection = 'jobs'  # (route, date) jobs leased by workers (worker.py)
+db_fetch_times_collection = 'fetch_times'  # last fetch time of route x outbound date (scheduler.py)
+db_rate_limits_collection = 'rate_limits'  # request counters shared by workers on all machines (worker.py)
+job_lease_minutes = 10  # lease of crashed worker expires after this period (should be > job_lease_renew_minutes)
+job_max_attempts = 3
+job_lease_renew_minutes = 2  # running job's lease is extended this often (long Live API polling)
+job_idle_sleep = 30  # sec, worker started with --wait checks for new jobs this often
 
 # REQUEST_PARAMS
 city_from = "Krakow"
@@ -27,11 +70,37 @@ outbound_date = "2020-07-21"
 # ADDITIONAL_PARAMS
 days_to_request = 3
 price_threshold = 15000
+price_max_age_hours = 24  # only flights fetched within this period are checked against price threshold
 max_retries = 3
 json_files_folder = "json_files"
 log_files_folder = "logs"
-json_file = f"{datetime.datetime.now().strftime('%Y-%m-%d')}_for_{city_from}-{city_to}_xxx.json"
 log_file = f"Logs_{datetime.datetime.now()}.log".replace(":", "-")
-pickle_file = 'pickled_date.pickle'
-save_to_file = True
+log_level = "DEBUG"  # DEBUG, INFO, WARNING etc. (debug messages of disabled level are not even formatted)
+log_json_lines = False  # also write structured logs (1 JSON object per line) into '<log file>.jsonl'
+job_ledger_file = 'job_ledger.sqlite'  # status of every route x date task (next run resumes not done ones)
+job_running_timeout_minutes = 60  # running task not updated for this period can be claimed again
+airport_ids_cache_file = 'airport_ids_cache.json'
+airport_ids_cache_ttl_days = 30
+save_to_file = True  # archive results into daily '<day>_<route>.ndjson.gz' files in json_files_folder
+archive_compression = "gzip"  # gzip or zstd (requires 'zstandard' package)
 log_files_to_keep = 10
+
+# CONCURRENCY
+max_concurrent_dates = 1  # number of dates fetched at once (1 - dates are fetched one after another)
+
+# SCHEDULER (scheduler.py - many routes in one process sharing the same request budget)
+scheduler_routes = [{"city_from": city_from, "country_from": country_from,
+                     "city_to": city_to, "country_to": country_to,
+                     "days": days_to_request}]  # optional "date_from" (default - today)
+scheduler_refresh_hours = {7: 3, 30: 12, 90: 24}  # days until departure -> refresh interval (hours)
+scheduler_max_refresh_hours = 48  # refresh interval for dates further than all of the above
+scheduler_volatility_weight = 5  # refresh interval / (1 + weight * price volatility), volatile dates refresh more often
+scheduler_volatility_history_days = 7
+scheduler_requests_per_task = {"browse_quotes": 1, "live_api": 6}  # estimated requests per date, to fit daily budget
+scheduler_cycle_minutes = 15  # how often due dates are checked (unless run with --once)
+
+# METRICS (per-stage timings and counters of HTTP requests, retries, polls and MongoDB writes, see metrics.py)
+metrics_enabled = True  # False - instrumentation is switched off entirely (it's off as well if no export is set)
+metrics_port = None  # serve Prometheus text format on http://<host>:<port>/metrics (e.g. 9108)
+metrics_file = None  # rewrite JSON file with metrics (e.g. 'metrics.json') every metrics_file_interval sec
+metrics_file_interval = 60  # sec
@@ -0,0 +1,147 @@
+"""
+Runs fetch cycles of scheduler_routes as long-running process instead of starting the program from cron every time:
+MongoDB client, HTTP connection pool, response cache and airport ids are set up once and stay warm across cycles.
+Changes of 'scheduler_routes' and 'scheduler_cycle_minutes' in config.py are picked up by the next cycle without
+restart (other settings are read once at start). SIGTERM / SIGINT stop the daemon gracefully: dates in flight are
+finished and recorded, dates that haven't started yet are left for the next start (second signal exits right away).
+Run: python daemon.py
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import config
+from config import *
+from logger import create_logger, stop_logger
+from retry_policy import AbortRunError
+from runner import (connect_to_collections, create_airport_id_cache, create_archive_writer, create_http_client,
+                    create_metrics_exporters)
+from scheduler import run_scheduler_cycle
+
+
+class ConfigReloader:
+    """
+    Re-reads config.py once it's modified. If modified config can't be loaded (e.g. it's saved half-edited),
+    the previous one is kept.
+    """
+
+    stage_name = "CONFIG_RELOADER"
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self.file_path = config.__file__
+        self.modified_at = os.path.getmtime(self.file_path)
+
+    def reload_if_modified(self) -> bool:
+        """
+        Returns True if config was reloaded
+        """
+
+        try:
+            modified_at = os.path.getmtime(self.file_path)
+        except OSError:  # e.g. file is being replaced by editor
+            return False
+        if modified_at == self.modified_at:
+            return False
+        self.modified_at = modified_at
+
+        try:
+            importlib.reload(config)
+        except Exception as exc:
+            self.logger.error(f"{self.stage_name} - Couldn't reload config, keeping the previous one - '{exc}'")
+            return False
+        self.logger.info(f"{self.stage_name} - Reloaded config: {len(config.scheduler_routes)} routes, "
+                         f"cycle every {config.scheduler_cycle_minutes} min")
+        return True
+
+
+def handle_stop_signals(stop_event: threading.Event, logger: logging.Logger) -> None:
+    """
+    Sets stop event on SIGTERM / SIGINT. Second signal exits the process right away without waiting for dates
+    in flight (their results are not recorded, dates are fetched again after the next start).
+    """
+    stage_name = "DAEMON"
+
+    def stop(signal_number, frame) -> None:
+        if stop_event.is_set():
+            logger.critical(f"{stage_name} - Got {signal.Signals(signal_number).name} again, exiting right away")
+            stop_logger()
+            os._exit(1)  # sys.exit would wait for fetching threads to finish
+        logger.warning(f"{stage_name} - Got {signal.Signals(signal_number).name}, stopping after dates in flight")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+
+def run_daemon(logger: logging.Logger, stop_event: threading.Event, refresh_airport_ids: bool = False) -> None:
+    """
+    Runs scheduler cycles every scheduler_cycle_minutes until stop event is set
+    (cached airport ids are requested again on start if refresh_airport_ids is set)
+    """
+    stage_name = "DAEMON"
+
+    collection, price_facts_collection, price_rollups_collection, snapshots_collection = \
+        connect_to_collections(logger)
+    airport_id_cache = create_airport_id_cache(logger, refresh=refresh_airport_ids)
+    http_client, rate_limiter, response_cache = create_http_client(logger)
+    archive_writer = create_archive_writer(logger)
+    metrics_exporters = create_metrics_exporters(logger)
+    config_reloader = ConfigReloader(logger)
+    logger.info(f"{stage_name} - Started, {len(config.scheduler_routes)} routes, "
+                f"cycle every {config.scheduler_cycle_minutes} min")
+
+    try:
+        while not stop_event.is_set():
+            cycle_started_at = time.monotonic()
+            config_reloader.reload_if_modified()
+            try:
+                run_scheduler_cycle(routes=config.scheduler_routes,
+                                    collection=collection,
+                                    price_facts_collection=price_facts_collection,
+                                    price_rollups_collection=price_rollups_collection,
+                                    airport_id_cache=airport_id_cache,
+                                    http_client=http_client,
+                                    rate_limiter=rate_limiter,
+                                    logger=logger,
+                                    snapshots_collection=snapshots_collection,
+                                    archive_writer=archive_writer,
+                                    stop_event=stop_event)
+            except AbortRunError as exc:
+                if rate_limiter.get_remaining_daily_requests() != 0:
+                    sys.exit(f"Daemon is aborted - {exc}")  # e.g. invalid API key
+                logger.warning(f"{stage_name} - {exc}, the rest is postponed till the next day")
+            except Exception:  # e.g. MongoDB or network is unavailable for a while - the next cycle tries again
+                logger.exception(f"{stage_name} - Cycle failed, retrying on the next cycle")
+
+            # wakes up right away on stop
+            stop_event.wait(max(config.scheduler_cycle_minutes * 60 - (time.monotonic() - cycle_started_at), 0))
+    finally:
+        http_client.close()
+        response_cache.close()
+        for metrics_exporter in metrics_exporters:
+            metrics_exporter.close()
+        logger.info(f"{stage_name} - Stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--refresh-airport-ids", action="store_true", help="request cached airport ids again")
+    args = parser.parse_args()
+
+    logger = create_logger(log_file_folder_path=os.path.join(os.getcwd(), log_files_folder),
+                           log_file_name=log_file,
+                           level=log_level,
+                           json_lines=log_json_lines)
+    stop_event = threading.Event()
+    handle_stop_signals(stop_event, logger)
+    run_daemon(logger, stop_event, args.refresh_airport_ids)
+
+
+if __name__ == "__main__":
+    main()
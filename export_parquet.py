@@ -0,0 +1,171 @@
+"""
+Exports price facts into Parquet dataset partitioned by route and outbound month (Route=.../Month=.../*.parquet)
+with flat schema, so analytics (price_analytics.py) run over files without touching MongoDB.
+Facts are taken from price facts collection or rebuilt from archived results (json_files folder).
+Requires 'pyarrow' package.
+Run: python export_parquet.py [--source mongodb|archive] [--output parquet] [--route KRK-sky:TYOA-sky]
+"""
+
+import argparse
+import datetime
+import gzip
+import os
+import uuid
+from bson import json_util
+from config import *
+from logger import create_logger
+from mongodb_methods import get_fetch_bucket
+from price_facts import normalize_results
+from runner import connect_to_collections
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+except ImportError:  # export is optional, the rest of the program doesn't need pyarrow
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PRICE_FACT_FIELDS = ("Route", "OutboundDate", "FetchedAt", "Source", "OutboundLegId", "InboundLegId", "AgentId",
+                     "AgentName", "Price", "DeeplinkUrl", "Departure", "Arrival", "Duration", "Stops", "CarrierId",
+                     "CarrierName")
+
+
+def get_price_facts_schema() -> "pyarrow.Schema":
+    return pyarrow.schema([("Route", pyarrow.string()),
+                           ("OutboundDate", pyarrow.string()),
+                           ("Month", pyarrow.string()),
+                           ("FetchedAt", pyarrow.timestamp("us", tz="UTC")),
+                           ("Source", pyarrow.string()),
+                           ("OutboundLegId", pyarrow.string()),
+                           ("InboundLegId", pyarrow.string()),
+                           ("AgentId", pyarrow.int64()),
+                           ("AgentName", pyarrow.string()),
+                           ("Price", pyarrow.float64()),
+                           ("DeeplinkUrl", pyarrow.string()),
+                           ("Departure", pyarrow.string()),
+                           ("Arrival", pyarrow.string()),
+                           ("Duration", pyarrow.int64()),
+                           ("Stops", pyarrow.int64()),
+                           ("CarrierId", pyarrow.int64()),
+                           ("CarrierName", pyarrow.string())])
+
+
+def to_row(fact: dict) -> dict:
+    row = {field: fact.get(field) for field in PRICE_FACT_FIELDS}
+    row["Month"] = fact["OutboundDate"][:7]
+    if row["FetchedAt"] is not None and row["FetchedAt"].tzinfo is None:  # MongoDB returns naive UTC datetimes
+        row["FetchedAt"] = row["FetchedAt"].replace(tzinfo=datetime.timezone.utc)
+    return row
+
+
+def read_price_facts_from_mongodb(collection, route: str = None, date_from: str = None) -> iter:
+    """
+    Yields price facts from MongoDB (only exported fields are read)
+    """
+
+    query_filter = {}
+    if route is not None:
+        query_filter["Route"] = route
+    if date_from is not None:
+        query_filter["OutboundDate"] = {"$gte": date_from}
+    yield from collection.find(query_filter, {field: 1 for field in PRICE_FACT_FIELDS}, batch_size=10000)
+
+
+def read_price_facts_from_archive(folder_path: str, route: str = None, date_from: str = None) -> iter:
+    """
+    Yields price facts rebuilt from archived results (daily NDJSON files written by ArchiveWriter)
+    """
+
+    for file_name in sorted(os.listdir(folder_path)):
+        file_path = os.path.join(folder_path, file_name)
+        if file_name.endswith(".ndjson.gz"):
+            file = gzip.open(file_path, "rt")
+        elif file_name.endswith(".ndjson.zst") and zstandard is not None:
+            file = zstandard.open(file_path, "rt")
+        else:
+            continue
+        with file:
+            for line in file:
+                record = json_util.loads(line)
+                if (route is not None and record["Route"] != route) or \
+                        (date_from is not None and record["OutboundDate"] < date_from):
+                    continue
+                yield from normalize_results(json_data=[record],
+                                             route=record["Route"],
+                                             outbound_date=record["OutboundDate"],
+                                             fetched_at=record["FetchedAt"],
+                                             fetch_bucket=get_fetch_bucket(record["FetchedAt"], fetch_bucket_minutes))
+
+
+def export_price_facts(price_facts: iter, output_path: str, batch_size: int = 100000) -> int:
+    """
+    Writes price facts into Parquet dataset partitioned by Route and Month (batch by batch, memory stays flat).
+    Every export adds new files to partitions, so export new facts only (e.g. with date_from) to avoid repeats.
+    Returns number of exported facts.
+    """
+
+    if pyarrow is None:
+        raise ImportError("Parquet export requires 'pyarrow' package (pip install pyarrow)")
+
+    schema = get_price_facts_schema()
+    export_id = uuid.uuid4().hex[:8]
+    exported_count = 0
+    batch_number = 0
+    batch = []
+
+    def write_batch() -> None:
+        table = pyarrow.Table.from_pylist(batch, schema=schema)
+        pyarrow.dataset.write_dataset(table, output_path,
+                                      format="parquet",
+                                      partitioning=["Route", "Month"],
+                                      partitioning_flavor="hive",
+                                      basename_template=f"part-{export_id}-{batch_number}-{{i}}.parquet",
+                                      existing_data_behavior="overwrite_or_ignore")
+
+    for fact in price_facts:
+        batch.append(to_row(fact))
+        if len(batch) >= batch_size:
+            write_batch()
+            exported_count += len(batch)
+            batch_number += 1
+            batch = []
+    if batch:
+        write_batch()
+        exported_count += len(batch)
+    return exported_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=["mongodb", "archive"], default="mongodb")
+    parser.add_argument("--output", default="parquet", help="dataset folder")
+    parser.add_argument("--route", help="export only this route (e.g. KRK-sky:TYOA-sky)")
+    parser.add_argument("--date-from", help="export only outbound dates starting from this one (YYYY-MM-DD)")
+    parser.add_argument("--batch-size", type=int, default=100000)
+    args = parser.parse_args()
+
+    stage_name = "EXPORT_PARQUET"
+    logger = create_logger(log_file_folder_path=os.path.join(os.getcwd(), log_files_folder),
+                           log_file_name=log_file,
+                           level=log_level,
+                           json_lines=log_json_lines)
+
+    if args.source == "mongodb":
+        _, price_facts_collection, _, _ = connect_to_collections(logger)
+        price_facts = read_price_facts_from_mongodb(price_facts_collection, args.route, args.date_from)
+    else:
+        price_facts = read_price_facts_from_archive(os.path.join(os.getcwd(), json_files_folder),
+                                                    args.route, args.date_from)
+
+    exported_count = export_price_facts(price_facts=price_facts,
+                                        output_path=args.output,
+                                        batch_size=args.batch_size)
+    logger.info(f"{stage_name} - Exported {exported_count} price facts into '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Local stand-in for Skyscanner API endpoints used by the program (autosuggest, Browse Quotes, Live API session
+create and poll), so fetching can be run and benchmarked without API key (see benchmark_throughput.py).
+Payloads are synthetic (deterministic per route and date) or replayed from folder with recorded responses:
+autosuggest.json, browsequotes.json, live_api_poll_1.json ... live_api_poll_N.json (Live API session returns
+them one by one, 'UpdatesPending' until the last one). Latency, server errors (500) and rate limit
+responses (429 with Retry-After) are injected with configured rates. Request counts are returned by GET /stats.
+Run: python fake_skyscanner_server.py [--port 8765] [--latency-ms 50] [--error-rate 0.01] [--rate-limit-rate 0.01]
+Then set base_url = "http://127.0.0.1:8765/apiservices/" in config.py and run the program as usual.
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AGENT_NAMES = ("Skyscanner", "Trip.com", "Kiwi.com", "Mytrip", "Gotogate", "Booking.com", "eDreams")
+CARRIER_NAMES = ("LOT", "Lufthansa", "KLM", "Air France", "Finnair", "Turkish Airlines", "Emirates", "Qatar Airways")
+
+
+class FakeSkyscannerApi:
+    """
+    Builds responses of fake endpoints and keeps Live API sessions (number of polls done per session)
+    """
+
+    def __init__(self, countries: list, itineraries_count: int = 300, polls_count: int = 3,
+                 pricing_options_count: int = 3, latency_ms: float = 0, error_rate: float = 0,
+                 rate_limit_rate: float = 0, retry_after: float = 1, payloads_folder: str = None, seed: int = 0):
+        self.countries = countries
+        self.itineraries_count = itineraries_count
+        self.polls_count = polls_count
+        self.pricing_options_count = pricing_options_count
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.payloads = self.load_payloads(payloads_folder) if payloads_folder else {}
+        if "live_api_polls" in self.payloads:
+            self.polls_count = len(self.payloads["live_api_polls"])
+        self.sessions = {}  # {session key: {"Query": ..., "Polls": number of polls done}}
+        self.request_counts = collections.Counter()  # {"<endpoint> <status code>": count}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    @staticmethod
+    def load_payloads(folder_path: str) -> dict:
+        """
+        Returns recorded responses found in the folder (endpoints without them get synthetic payloads)
+        """
+
+        payloads = {}
+        for name in ("autosuggest", "browsequotes"):
+            file_path = os.path.join(folder_path, f"{name}.json")
+            if os.path.exists(file_path):
+                with open(file_path, "rb") as file:
+                    payloads[name] = file.read()
+        polls = []
+        while os.path.exists(file_path := os.path.join(folder_path, f"live_api_poll_{len(polls) + 1}.json")):
+            with open(file_path) as file:
+                polls.append(json.load(file))
+        if polls:
+            payloads["live_api_polls"] = polls
+        return payloads
+
+    def get_injected_error(self) -> tuple or None:
+        """
+        Waits for configured latency, returns (status code, headers) of injected error or None
+        """
+
+        with self._lock:
+            latency = self._random.uniform(0.5, 1.5) * self.latency_ms / 1000
+            draw = self._random.random()
+        time.sleep(latency)
+        if draw < self.rate_limit_rate:
+            return 429, {"Retry-After": str(self.retry_after)}
+        if draw < self.rate_limit_rate + self.error_rate:
+            return 500, {}
+        return None
+
+    def count_request(self, endpoint: str, status_code: int) -> None:
+        with self._lock:
+            self.request_counts[f"{endpoint} {status_code}"] += 1
+
+    def get_autosuggest(self, query: str) -> bytes:
+        if "autosuggest" in self.payloads:
+            return self.payloads["autosuggest"]
+        code = "".join(char for char in query.upper() if char.isalpha())[:4] or "XXXX"
+        places = [{"PlaceId": f"{code}-sky", "PlaceName": query, "CountryId": f"{country[:2].upper()}-sky",
+                   "RegionId": "", "CityId": f"{code}-sky", "CountryName": country}
+                  for country in self.countries]
+        return json.dumps({"Places": places}).encode()
+
+    def get_browse_quotes(self, origin: str, destination: str, outbound_date: str) -> bytes:
+        if "browsequotes" in self.payloads:
+            return self.payloads["browsequotes"]
+        rnd = random.Random(f"{self.seed}|{origin}|{destination}|{outbound_date}")
+        if len(outbound_date) == 10:
+            dates = [outbound_date]
+        else:  # month (anytime is served as the next month)
+            month = outbound_date if len(outbound_date) == 7 else \
+                (datetime.date.today().replace(day=1) + datetime.timedelta(days=31)).strftime("%Y-%m")
+            first_day = datetime.datetime.strptime(month, "%Y-%m").date()
+            dates = [(first_day + datetime.timedelta(days=day)).strftime("%Y-%m-%d") for day in range(31)
+                     if (first_day + datetime.timedelta(days=day)).month == first_day.month]
+
+        quotes = []
+        for date in dates:
+            for _ in range(rnd.randint(1, 3)):
+                quotes.append({"QuoteId": len(quotes) + 1,
+                               "MinPrice": rnd.randint(8000, 60000),
+                               "Direct": rnd.random() < 0.2,
+                               "OutboundLeg": {"CarrierIds": [rnd.randint(1, len(CARRIER_NAMES))],
+                                               "OriginId": 1,
+                                               "DestinationId": 2,
+                                               "DepartureDate": f"{date}T00:00:00"},
+                               "QuoteDateTime": datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")})
+        return json.dumps({"Quotes": quotes,
+                           "Places": [{"PlaceId": 1, "SkyscannerCode": origin.split("-")[0], "Type": "Station"},
+                                      {"PlaceId": 2, "SkyscannerCode": destination.split("-")[0], "Type": "Station"}],
+                           "Carriers": [{"CarrierId": number, "Name": name}
+                                        for number, name in enumerate(CARRIER_NAMES, start=1)],
+                           "Currencies": [{"Code": "UAH", "Symbol": "грн"}]}).encode()
+
+    def create_session(self, query: dict) -> str:
+        session_key = uuid.uuid4().hex
+        with self._lock:
+            self.sessions[session_key] = {"Query": query, "Polls": 0}
+        return session_key
+
+    def poll_session(self, session_key: str) -> bytes or None:
+        """
+        Returns next poll of the session (itineraries grow with every poll like in Live API) or None if it's unknown
+        """
+
+        with self._lock:
+            session = self.sessions.get(session_key)
+            if session is None:
+                return None
+            session["Polls"] = poll_number = min(session["Polls"] + 1, self.polls_count)
+        status = "UpdatesPending" if poll_number < self.polls_count else "UpdatesComplete"
+
+        if "live_api_polls" in self.payloads:
+            result = dict(self.payloads["live_api_polls"][poll_number - 1])
+            result.update({"SessionKey": session_key, "Status": status})
+            return json.dumps(result).encode()
+
+        query = session["Query"]
+        rnd = random.Random(f"{self.seed}|{query.get('originPlace')}|{query.get('destinationPlace')}|"
+                            f"{query.get('outboundDate')}")
+        itineraries_count = -(-self.itineraries_count * poll_number // self.polls_count)
+        outbound_date = query.get("outboundDate", "")
+        itineraries, legs, segments = [], [], []
+        for number in range(itineraries_count):
+            leg_id = f"{number}-{outbound_date}"
+            stops = rnd.randint(0, 2)
+            carrier_id = rnd.randint(1, len(CARRIER_NAMES))
+            departure_hour = rnd.randint(0, 23)
+            duration = rnd.randint(120, 1800)
+            segment_ids = list(range(len(segments), len(segments) + stops + 1))
+            segments += [{"Id": segment_id, "OriginStation": 1, "DestinationStation": 2, "Carrier": carrier_id,
+                          "FlightNumber": str(rnd.randint(100, 9999)), "Directionality": "Outbound"}
+                         for segment_id in segment_ids]
+            legs.append({"Id": leg_id,
+                         "SegmentIds": segment_ids,
+                         "OriginStation": 1,
+                         "DestinationStation": 2,
+                         "Departure": f"{outbound_date}T{departure_hour:02d}:00:00",
+                         "Arrival": f"{outbound_date}T23:59:00",
+                         "Duration": duration,
+                         "JourneyMode": "Flight",
+                         "Stops": list(range(stops)),
+                         "Carriers": [carrier_id],
+                         "OperatingCarriers": [carrier_id],
+                         "Directionality": "Outbound",
+                         "FlightNumbers": [{"FlightNumber": segment["FlightNumber"], "CarrierId": carrier_id}
+                                           for segment in segments[-len(segment_ids):]]})
+            # prices drift a little between polls, so repriced options are merged as well
+            base_price = rnd.randint(8000, 60000)
+            itineraries.append({"OutboundLegId": leg_id,
+                                "InboundLegId": None,
+                                "PricingOptions": [{"Agents": [agent_number],
+                                                    "QuoteAgeInMinutes": rnd.randint(0, 60),
+                                                    "Price": base_price + agent_number * 100 + poll_number * 10,
+                                                    "DeeplinkUrl": f"https://example.com/book/{leg_id}/{agent_number}"}
+                                                   for agent_number in range(1, self.pricing_options_count + 1)],
+                                "BookingDetailsLink": {"Uri": f"/apiservices/pricing/v1.0/{session_key}/booking",
+                                                       "Body": f"OutboundLegId={leg_id}", "Method": "PUT"}})
+        return json.dumps({"SessionKey": session_key,
+                           "Query": query,
+                           "Status": status,
+                           "Itineraries": itineraries,
+                           "Legs": legs,
+                           "Segments": segments,
+                           "Carriers": [{"Id": number, "Code": name[:2].upper(), "Name": name}
+                                        for number, name in enumerate(CARRIER_NAMES, start=1)],
+                           "Agents": [{"Id": number, "Name": name, "Type": "TravelAgent"}
+                                      for number, name in enumerate(AGENT_NAMES, start=1)],
+                           "Places": [{"Id": 1, "Code": query.get("originPlace", "").split("-")[0],
+                                       "Type": "Airport"},
+                                      {"Id": 2, "Code": query.get("destinationPlace", "").split("-")[0],
+                                       "Type": "Airport"}],
+                           "Currencies": [{"Code": "UAH", "Symbol": "грн"}]}).encode()
+
+
+def create_request_handler(api: FakeSkyscannerApi) -> type:
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def log_message(self, format, *args) -> None:  # requests are counted instead of logged
+            pass
+
+        def send_body(self, endpoint: str, status_code: int, body: bytes = b"", headers: dict = None) -> None:
+            api.count_request(endpoint, status_code)
+            self.send_response(status_code)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def handle_api_request(self, method: str) -> None:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))  # connection is reused after
+            url = urllib.parse.urlsplit(self.path)
+            path = url.path.split("/apiservices/", 1)[-1].strip("/").split("/")
+            if method == "GET" and path == ["stats"]:
+                self.send_body("stats", 200, json.dumps(dict(api.request_counts)).encode())
+                return
+
+            if method == "GET" and path[0] == "autosuggest":
+                endpoint = "autosuggest"
+            elif method == "GET" and path[0] == "browsequotes" and len(path) == 8:
+                endpoint = "browsequotes"
+            elif method == "POST" and path == ["pricing", "v1.0"]:
+                endpoint = "create_session"
+            elif method == "GET" and path[:3] == ["pricing", "uk2", "v1.0"] and len(path) == 4:
+                endpoint = "poll_session"
+            else:
+                self.send_body("unknown", 404, b'{"message": "Not found"}')
+                return
+
+            injected_error = api.get_injected_error()
+            if injected_error is not None:
+                status_code, headers = injected_error
+                self.send_body(endpoint, status_code, b'{"message": "Injected error"}', headers)
+                return
+
+            if endpoint == "autosuggest":
+                query = urllib.parse.parse_qs(url.query).get("query", [""])[0]
+                self.send_body(endpoint, 200, api.get_autosuggest(query))
+            elif endpoint == "browsequotes":
+                self.send_body(endpoint, 200, api.get_browse_quotes(path[5], path[6], path[7]))
+            elif endpoint == "create_session":
+                query = {name: values[0] for name, values in urllib.parse.parse_qs(body.decode()).items()}
+                session_key = api.create_session(query)
+                location = f"http://{self.headers.get('Host')}/apiservices/pricing/uk2/v1.0/{session_key}"
+                self.send_body(endpoint, 201, b"{}", {"Location": location})
+            else:
+                result = api.poll_session(path[3])
+                if result is None:
+                    self.send_body(endpoint, 410, b'{"message": "Session expired"}')
+                else:
+                    self.send_body(endpoint, 200, result)
+
+        def do_GET(self) -> None:
+            self.handle_api_request("GET")
+
+        def do_POST(self) -> None:
+            self.handle_api_request("POST")
+
+    return RequestHandler
+
+
+def create_server(api: FakeSkyscannerApi, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Returns server of fake API (port 0 - any free port, see server.server_address)
+    """
+
+    server = ThreadingHTTPServer((host, port), create_request_handler(api))
+    server.daemon_threads = True
+    return server
+
+
+def add_api_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--countries", default="Poland,Japan",
+                        help="countries of places returned by autosuggest (comma separated)")
+    parser.add_argument("--itineraries", type=int, default=300, help="itineraries in the last Live API poll")
+    parser.add_argument("--polls", type=int, default=3, help="Live API polls per session ('UpdatesPending' before)")
+    parser.add_argument("--pricing-options", type=int, default=3, help="pricing options (agents) per itinerary")
+    parser.add_argument("--latency-ms", type=float, default=50, help="mean response latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="share of 429 responses")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After of 429 responses (sec)")
+    parser.add_argument("--payloads-folder", help="folder with recorded responses to replay")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def create_api(args: argparse.Namespace) -> FakeSkyscannerApi:
+    return FakeSkyscannerApi(countries=args.countries.split(","),
+                             itineraries_count=args.itineraries,
+                             polls_count=args.polls,
+                             pricing_options_count=args.pricing_options,
+                             latency_ms=args.latency_ms,
+                             error_rate=args.error_rate,
+                             rate_limit_rate=args.rate_limit_rate,
+                             retry_after=args.retry_after,
+                             payloads_folder=args.payloads_folder,
+                             seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_api_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_server(create_api(args), args.host, args.port)
+    print(f"Fake Skyscanner API is running on http://{args.host}:{server.server_address[1]}/apiservices/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,44 @@
-import json
 import logging
-import sys
-import requests
+from airport_id_cache import AirportIdCache
+from http_client import HttpClient, get_http_client
+from json_parser import parse_response
+from retry_policy import AbortRunError
 from service_methods import retry
 
 
-def get_airport_id(base_url: str, headers: dict, currency: str, locale_lang: str,
-                   search_city: str, search_country: str, max_retries: int,
-                   logger: logging.Logger, element_from_matched_list: int = 0) -> str:
+def get_airport_ids(base_url: str, headers: dict, currency: str, locale_lang: str,
+                    search_city: str, search_country: str, max_retries: int,
+                    logger: logging.Logger, min_count: int = 1,
+                    airport_id_cache: AirportIdCache = None, http_client: HttpClient = None) -> list:
     """
-    Gets 1st airport id by default for search city-country combination (1 city-country pair can have several airports).
+    Gets all airport ids for search city-country combination (1 city-country pair can have several airports),
+    the most relevant first. Request is retried if less than min_count airports are found.
+    If cache is passed, airport ids are taken from it and API is requested only if they are missing or expired.
     """
 
     stage_name = "GET_PLACE_ID"
     try_number_resp = 0
     try_number_n = 0
 
-    # get airport_id for search city-country pair
+    # use cached airport ids if available
+    if airport_id_cache is not None:
+        cached_airport_ids = airport_id_cache.get(search_city, search_country, locale_lang)
+        if cached_airport_ids and len(cached_airport_ids) >= min_count:
+            logger.debug("%s - %s-%s airport ids - %s (from cache)",
+                         stage_name, search_city, search_country, cached_airport_ids)
+            return cached_airport_ids
+
+    # get airport ids for search city-country pair
+    http_client = http_client or get_http_client()
     url = f"{base_url}autosuggest/v1.0/{currency}/{currency}/{locale_lang}/"
     querystring = {"query": {search_city}}
 
-    # rerun if response unsuccessful or can't extract n-th element
+    # rerun if response unsuccessful or there are less than min_count airports
     while True:
         try:
-            response = requests.request("GET", url, headers=headers, params=querystring)
-            result = json.loads(response.text)
+            response = http_client.request("GET", url, headers=headers, params=querystring)
+            response.raise_for_status()
+            result = parse_response(response)
         except Exception as exc:
             try_number_resp += 1
             retry(stage_name, try_number_resp, max_retries, exc, logger=logger)
@@ -36,17 +50,45 @@ def get_airport_id(base_url: str, headers: dict, currency: str, locale_lang: str
                     location_airport_ids.append(location_data['PlaceId'])
 
             if not location_airport_ids:
-                logger.critical(f"{stage_name} - Place_ids list is empty! Exiting the program.")
-                sys.exit()
+                logger.critical(f"{stage_name} - Place_ids list is empty! Aborting the run.")
+                raise AbortRunError(f"{stage_name} - No airports found for {search_city}-{search_country}")
 
-            # return n-th elem
-            try:
-                airport_id = location_airport_ids[element_from_matched_list]
-            except Exception as exc:
+            if len(location_airport_ids) < min_count:
                 try_number_n += 1
-                retry(stage_name, try_number_n, max_retries, exc, logger=logger)
+                retry(stage_name, try_number_n, max_retries,
+                      IndexError(f"Found {len(location_airport_ids)} airports, expected at least {min_count}"),
+                      logger=logger)
             else:
-                logger.debug(f"{stage_name} - Available codes for {search_city}-{search_country}: {location_airport_ids}."
-                             f" Going to use 1st element from the list.")
-                logger.info(f"{stage_name} - {search_city}-{search_country} airport id - '{airport_id}'")
-                return airport_id
+                logger.debug("%s - Available codes for %s-%s: %s.",
+                             stage_name, search_city, search_country, location_airport_ids)
+                if airport_id_cache is not None:
+                    airport_id_cache.set(search_city, search_country, locale_lang, location_airport_ids)
+                return location_airport_ids
+
+
+def get_airport_id(base_url: str, headers: dict, currency: str, locale_lang: str,
+                   search_city: str, search_country: str, max_retries: int,
+                   logger: logging.Logger, element_from_matched_list: int = 0,
+                   airport_id_cache: AirportIdCache = None, http_client: HttpClient = None) -> str:
+    """
+    Gets 1st airport id by default for search city-country combination (1 city-country pair can have several airports).
+    If cache is passed, airport ids are taken from it and API is requested only if they are missing or expired.
+    """
+
+    stage_name = "GET_PLACE_ID"
+
+    location_airport_ids = get_airport_ids(base_url=base_url,
+                                           headers=headers,
+                                           currency=currency,
+                                           locale_lang=locale_lang,
+                                           search_city=search_city,
+                                           search_country=search_country,
+                                           max_retries=max_retries,
+                                           logger=logger,
+                                           min_count=element_from_matched_list + 1,
+                                           airport_id_cache=airport_id_cache,
+                                           http_client=http_client)
+    airport_id = location_airport_ids[element_from_matched_list]
+    logger.info(f"{stage_name} - {search_city}-{search_country} airport id - '{airport_id}' "
+                f"(element #{element_from_matched_list} of {len(location_airport_ids)})")
+    return airport_id
@@ -1,74 +1,171 @@
+import concurrent.futures
 import datetime
 import logging
-import os
+import threading
 import pymongo
-from get_airport_id import get_airport_id
-from get_browse_quotes import get_browse_quotes
+from airport_id_cache import AirportIdCache
+from airport_matrix import CityPairMinPrices, ItineraryDeduplicator, build_airport_pairs
+from archive_writer import ArchiveWriter
+from get_airport_id import get_airport_id, get_airport_ids
+from get_browse_quotes import get_browse_quotes, split_browse_quotes_by_date
 from get_live_api_results import get_live_api_results
-from mongodb_methods import record_json_to_mongodb
-from service_methods import pickle_data, record_results_into_file, get_outbound_date
+from http_client import HttpClient
+from job_ledger import JobLedger
+from metrics import get_metrics, metrics_labels
+from mongodb_methods import (build_route, record_json_to_mongodb, record_price_facts, record_snapshot_changes,
+                             update_price_rollups)
+from price_facts import get_min_price
+from retry_policy import AbortRunError
+from service_methods import get_outbound_date
 
 
-def get_api_results_for_n_days(days: int, pickle_file: str, base_url: str, headers: dict, cabin_class: str,
-                               country: str, currency: str, locale_lang: str, city_from: str, city_to: str,
-                               country_from: str, country_to: str, outbound_date: str, adults_count: int,
-                               max_retries: int, json_files_folder: str, json_file: str,
-                               collection: pymongo.collection.Collection, live_api_mode: bool,
-                               logger: logging.Logger, save_to_file: bool = False)-> None:
+def get_next_dates(outbound_date: str, days: int) -> list:
     """
-    Gets airport origin and destination IDs, gets Live API results (all flights, up to date)
-    or Browse Quotes (one cheapest flight from the cache) for N days,
-    pickles last used date (to continue where left off in case of interruption),
-    records data to MongoDB and into file (depends on the flag).
+    Returns list of N consecutive dates starting from outbound date (including it).
     """
 
-    # log the mode program is running in
-    logger.info(f"PROGRAM IS RUNNING IN MODE ->> "
-                f"{'LIVE API (getting most recent data)' if live_api_mode else 'BROWSE QUOTES (getting cached data)'}")
-
-    for n in range(days):
-        # define outbound date (use from config or pickle file)
-        outbound_date = get_outbound_date(outbound_date_config=outbound_date,
-                                          pickle_file=pickle_file,
-                                          city_from=city_from,
-                                          city_to=city_to,
-                                          logger=logger)
-        logger.info(f"Running API request for -> {outbound_date}")
-
-        # get airport IDs origin & destination
-        airport_id_orig = get_airport_id(base_url=base_url,
-                                         headers=headers,
-                                         currency=currency,
-                                         locale_lang=locale_lang,
-                                         search_city=city_from,
-                                         search_country=country_from,
-                                         max_retries=max_retries,
-                                         logger=logger)
-
-        airport_id_dest = get_airport_id(base_url=base_url,
-                                         headers=headers,
-                                         currency=currency,
-                                         locale_lang=locale_lang,
-                                         search_city=city_to,
-                                         search_country=country_to,
-                                         max_retries=max_retries,
-                                         logger=logger)
+    outbound_date_datetime = datetime.datetime.strptime(outbound_date, "%Y-%m-%d").date()
+    return [(outbound_date_datetime + datetime.timedelta(days=n)).strftime("%Y-%m-%d") for n in range(days)]
+
+
+def record_results_for_date(all_results: list, outbound_date: str, route: str,
+                            collection: pymongo.collection.Collection, max_retries: int, logger: logging.Logger,
+                            archive_writer: ArchiveWriter = None, fetch_bucket_minutes: int = 60,
+                            price_facts_collection: pymongo.collection.Collection = None,
+                            price_rollups_collection: pymongo.collection.Collection = None,
+                            snapshots_collection: pymongo.collection.Collection = None,
+                            snapshot_checkpoint_every: int = 24,
+                            itinerary_deduplicator: ItineraryDeduplicator = None) -> str:
+    """
+    Records results for one outbound date to MongoDB (and flattened price facts if collection is passed)
+    and into daily archive file (if archive writer is passed).
+    Daily price rollups are updated with recorded price facts if both collections are passed.
+    If snapshots collection is passed, only changes against the previous results of the date are recorded into it
+    (instead of full copy into results collection).
+    If itinerary deduplicator is passed, itineraries recorded by other airport pairs of the city pair are dropped.
+    Returns recorded outbound date.
+    """
+
+    if itinerary_deduplicator is not None:
+        all_results = itinerary_deduplicator.filter_results(all_results=all_results,
+                                                            outbound_date=outbound_date,
+                                                            route=route)
+
+    # record results into db
+    fetched_at = datetime.datetime.now(datetime.timezone.utc)
+    if snapshots_collection is not None:
+        record_snapshot_changes(json_data=all_results,
+                                collection=snapshots_collection,
+                                max_retries=max_retries,
+                                logger=logger,
+                                route=route,
+                                outbound_date=outbound_date,
+                                fetched_at=fetched_at,
+                                fetch_bucket_minutes=fetch_bucket_minutes,
+                                checkpoint_every=snapshot_checkpoint_every)
+    else:
+        record_json_to_mongodb(json_data=all_results,
+                               collection=collection,
+                               max_retries=max_retries,
+                               logger=logger,
+                               route=route,
+                               outbound_date=outbound_date,
+                               fetched_at=fetched_at,
+                               fetch_bucket_minutes=fetch_bucket_minutes)
+    if price_facts_collection is not None:
+        facts = record_price_facts(json_data=all_results,
+                                   collection=price_facts_collection,
+                                   max_retries=max_retries,
+                                   logger=logger,
+                                   route=route,
+                                   outbound_date=outbound_date,
+                                   fetched_at=fetched_at,
+                                   fetch_bucket_minutes=fetch_bucket_minutes)
+        if price_rollups_collection is not None:
+            with get_metrics().time("mongodb_write_duration_seconds", collection=price_rollups_collection.name):
+                update_price_rollups(facts=facts,
+                                     collection=price_rollups_collection,
+                                     max_retries=max_retries,
+                                     logger=logger)
+
+    # record results into archive file (1 line per result)
+    if archive_writer is not None:
+        with get_metrics().time("stage_duration_seconds", stage="ARCHIVE_WRITER"):
+            archive_writer.write(name=route.replace(":", "_"),
+                                 records=[{"Route": route, "OutboundDate": outbound_date, "FetchedAt": fetched_at,
+                                           **result} for result in all_results])
+
+    return outbound_date
+
+
+def get_api_results_for_date(base_url: str, headers: dict, cabin_class: str, country: str, currency: str,
+                             locale_lang: str, airport_id_orig: str, airport_id_dest: str, outbound_date: str,
+                             adults_count: int, max_retries: int, live_api_mode: bool, logger: logging.Logger,
+                             record_params: dict, http_client: HttpClient = None, poll_params: dict = None) -> dict:
+    """
+    Gets Live API results or Browse Quotes for one outbound date and records them (see record_results_for_date).
+    Returns {processed outbound date: min price}.
+    """
+
+    logger.info(f"Running API request for -> {outbound_date}")
+    route = build_route(airport_id_orig, airport_id_dest)
 
+    with metrics_labels(route=route, mode="live_api" if live_api_mode else "browse_quotes"):
         # get LIVE API results OR Browse Quotes
-        if live_api_mode:
-            all_results = get_live_api_results(base_url=base_url,
-                                               headers=headers,
-                                               cabin_class=cabin_class,
-                                               country=country,
-                                               currency=currency,
-                                               locale_lang=locale_lang,
-                                               airport_id_orig=airport_id_orig,
-                                               airport_id_dest=airport_id_dest,
-                                               outbound_date=outbound_date,
-                                               adults_count=adults_count,
-                                               max_retries=max_retries,
-                                               logger=logger)
-        else:
+        with get_metrics().time("stage_duration_seconds", stage="LIVE_API" if live_api_mode else "CACHED_QUOTE"):
+            if live_api_mode:
+                all_results = get_live_api_results(base_url=base_url,
+                                                   headers=headers,
+                                                   cabin_class=cabin_class,
+                                                   country=country,
+                                                   currency=currency,
+                                                   locale_lang=locale_lang,
+                                                   airport_id_orig=airport_id_orig,
+                                                   airport_id_dest=airport_id_dest,
+                                                   outbound_date=outbound_date,
+                                                   adults_count=adults_count,
+                                                   max_retries=max_retries,
+                                                   logger=logger,
+                                                   http_client=http_client,
+                                                   poll_params=poll_params)
+            else:
+                all_results = get_browse_quotes(base_url=base_url,
+                                                headers=headers,
+                                                country=country,
+                                                currency=currency,
+                                                locale_lang=locale_lang,
+                                                airport_id_orig=airport_id_orig,
+                                                airport_id_dest=airport_id_dest,
+                                                outbound_date=outbound_date,
+                                                max_retries=max_retries,
+                                                logger=logger,
+                                                http_client=http_client)
+
+        with get_metrics().time("stage_duration_seconds", stage="RECORD"):
+            record_results_for_date(all_results=all_results,
+                                    outbound_date=outbound_date,
+                                    route=route,
+                                    max_retries=max_retries,
+                                    logger=logger,
+                                    **record_params)
+    return {outbound_date: get_min_price(all_results)}
+
+
+def get_browse_quotes_for_month(base_url: str, headers: dict, country: str, currency: str, locale_lang: str,
+                                airport_id_orig: str, airport_id_dest: str, outbound_dates: list, max_retries: int,
+                                logger: logging.Logger, record_params: dict, http_client: HttpClient = None) -> dict:
+    """
+    Gets Browse Quotes for the whole month in one request, splits them by date
+    and records results for each outbound date of the month (see record_results_for_date).
+    Returns {processed outbound date: min price}.
+    """
+
+    month = outbound_dates[0][:7]
+    logger.info(f"Running API request for -> {month} ({len(outbound_dates)} dates)")
+    route = build_route(airport_id_orig, airport_id_dest)
+
+    with metrics_labels(route=route, mode="browse_quotes_by_month"):
+        with get_metrics().time("stage_duration_seconds", stage="CACHED_QUOTE"):
             all_results = get_browse_quotes(base_url=base_url,
                                             headers=headers,
                                             country=country,
@@ -76,31 +173,334 @@ def get_api_results_for_n_days(days: int, pickle_file: str, base_url: str, heade
                                             locale_lang=locale_lang,
                                             airport_id_orig=airport_id_orig,
                                             airport_id_dest=airport_id_dest,
-                                            outbound_date=outbound_date,
+                                            outbound_date=month,
                                             max_retries=max_retries,
-                                            logger=logger)
+                                            logger=logger,
+                                            http_client=http_client)
 
-        # record results into db
-        record_json_to_mongodb(json_data=all_results,
-                               collection=collection,
-                               max_retries=max_retries,
-                               logger=logger)
-
-        # record results into file
-        if save_to_file:
-            file_folder_path = os.path.join(os.getcwd(), json_files_folder)
-            file_name = json_file.replace('xxx', outbound_date)
-            record_results_into_file(file_folder_path=file_folder_path,
-                                     file_name=file_name,
-                                     results=all_results,
+        results_by_date = split_browse_quotes_by_date(all_results, outbound_dates)
+        min_prices = {}
+        for outbound_date in outbound_dates:
+            with get_metrics().time("stage_duration_seconds", stage="RECORD"):
+                record_results_for_date(all_results=results_by_date[outbound_date],
+                                        outbound_date=outbound_date,
+                                        route=route,
+                                        max_retries=max_retries,
+                                        logger=logger,
+                                        **record_params)
+            min_prices[outbound_date] = get_min_price(results_by_date[outbound_date])
+    return min_prices
+
+
+def group_dates_by_month(outbound_dates: list) -> list:
+    """
+    Returns lists of outbound dates grouped by month (2020-07-30, 2020-07-31, 2020-08-01 -> [[07-30, 07-31], [08-01]])
+    """
+
+    dates_by_month = {}
+    for outbound_date in outbound_dates:
+        dates_by_month.setdefault(outbound_date[:7], []).append(outbound_date)
+    return list(dates_by_month.values())
+
+
+def select_dates_for_live_api(min_prices: dict, price_threshold: float or None, price_margin: float,
+                              top_n: int) -> list:
+    """
+    Returns sorted dates worth Live API session: Browse Quotes min price is within price_margin of price_threshold
+    (e.g. margin 0.1 -> up to 110% of threshold) or among top_n cheapest dates. Dates without quotes are skipped.
+    """
+
+    priced_dates = sorted((price, date) for date, price in min_prices.items() if price is not None)
+    selected_dates = {date for _, date in priced_dates[:top_n]}
+    if price_threshold is not None:
+        selected_dates.update(date for price, date in priced_dates if price <= price_threshold * (1 + price_margin))
+    return sorted(selected_dates)
+
+
+def get_dates_in_budget(request_budget: int, browse_quotes_requests: int, live_api_requests: int,
+                        live_api_mode: bool, hybrid_mode: bool, hybrid_top_n: int) -> int:
+    """
+    Returns number of dates that fit into request budget (requests per date are estimated for all airport pairs).
+    Hybrid mode sweeps every date with Browse Quotes and reserves Live API requests for up to hybrid_top_n dates.
+    """
+
+    if not hybrid_mode:
+        return request_budget // (live_api_requests if live_api_mode else browse_quotes_requests)
+    requests_per_top_date = browse_quotes_requests + live_api_requests
+    if request_budget < hybrid_top_n * requests_per_top_date:
+        return request_budget // requests_per_top_date
+    return hybrid_top_n + (request_budget - hybrid_top_n * requests_per_top_date) // browse_quotes_requests
+
+
+def run_for_airport_pair(route: str, function, params: dict) -> tuple:
+    """
+    Runs task of 1 airport pair, returns (route, {completed date: min price})
+    """
+
+    return route, function(**params)
+
+
+def run_tasks(tasks: list, max_concurrent_tasks: int, on_completed, logger: logging.Logger,
+              stop_event: threading.Event = None) -> list:
+    """
+    Runs tasks - (task dates, function, params) - one after another or concurrently (if max_concurrent_tasks > 1).
+    Function returns {completed date: min price}, it's passed to on_completed.
+    Failed task is skipped (other tasks go on), AbortRunError stops all tasks.
+    Once stop event is set, tasks that haven't started yet are not run (running ones are finished).
+    Returns failed dates.
+    """
+
+    def is_stopped() -> bool:
+        return stop_event is not None and stop_event.is_set()
+
+    def run_task(function, params: dict) -> dict:
+        if is_stopped():
+            raise concurrent.futures.CancelledError()
+        return function(**params)
+
+    failed_dates = []
+    if max_concurrent_tasks <= 1:
+        for task_dates, function, params in tasks:
+            if is_stopped():
+                break
+            try:
+                on_completed(function(**params))
+            except AbortRunError:
+                raise
+            except Exception as exc:  # only this task fails, other tasks go on
+                failed_dates.extend(task_dates)
+                logger.error(f"Couldn't get results for {task_dates}, skipping. Occurred error '{exc}'")
+        return failed_dates
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent_tasks)
+    futures = {executor.submit(run_task, function, params): task_dates for task_dates, function, params in tasks}
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            task_dates = futures[future]
+            try:
+                on_completed(future.result())
+            except concurrent.futures.CancelledError:  # not started because of stop
+                continue
+            except AbortRunError:
+                raise
+            except Exception as exc:  # only this task fails, other tasks go on
+                failed_dates.extend(task_dates)
+                logger.error(f"Couldn't get results for {task_dates}, skipping. Occurred error '{exc}'")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return failed_dates
+
+
+def get_api_results_for_n_days(days: int, job_ledger: JobLedger, base_url: str, headers: dict, cabin_class: str,
+                               country: str, currency: str, locale_lang: str, city_from: str, city_to: str,
+                               country_from: str, country_to: str, outbound_date: str, adults_count: int,
+                               max_retries: int, collection: pymongo.collection.Collection, live_api_mode: bool,
+                               logger: logging.Logger, archive_writer: ArchiveWriter = None,
+                               max_concurrent_dates: int = 1, airport_id_cache: AirportIdCache = None,
+                               http_client: HttpClient = None, poll_params: dict = None,
+                               fetch_bucket_minutes: int = 60,
+                               price_facts_collection: pymongo.collection.Collection = None,
+                               price_rollups_collection: pymongo.collection.Collection = None,
+                               snapshots_collection: pymongo.collection.Collection = None,
+                               snapshot_checkpoint_every: int = 24,
+                               browse_quotes_by_month: bool = False, hybrid_mode: bool = False,
+                               price_threshold: float = None, hybrid_price_margin: float = 0.1,
+                               hybrid_top_n: int = 5, all_airports: bool = False, max_airport_pairs: int = None,
+                               request_budget: int = None, requests_per_task: dict = None)-> str or list:
+    """
+    Gets airport origin and destination IDs, gets Live API results (all flights, up to date)
+    or Browse Quotes (one cheapest flight from the cache) for N days,
+    tracks every date in job ledger (next run resumes not done dates only, dates run by other process are skipped),
+    records data to MongoDB (and flattened price facts / daily price rollups if collections are passed)
+    and into daily archive file (if archive writer is passed).
+    If max_concurrent_dates > 1, dates are fetched concurrently (each date is recorded and marked done on its own,
+    so slow or failed date doesn't hold back the others).
+    If browse_quotes_by_month is set, Browse Quotes are requested once per month and split into per-date results.
+    If hybrid_mode is set, whole date range is swept with Browse Quotes first, then Live API results are fetched
+    only for the dates selected by Browse Quotes min price (see select_dates_for_live_api).
+    If all_airports is set, every origin x destination airport pair (up to max_airport_pairs) is fetched by the same
+    tasks pool, itineraries returned by several pairs are recorded once, date is done once all pairs are done
+    and its min price is the cheapest one across the pairs. Claimed dates that don't fit into request_budget
+    (estimated with requests_per_task - {"browse_quotes": N, "live_api": N} per pair and date) are left
+    for the next run, in hybrid mode Live API dates are cut to the budget left after Browse Quotes.
+    Failed dates are skipped (and retried on the next run), AbortRunError stops the whole run.
+    poll_params - adaptive polling params for Live API session (see live_prices_pull_results).
+    Results fetched for the same date within fetch_bucket_minutes replace each other in MongoDB (no duplicates).
+    If snapshots_collection is passed, only changes of results are recorded (see record_snapshot_changes).
+    Returns route the results are recorded for (origin and destination airport IDs),
+    list of routes of all airport pairs if all_airports is set.
+    """
+
+    if all_airports and request_budget is not None and requests_per_task is None:
+        raise ValueError("requests_per_task should be passed to fit dates into request_budget")
+
+    # log the mode program is running in
+    if hybrid_mode:
+        mode = "HYBRID (Browse Quotes for all dates, Live API for the cheapest ones)"
+    elif live_api_mode:
+        mode = "LIVE API (getting most recent data)"
+    else:
+        mode = "BROWSE QUOTES (getting cached data)"
+    logger.info(f"PROGRAM IS RUNNING IN MODE ->> {mode}"
+                f"{f' WITH UP TO {max_concurrent_dates} CONCURRENT DATES' if max_concurrent_dates > 1 else ''}")
+
+    # define outbound dates (start from config date or 1st date that is not done yet)
+    job_route = f"{city_from}-{city_to}"
+    outbound_date = get_outbound_date(outbound_date_config=outbound_date,
+                                      job_ledger=job_ledger,
+                                      city_from=city_from,
+                                      city_to=city_to,
+                                      logger=logger)
+    outbound_dates = get_next_dates(outbound_date, days)
+
+    # get airport IDs origin & destination (same for all dates, taken from cache if passed)
+    airport_id_params = dict(base_url=base_url,
+                             headers=headers,
+                             currency=currency,
+                             locale_lang=locale_lang,
+                             max_retries=max_retries,
+                             logger=logger,
+                             airport_id_cache=airport_id_cache,
+                             http_client=http_client)
+    if all_airports:
+        airport_pairs = build_airport_pairs(airport_ids_orig=get_airport_ids(search_city=city_from,
+                                                                             search_country=country_from,
+                                                                             **airport_id_params),
+                                            airport_ids_dest=get_airport_ids(search_city=city_to,
+                                                                             search_country=country_to,
+                                                                             **airport_id_params),
+                                            max_pairs=max_airport_pairs)
+    else:
+        airport_pairs = [(get_airport_id(search_city=city_from, search_country=country_from, **airport_id_params),
+                          get_airport_id(search_city=city_to, search_country=country_to, **airport_id_params))]
+    routes = [build_route(airport_id_orig, airport_id_dest) for airport_id_orig, airport_id_dest in airport_pairs]
+    route = routes if all_airports else routes[0]
+
+    if all_airports:
+        logger.info(f"ALL_AIRPORTS - Fetching {len(routes)} airport pairs of {city_from}-{city_to}: {routes}")
+
+    # claim dates in job ledger (dates done before or run by other process are skipped)
+    outbound_dates = job_ledger.claim(job_route, outbound_dates)
+
+    # claimed dates that don't fit into request budget are released for the next run
+    use_request_budget = all_airports and request_budget is not None
+    if use_request_budget:
+        browse_quotes_requests = len(airport_pairs) * requests_per_task["browse_quotes"]  # per date of all pairs
+        live_api_requests = len(airport_pairs) * requests_per_task["live_api"]
+        dates_in_budget = get_dates_in_budget(request_budget=request_budget,
+                                              browse_quotes_requests=browse_quotes_requests,
+                                              live_api_requests=live_api_requests,
+                                              live_api_mode=live_api_mode,
+                                              hybrid_mode=hybrid_mode,
+                                              hybrid_top_n=hybrid_top_n)
+        if dates_in_budget < len(outbound_dates):
+            logger.warning(f"ALL_AIRPORTS - Request budget is enough for {dates_in_budget} of "
+                           f"{len(outbound_dates)} dates, the rest is left for the next run")
+            job_ledger.release(job_route, outbound_dates[dates_in_budget:])
+            outbound_dates = outbound_dates[:dates_in_budget]
+    if not outbound_dates:
+        return route
+
+    record_params = dict(collection=collection,
+                         archive_writer=archive_writer,
+                         fetch_bucket_minutes=fetch_bucket_minutes,
+                         price_facts_collection=price_facts_collection,
+                         price_rollups_collection=price_rollups_collection,
+                         snapshots_collection=snapshots_collection,
+                         snapshot_checkpoint_every=snapshot_checkpoint_every)
+    if len(airport_pairs) > 1:
+        record_params["itinerary_deduplicator"] = ItineraryDeduplicator(logger)
+    request_params = dict(base_url=base_url,
+                          headers=headers,
+                          country=country,
+                          currency=currency,
+                          locale_lang=locale_lang,
+                          max_retries=max_retries,
+                          logger=logger,
+                          record_params=record_params,
+                          http_client=http_client)
+
+    def build_tasks(task_dates: list, task_live_api_mode: bool) -> list:
+        # 1 task per airport pair and date OR per airport pair and month
+        # (Browse Quotes for the whole month are received in 1 request)
+        tasks = []
+        for (airport_id_orig, airport_id_dest), pair_route in zip(airport_pairs, routes):
+            pair_params = dict(airport_id_orig=airport_id_orig, airport_id_dest=airport_id_dest, **request_params)
+            if browse_quotes_by_month and not task_live_api_mode:
+                pair_tasks = [(month_dates, get_browse_quotes_for_month, dict(outbound_dates=month_dates,
+                                                                              **pair_params))
+                              for month_dates in group_dates_by_month(task_dates)]
+            else:
+                pair_tasks = [([date], get_api_results_for_date, dict(outbound_date=date,
+                                                                      cabin_class=cabin_class,
+                                                                      adults_count=adults_count,
+                                                                      live_api_mode=task_live_api_mode,
+                                                                      poll_params=poll_params,
+                                                                      **pair_params))
+                              for date in task_dates]
+            tasks += [(dates, run_for_airport_pair, dict(route=pair_route, function=function, params=params))
+                      for dates, function, params in pair_tasks]
+        return tasks
+
+    def mark_done(min_prices: dict) -> None:
+        job_ledger.mark_done(job_route, min_prices)
+
+    def on_pair_completed(city_pair_min_prices: CityPairMinPrices, on_completed):
+        # date is completed once all airport pairs have completed it
+        return lambda result: on_completed(city_pair_min_prices.add(*result))
+
+    city_pair_min_prices = CityPairMinPrices(pairs_count=len(airport_pairs))
+    try:
+        if hybrid_mode:
+            # stage 1: Browse Quotes min prices for all dates (dates are marked done after Live API stage)
+            min_prices = {}
+            failed_dates = run_tasks(tasks=build_tasks(outbound_dates, task_live_api_mode=False),
+                                     max_concurrent_tasks=max_concurrent_dates,
+                                     on_completed=on_pair_completed(city_pair_min_prices, min_prices.update),
                                      logger=logger)
-        # find next date
-        outbound_date_datetime = datetime.datetime.strptime(outbound_date, "%Y-%m-%d").date()
-        next_outbound_date_datetime = outbound_date_datetime + datetime.timedelta(days=1)
-        outbound_date = next_outbound_date_datetime.strftime("%Y-%m-%d")
 
-        # pickle next date (process can resume from this point on the next run)
-        pickle_data(file_name=pickle_file,
-                    data_to_pickle={f"{city_from}-{city_to}": outbound_date},
-                    logger=logger)
+            # stage 2: Live API results only for the dates worth it, the rest are completed by Browse Quotes
+            live_api_dates = select_dates_for_live_api(min_prices=min_prices,
+                                                       price_threshold=price_threshold,
+                                                       price_margin=hybrid_price_margin,
+                                                       top_n=hybrid_top_n)
+            if use_request_budget:
+                live_api_dates_in_budget = max(request_budget - len(outbound_dates) * browse_quotes_requests, 0) \
+                    // live_api_requests
+                if live_api_dates_in_budget < len(live_api_dates):
+                    logger.warning(f"HYBRID - Request budget is enough for Live API results of "
+                                   f"{live_api_dates_in_budget} of {len(live_api_dates)} selected dates, "
+                                   f"the rest are completed by Browse Quotes")
+                    live_api_dates = sorted(sorted(live_api_dates, key=min_prices.get)[:live_api_dates_in_budget])
+            logger.info(f"HYBRID - Live API results will be fetched for {len(live_api_dates)} "
+                        f"of {len(outbound_dates)} dates: {live_api_dates}")
+            mark_done([date for date in min_prices if date not in live_api_dates])
+            live_api_min_prices = CityPairMinPrices(pairs_count=len(airport_pairs))
+            failed_dates += run_tasks(tasks=build_tasks(live_api_dates, task_live_api_mode=True),
+                                      max_concurrent_tasks=max_concurrent_dates,
+                                      on_completed=on_pair_completed(live_api_min_prices, mark_done),
+                                      logger=logger)
+            city_pair_min_prices.min_prices.update(live_api_min_prices.min_prices)
+        else:
+            failed_dates = run_tasks(tasks=build_tasks(outbound_dates, task_live_api_mode=live_api_mode),
+                                     max_concurrent_tasks=max_concurrent_dates,
+                                     on_completed=on_pair_completed(city_pair_min_prices, mark_done),
+                                     logger=logger)
+        failed_dates = sorted(set(failed_dates))  # date fails if any of its airport pairs fails
+        job_ledger.mark_failed(job_route, failed_dates)
+    finally:
+        # dates that are not fetched because of aborted run can be claimed right away by the next run
+        job_ledger.release(job_route, outbound_dates)
+
+    # cheapest price of every date across all airport pairs
+    if all_airports:
+        for outbound_date, (min_price, min_price_route) in sorted(city_pair_min_prices.min_prices.items()):
+            if min_price is None:
+                logger.info(f"ALL_AIRPORTS - {outbound_date} - no prices found")
+            else:
+                logger.info(f"ALL_AIRPORTS - {outbound_date} - min price {min_price} {currency} ({min_price_route})")
+
+    if failed_dates:
+        logger.warning(f"Failed dates: {sorted(failed_dates)}. They will be retried on the next run.")
 
+    return route
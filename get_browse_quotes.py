@@ -1,14 +1,17 @@
 import logging
 import requests
-import json
+from http_client import HttpClient, get_http_client
+from json_parser import parse_response
 from service_methods import retry
 
 
 def get_browse_quotes(base_url: str, headers: dict, country: str, currency: str,
                       locale_lang: str, airport_id_orig: str, airport_id_dest: str,
-                      outbound_date: str, max_retries: int, logger: logging.Logger)-> list:
+                      outbound_date: str, max_retries: int, logger: logging.Logger,
+                      http_client: HttpClient = None)-> list:
     """
-    Runs Browse Quotes API call, which retrieves the cheapest quotes from Skyskanner cache prices
+    Runs Browse Quotes API call, which retrieves the cheapest quotes from Skyskanner cache prices.
+    Outbound date can be a date (2020-07-21), a month (2020-07) or 'anytime'.
     """
 
     stage_name = "CACHED_QUOTE"
@@ -16,11 +19,17 @@ def get_browse_quotes(base_url: str, headers: dict, country: str, currency: str,
 
     url = f"{base_url}browsequotes/v1.0/{country}/{currency}/{locale_lang}/{airport_id_orig}/{airport_id_dest}/{outbound_date}"
     all_results = []
+    http_client = http_client or get_http_client()
 
     # rerun if response unsuccessful
     while True:
-        response = requests.request("GET", url, headers=headers)
-        result = json.loads(response.text)
+        try:
+            response = http_client.request("GET", url, headers=headers)
+            result = parse_response(response)
+        except (requests.exceptions.RequestException, ValueError) as exc:
+            try_number += 1
+            retry(stage_name, try_number, max_retries, exc, logger=logger)
+            continue
 
         if response.status_code == 200 and len(result) != 0:
             logger.info(f'{stage_name} - Received result.')
@@ -28,5 +37,31 @@ def get_browse_quotes(base_url: str, headers: dict, country: str, currency: str,
             return all_results
         else:
             try_number += 1
-            retry(stage_name, try_number, max_retries, f"{response.status_code} - {response.content}", logger=logger)
+            retry(stage_name, try_number, max_retries, f"{response.status_code} - {response.content}", logger=logger,
+                  response=response)
+
+
+def split_browse_quotes_by_date(all_results: list, outbound_dates: list) -> dict:
+    """
+    Splits Browse Quotes results for a period (month or 'anytime') into per-date results
+    (each with quotes departing on that date and only places and carriers they refer to).
+    Returns {outbound date: results}.
+    """
 
+    results_by_date = {}
+    for outbound_date in outbound_dates:
+        date_results = []
+        for result in all_results:
+            quotes = [quote for quote in result.get("Quotes", [])
+                      if quote.get("OutboundLeg", {}).get("DepartureDate", "")[:10] == outbound_date]
+            place_ids = {quote["OutboundLeg"].get(place_field) for quote in quotes
+                         for place_field in ("OriginId", "DestinationId")}
+            carrier_ids = {carrier_id for quote in quotes for carrier_id in quote["OutboundLeg"].get("CarrierIds", [])}
+            date_results.append({**result,
+                                 "Quotes": quotes,
+                                 "Places": [place for place in result.get("Places", [])
+                                            if place.get("PlaceId") in place_ids],
+                                 "Carriers": [carrier for carrier in result.get("Carriers", [])
+                                              if carrier.get("CarrierId") in carrier_ids]})
+        results_by_date[outbound_date] = date_results
+    return results_by_date
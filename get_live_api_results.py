@@ -3,15 +3,21 @@ Contains methods for Live API import.
 Live API retrieval consists of 2 parts: creating session and getting results.
 """
 
-import json
 import logging
+import time
 import requests
+from http_client import HttpClient, get_http_client
+from json_parser import parse_response
+from live_api_results_merger import LiveApiResultsMerger
+from metrics import get_metrics
+from retry_policy import SkipTaskError
 from service_methods import timer, retry
 
 
 def live_prices_create_session(base_url: str, headers: dict, cabin_class: str, country: str, currency: str,
                                locale_lang: str, origin_place: str, destination_place: str, outbound_date: str,
-                               adults_count: int, max_retries: int, logger: logging.Logger)-> str:
+                               adults_count: int, max_retries: int, logger: logging.Logger,
+                               http_client: HttpClient = None)-> str:
     """
      Creates Live Pricing Service Session (it should be created before requesting price data).\n
      See detailed documentation -> https://skyscanner.github.io/slate/#flights-live-prices
@@ -24,15 +30,16 @@ def live_prices_create_session(base_url: str, headers: dict, cabin_class: str, c
     payload = f"cabinClass={cabin_class}&country={country}&currency={currency}" \
               f"&locale={locale_lang}&originPlace={origin_place}&destinationPlace={destination_place}" \
               f"&outboundDate={outbound_date}&adults={adults_count}"
-    headers.setdefault('content-type', "application/x-www-form-urlencoded")
+    headers = {**headers, 'content-type': "application/x-www-form-urlencoded"}
+    http_client = http_client or get_http_client()
 
     # rerun if response unsuccessful
     while True:
         try:
-            response = requests.request("POST", url, data=payload, headers=headers)
-            logger.debug(f"{stage_name} - Full requested url: {url}/{payload}")
+            response = http_client.request("POST", url, data=payload, headers=headers)
+            logger.debug("%s - Full requested url: %s/%s", stage_name, url, payload)
             response.raise_for_status()
-        except requests.exceptions.HTTPError as err:
+        except requests.exceptions.RequestException as err:
             try_number += 1
             retry(stage_name, try_number, max_retries, err, logger=logger)
         else:
@@ -41,67 +48,138 @@ def live_prices_create_session(base_url: str, headers: dict, cabin_class: str, c
             return session_key
 
 
+def get_next_poll_interval(poll_interval: float, previous_count: int, current_count: int,
+                           min_interval: float, max_interval: float) -> float:
+    """
+    Returns delay before the next poll depending on how many itineraries arrived since the previous poll:
+    keeps polling quickly while results keep coming, backs off when the count barely changes.
+    """
+
+    growth = (current_count - previous_count) / max(previous_count, 1)
+    if growth >= 0.5:
+        next_interval = poll_interval / 2
+    elif growth >= 0.1:
+        next_interval = poll_interval * 1.5
+    else:
+        next_interval = poll_interval * 2
+    return min(max(next_interval, min_interval), max_interval)
+
+
 def live_prices_pull_results(base_url: str, headers: dict, session_key: str,
-                             max_retries: int, logger: logging.Logger) -> list:
+                             max_retries: int, logger: logging.Logger, http_client: HttpClient = None,
+                             poll_initial_interval: float = 1, poll_max_interval: float = 10,
+                             poll_session_budget: float = 120, keep_delta_log: bool = False,
+                             result_fields: dict = None) -> list:
     """
     Returns Live API results from the created session.
+    While session is 'UpdatesPending', polls it adaptively: starts with short interval and backs off
+    when itineraries count stops growing. Stops polling when session budget (sec) is spent
+    (wall-clock time from the start of the session, retry delays included).
+    All polls are merged into one consolidated result (optionally with compact log of changes per poll).
+    If result_fields are passed, every poll is projected to them before merging (see json_parser.py).
     """
 
     stage_name = "PULL_RESULTS"
     try_number = 0
+    session_start = time.monotonic()
+    poll_interval = poll_initial_interval
+    itineraries_count = 0
 
     url = f"{base_url}pricing/uk2/v1.0/{session_key}?pageIndex=0&pageSize=20"
     querystring = {"pageIndex": "0", "pageSize": "100"}
-    all_results = []
+    merger = LiveApiResultsMerger(keep_delta_log=keep_delta_log)
+    http_client = http_client or get_http_client()
+
+    def is_budget_spent_on_errors() -> bool:
+        # failed polls are retried only while session budget lasts, results merged so far are returned then
+        if time.monotonic() - session_start <= poll_session_budget:
+            return False
+        if not merger.polls_count:
+            raise SkipTaskError(f"{stage_name} - Session budget {poll_session_budget} sec is spent without results")
+        logger.warning(f"{stage_name} - Session budget {poll_session_budget} sec is spent on failed requests. "
+                       f"Merged {merger.polls_count} result requests with status 'UpdatesPending'.")
+        return True
 
     # rerun if response unsuccessful
     while True:
-        response = requests.request("GET", url, headers=headers, params=querystring)
-        result = json.loads(response.text)
+        try:
+            response = http_client.request("GET", url, headers=headers, params=querystring)
+            result = parse_response(response, result_fields)
+        except (requests.exceptions.RequestException, ValueError) as exc:
+            if is_budget_spent_on_errors():
+                break
+            try_number += 1
+            retry(stage_name, try_number, max_retries, exc, logger=logger,
+                  max_delay=poll_session_budget - (time.monotonic() - session_start))
+            continue
 
         if response.status_code == 200:
-            all_results.append(result)
+            get_metrics().increment("live_api_polls_total", status=result["Status"])
+            delta = merger.merge(result)
+            logger.debug("%s - Merged poll #%s: %s new itineraries, %s new and %s repriced pricing options.",
+                         stage_name, delta["Poll"], delta["NewItineraries"], delta["NewPricingOptions"],
+                         delta["RepricedOptions"])
             if result["Status"] == "UpdatesPending":  # get next scope results
-                logger.info(f"{stage_name} - Got response 'UpdatesPending'. Requesting more results after delay.")
-                timer(wait_time=10, logger=logger)  # wait for all results to be updated
+                previous_count, itineraries_count = itineraries_count, merger.itineraries_count
+                poll_interval = get_next_poll_interval(poll_interval=poll_interval,
+                                                       previous_count=previous_count,
+                                                       current_count=itineraries_count,
+                                                       min_interval=poll_initial_interval,
+                                                       max_interval=poll_max_interval)
+                if time.monotonic() - session_start + poll_interval > poll_session_budget:
+                    logger.warning(f"{stage_name} - Session budget {poll_session_budget} sec is spent. "
+                                   f"Merged {merger.polls_count} result requests with status 'UpdatesPending'.")
+                    break
+                logger.info(f"{stage_name} - Got response 'UpdatesPending' with {itineraries_count} itineraries. "
+                            f"Requesting more results after {poll_interval:.1f} sec delay.")
+                timer(wait_time=poll_interval, logger=logger)  # wait for more results to be updated
                 continue
             logger.info(f'{stage_name} - Got response status - {result["Status"]}. '
-                        f'Recorded {len(all_results)} result requests.')
+                        f'Merged {merger.polls_count} result requests into {merger.itineraries_count} itineraries.')
             break
         else:
+            if is_budget_spent_on_errors():
+                break
             try_number += 1
-            retry(stage_name, try_number, max_retries, f"{response.status_code} - {response.content}", logger=logger)
+            retry(stage_name, try_number, max_retries, f"{response.status_code} - {response.content}", logger=logger,
+                  response=response, max_delay=poll_session_budget - (time.monotonic() - session_start))
 
-    return all_results
+    return [merger.get_result()]
 
 
 def get_live_api_results(base_url: str, headers: dict, cabin_class: str, country: str, currency: str,
                          locale_lang: str, airport_id_orig: str, airport_id_dest: str, outbound_date: str,
-                         adults_count: int, max_retries: int, logger: logging.Logger)-> iter:
+                         adults_count: int, max_retries: int, logger: logging.Logger,
+                         http_client: HttpClient = None, poll_params: dict = None)-> iter:
     """
     Performs 2 steps to get Live API results: creates Live API session and retrieves API results
     """
 
     # create session
-    session_key = live_prices_create_session(base_url=base_url,
-                                             headers=headers,
-                                             cabin_class=cabin_class,
-                                             country=country,
-                                             currency=currency,
-                                             locale_lang=locale_lang,
-                                             origin_place=airport_id_orig,
-                                             destination_place=airport_id_dest,
-                                             outbound_date=outbound_date,
-                                             adults_count=adults_count,
-                                             max_retries=max_retries,
-                                             logger=logger)
+    with get_metrics().time("stage_duration_seconds", stage="CREATE_SESSION"):
+        session_key = live_prices_create_session(base_url=base_url,
+                                                 headers=headers,
+                                                 cabin_class=cabin_class,
+                                                 country=country,
+                                                 currency=currency,
+                                                 locale_lang=locale_lang,
+                                                 origin_place=airport_id_orig,
+                                                 destination_place=airport_id_dest,
+                                                 outbound_date=outbound_date,
+                                                 adults_count=adults_count,
+                                                 max_retries=max_retries,
+                                                 logger=logger,
+                                                 http_client=http_client)
 
     # retrieve results
-    all_results = live_prices_pull_results(base_url=base_url,
-                                           headers=headers,
-                                           session_key=session_key,
-                                           max_retries=max_retries,
-                                           logger=logger)
+    with get_metrics().time("stage_duration_seconds", stage="PULL_RESULTS"):
+        all_results = live_prices_pull_results(base_url=base_url,
+                                               headers=headers,
+                                               session_key=session_key,
+                                               max_retries=max_retries,
+                                               logger=logger,
+                                               http_client=http_client,
+                                               **(poll_params or {}))
 
     return all_results
 
@@ -0,0 +1,109 @@
+"""
+Provides HTTP client shared by all API modules (keeps connections alive and reuses them between requests).
+"""
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import get_metrics
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+
+# endpoint names by url part (checked in this order), used as metrics label
+ENDPOINT_NAMES = (("autosuggest", "autosuggest"), ("browsequotes", "browsequotes"),
+                  ("pricing/uk2", "live_api_poll"), ("pricing", "live_api_session"))
+
+
+def get_endpoint_name(url: str) -> str:
+    """
+    Returns endpoint name of the url for metrics labels ("other" if url doesn't match any of ENDPOINT_NAMES)
+    """
+
+    return next((name for url_part, name in ENDPOINT_NAMES if url_part in url), "other")
+
+
+class HttpClient:
+    """
+    Wraps requests.Session with pooled keep-alive connections and default connect/read timeouts.
+    Pool is bounded per host: if all connections are busy, request waits for a free one.
+    If rate limiter is passed, every request waits for its token first.
+    If response cache is passed, successful responses of cached endpoints are taken from it
+    and identical concurrent requests are coalesced (only the 1st one goes to API, the others wait for its response).
+    """
+
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 30,
+                 pool_connections: int = 10, pool_maxsize: int = 10, rate_limiter: RateLimiter = None,
+                 response_cache: ResponseCache = None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.response_cache = response_cache
+        self._in_flight = {}  # {cache key: event set when the request is completed}
+        self._in_flight_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        endpoint = get_endpoint_name(url)
+        try:
+            with get_metrics().time("http_request_duration_seconds", endpoint=endpoint):
+                response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            get_metrics().increment("http_requests_total", endpoint=endpoint, status="error")
+            raise
+        get_metrics().increment("http_requests_total", endpoint=endpoint, status=str(response.status_code))
+        return response
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        ttl = self.response_cache.get_ttl(method, url) if self.response_cache is not None else None
+        if ttl is None:
+            return self._send(method, url, **kwargs)
+
+        key = self.response_cache.build_key(method, url, kwargs.get("params"), kwargs.get("headers"))
+        while True:
+            response = self.response_cache.get(key, ttl)
+            if response is not None:
+                get_metrics().increment("http_cache_hits_total", endpoint=get_endpoint_name(url))
+                return response
+
+            with self._in_flight_lock:
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    in_flight = self._in_flight[key] = threading.Event()
+                    break
+            # identical request is already sent, its response is taken from cache once it's completed
+            # (if it's failed and not cached, the next waiting request is sent instead)
+            in_flight.wait()
+
+        try:
+            response = self._send(method, url, **kwargs)
+            if response.status_code == 200 and response.content:
+                self.response_cache.set(key, response)
+            return response
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+            in_flight.set()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_http_client = None
+_default_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """
+    Returns default shared HTTP client (created on the first call)
+    """
+
+    global _default_http_client
+    with _default_http_client_lock:
+        if _default_http_client is None:
+            _default_http_client = HttpClient()
+    return _default_http_client
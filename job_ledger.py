@@ -0,0 +1,130 @@
+"""
+Tracks every (route, outbound date) task in local sqlite file (WAL mode), so interrupted or failed runs resume
+exactly the unfinished dates and several processes can share the same route without fetching the same date twice.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobLedger:
+    """
+    Route x outbound date -> status (pending/running/done/failed), attempts count and timestamps.
+    Claimed tasks become running, running tasks not updated for running_timeout_minutes (e.g. process was killed)
+    can be claimed again.
+    """
+
+    stage_name = "JOB_LEDGER"
+
+    def __init__(self, file_path: str, logger: logging.Logger, running_timeout_minutes: float = 60):
+        self.file_path = file_path
+        self.logger = logger
+        self.running_timeout = running_timeout_minutes * 60
+        self._lock = threading.Lock()
+        # autocommit mode, transactions are opened explicitly (BEGIN IMMEDIATE locks db for other processes)
+        self._connection = sqlite3.connect(file_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                                 "route TEXT, outbound_date TEXT, status TEXT, attempts INTEGER DEFAULT 0, "
+                                 "error TEXT, created_at REAL, updated_at REAL, "
+                                 "PRIMARY KEY (route, outbound_date))")
+
+    def _execute_in_transaction(self, function) -> iter:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = function(self._connection)
+                self._connection.execute("COMMIT")
+                return result
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def get_done_dates(self, route: str, date_from: str) -> set:
+        """
+        Returns done dates of the route starting from date_from
+        """
+
+        with self._lock:
+            rows = self._connection.execute("SELECT outbound_date FROM jobs "
+                                            "WHERE route = ? AND outbound_date >= ? AND status = ?",
+                                            (route, date_from, DONE)).fetchall()
+        return {row[0] for row in rows}
+
+    def claim(self, route: str, outbound_dates: list) -> list:
+        """
+        Adds missing tasks as pending and marks as running the ones that are not done or being run by other process.
+        Returns claimed dates.
+        """
+
+        def claim_dates(connection: sqlite3.Connection) -> list:
+            now = time.time()
+            connection.executemany("INSERT OR IGNORE INTO jobs (route, outbound_date, status, created_at, updated_at) "
+                                   "VALUES (?, ?, ?, ?, ?)",
+                                   [(route, outbound_date, PENDING, now, now) for outbound_date in outbound_dates])
+            placeholders = ", ".join("?" * len(outbound_dates))
+            claimed_dates = [row[0] for row in connection.execute(
+                f"SELECT outbound_date FROM jobs WHERE route = ? AND outbound_date IN ({placeholders}) "
+                f"AND (status IN (?, ?) OR (status = ? AND updated_at < ?)) ORDER BY outbound_date",
+                (route, *outbound_dates, PENDING, FAILED, RUNNING, now - self.running_timeout))]
+            connection.executemany("UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? "
+                                   "WHERE route = ? AND outbound_date = ?",
+                                   [(RUNNING, now, route, outbound_date) for outbound_date in claimed_dates])
+            return claimed_dates
+
+        if not outbound_dates:
+            return []
+        claimed_dates = self._execute_in_transaction(claim_dates)
+        if len(claimed_dates) < len(outbound_dates):
+            self.logger.info(f"{self.stage_name} - Claimed {len(claimed_dates)} of {len(outbound_dates)} dates "
+                             f"for {route}, the rest are done or run by other process")
+        return claimed_dates
+
+    def _set_status(self, route: str, outbound_dates: iter, status: str, error: str = None) -> None:
+        def set_status(connection: sqlite3.Connection) -> None:
+            now = time.time()
+            connection.executemany("UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+                                   "WHERE route = ? AND outbound_date = ?",
+                                   [(status, error, now, route, outbound_date) for outbound_date in outbound_dates])
+
+        self._execute_in_transaction(set_status)
+
+    def mark_done(self, route: str, outbound_dates: iter) -> None:
+        self._set_status(route, outbound_dates, DONE)
+
+    def mark_failed(self, route: str, outbound_dates: iter, error: str = None) -> None:
+        self._set_status(route, outbound_dates, FAILED, error)
+
+    def release(self, route: str, outbound_dates: iter) -> None:
+        """
+        Returns running dates back to pending, attempt is not counted (e.g. run is aborted before they are fetched)
+        """
+
+        def release_dates(connection: sqlite3.Connection) -> None:
+            connection.executemany("UPDATE jobs SET status = ?, attempts = attempts - 1, updated_at = ? "
+                                   "WHERE route = ? AND outbound_date = ? AND status = ?",
+                                   [(PENDING, time.time(), route, outbound_date, RUNNING)
+                                    for outbound_date in outbound_dates])
+
+        self._execute_in_transaction(release_dates)
+
+    def get_status_counts(self, route: str) -> dict:
+        """
+        Returns {status: number of dates} of the route
+        """
+
+        with self._lock:
+            rows = self._connection.execute("SELECT status, COUNT(*) FROM jobs WHERE route = ? GROUP BY status",
+                                            (route,)).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,60 @@
+"""
+Parses API responses straight from bytes (no decoding of multi-megabyte Live API body into str first)
+with orjson if it's installed (several times faster) or stdlib json otherwise.
+Optionally projects results to the fields needed for price facts, so unused lookups (Segments, Places etc.)
+are dropped right after parsing instead of being kept across polls and recorded.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, stdlib json parses bytes as well
+    orjson = None
+
+# Live API fields needed for price facts and min prices: {field: None - whole value, tuple - fields of list entries}
+LIVE_API_PRICE_FIELDS = {"SessionKey": None,
+                         "Query": None,
+                         "Status": None,
+                         "Itineraries": None,
+                         "Legs": ("Id", "Departure", "Arrival", "Duration", "Stops", "Carriers"),
+                         "Agents": ("Id", "Name"),
+                         "Carriers": ("Id", "Name", "Code")}
+
+
+def parse_json(content: bytes):
+    """
+    Returns parsed JSON (raises ValueError if content isn't valid JSON)
+    """
+
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def project_result(result: dict, fields: dict) -> dict:
+    """
+    Returns result with only listed fields (entries of list fields are cut down to listed entry fields)
+    """
+
+    projected_result = {}
+    for field, entry_fields in fields.items():
+        if field not in result:
+            continue
+        value = result[field]
+        if entry_fields is not None and isinstance(value, list):
+            value = [{entry_field: entry[entry_field] for entry_field in entry_fields if entry_field in entry}
+                     for entry in value]
+        projected_result[field] = value
+    return projected_result
+
+
+def parse_response(response, fields: dict = None):
+    """
+    Parses response body from bytes, projects it to the fields if they are passed
+    """
+
+    result = parse_json(response.content)
+    if fields is not None and isinstance(result, dict):
+        result = project_result(result, fields)
+    return result
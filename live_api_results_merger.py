@@ -0,0 +1,90 @@
+"""
+Merges incremental Live API polls into one consolidated result.
+Every 'UpdatesPending' poll repeats most of the previous one, so only new or changed entries are taken from it.
+"""
+
+# lookup lists with entries identified by 'Id' field
+LOOKUP_LISTS = ("Legs", "Segments", "Carriers", "Agents", "Places")
+
+
+def get_itinerary_key(itinerary: dict) -> tuple:
+    return itinerary.get("OutboundLegId"), itinerary.get("InboundLegId")
+
+
+def get_pricing_option_key(pricing_option: dict) -> tuple:
+    return tuple(pricing_option.get("Agents", []))
+
+
+class LiveApiResultsMerger:
+    """
+    Consolidates Live API polls: itineraries are keyed by OutboundLegId (+InboundLegId),
+    pricing options - by Agents, lookup entries (Legs, Places etc.) - by Id.
+    Memory stays proportional to the number of unique entries, not to the number of polls.
+    """
+
+    def __init__(self, keep_delta_log: bool = False):
+        self.keep_delta_log = keep_delta_log
+        self.polls_count = 0
+        self.header = {}  # top-level fields of the latest poll (SessionKey, Query, Status etc.)
+        self.itineraries = {}  # itinerary key -> itinerary without PricingOptions
+        self.pricing_options = {}  # itinerary key -> {agents key -> pricing option}
+        self.lookups = {name: {} for name in LOOKUP_LISTS}
+        self.delta_log = []
+
+    @property
+    def itineraries_count(self) -> int:
+        return len(self.itineraries)
+
+    def merge(self, result: dict) -> dict:
+        """
+        Merges poll result into consolidated one and returns delta summary for this poll
+        """
+
+        self.polls_count += 1
+        delta = {"Poll": self.polls_count, "Status": result.get("Status"),
+                 "NewItineraries": 0, "NewPricingOptions": 0, "RepricedOptions": 0}
+
+        for field, value in result.items():
+            if field != "Itineraries" and field not in LOOKUP_LISTS:
+                self.header[field] = value
+
+        for name in LOOKUP_LISTS:
+            entries = self.lookups[name]
+            for entry in result.get(name, []):
+                entries[entry.get("Id")] = entry
+
+        for itinerary in result.get("Itineraries", []):
+            key = get_itinerary_key(itinerary)
+            if key not in self.itineraries:
+                delta["NewItineraries"] += 1
+                self.pricing_options[key] = {}
+            self.itineraries[key] = {field: value for field, value in itinerary.items() if field != "PricingOptions"}
+
+            options = self.pricing_options[key]
+            for pricing_option in itinerary.get("PricingOptions", []):
+                option_key = get_pricing_option_key(pricing_option)
+                previous_option = options.get(option_key)
+                if previous_option is None:
+                    delta["NewPricingOptions"] += 1
+                elif previous_option.get("Price") != pricing_option.get("Price"):
+                    delta["RepricedOptions"] += 1
+                options[option_key] = pricing_option
+
+        if self.keep_delta_log:
+            self.delta_log.append(delta)
+        return delta
+
+    def get_result(self) -> dict:
+        """
+        Returns consolidated result in the same format as Live API response
+        """
+
+        result = dict(self.header)
+        result["Itineraries"] = [{**itinerary, "PricingOptions": list(self.pricing_options[key].values())}
+                                 for key, itinerary in self.itineraries.items()]
+        for name in LOOKUP_LISTS:
+            result[name] = list(self.lookups[name].values())
+        result["PollsCount"] = self.polls_count
+        if self.keep_delta_log:
+            result["DeltaLog"] = self.delta_log
+        return result
@@ -1,39 +1,97 @@
 """
-Records logs both into file and prints into the console
+Records logs both into file and prints into the console (optionally into JSON-lines file as well).
+Logging call only puts record into queue, records are formatted and written by background listener thread,
+so slow console or disk doesn't hold back fetching threads.
 """
 
+import atexit
 import logging
 import os
-from logger_formatter import CustomFormatter
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from logger_formatter import CustomFormatter, JsonFormatter
 
+_queue_listener = None  # (process id, listener) - forked process starts its own listener
 
-def create_logger(log_file_folder_path: str, log_file_name: str, level=logging.DEBUG)-> logging.Logger:
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    Puts records into queue as they are: message is formatted by listener thread, not by the logging one
+    (queue is in-process, so records don't have to be pickled)
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def create_logger(log_file_folder_path: str, log_file_name: str, level=logging.DEBUG,
+                  json_lines: bool = False)-> logging.Logger:
     """
     Creates custom logger that records logs into file AND prints them into the console.
     Console records are colored using CustomFormatter.
+    If json_lines is set, records are written into '<log file name>.jsonl' as well (1 JSON object per line).
+    Log messages can be passed with %-style args - they are formatted only if level is enabled.
     """
 
+    global _queue_listener
+
     logger = logging.getLogger(__name__)
     logger.setLevel(level)
 
-    if not logger.handlers:  # do not create handlers if already exist (else - multiple log lines)
+    if _queue_listener is not None and _queue_listener[0] == os.getpid():
+        return logger  # do not create handlers if already exist (else - multiple log lines)
+    for handler in list(logger.handlers):  # handlers inherited from parent process (its listener isn't running here)
+        logger.removeHandler(handler)
+
+    # create log folder if not exists
+    if not os.path.exists(log_file_folder_path):
+        os.mkdir(log_file_folder_path)
+    log_file_abs_path = os.path.join(log_file_folder_path, log_file_name)
 
-        # create log folder if not exists
-        if not os.path.exists(log_file_folder_path):
-            os.mkdir(log_file_folder_path)
-        log_file_abs_path = os.path.join(log_file_folder_path, log_file_name)
+    # setup file logging
+    file_handler = logging.FileHandler(log_file_abs_path)
+    file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_handler.setFormatter(file_formatter)
+    handlers = [file_handler]
 
-        # setup file logging
-        file_handler = logging.FileHandler(log_file_abs_path)
-        file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
+    # setup console logging
+    console_handler = logging.StreamHandler()
+    console_formatter = CustomFormatter()  # use CustomFormatter to color logs
+    console_handler.setFormatter(console_formatter)
+    handlers.append(console_handler)
 
-        # setup console logging
-        console_handler = logging.StreamHandler()
-        console_formatter = CustomFormatter()  # use CustomFormatter to color logs
-        console_handler.setFormatter(console_formatter)
-        logger.addHandler(console_handler)
+    # setup structured logging
+    if json_lines:
+        json_handler = logging.FileHandler(f"{os.path.splitext(log_file_abs_path)[0]}.jsonl")
+        json_handler.setFormatter(JsonFormatter())
+        handlers.append(json_handler)
+
+    # records are handled by background thread
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    logger.addHandler(BackgroundQueueHandler(log_queue))
+    _queue_listener = (os.getpid(), listener)
+    atexit.register(stop_logger)
 
     return logger
 
+
+def stop_logger() -> None:
+    """
+    Writes out records left in queue, stops listener thread and closes log files
+    (runs on exit, processes started by multiprocessing should call it themselves)
+    """
+
+    global _queue_listener
+
+    if _queue_listener is None or _queue_listener[0] != os.getpid():
+        return
+    _, listener = _queue_listener
+    _queue_listener = None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    logger = logging.getLogger(__name__)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
@@ -1,28 +1,59 @@
 """
 Provides custom formatting for the logs depending on the logs level
+and structured JSON-lines formatting for machine ingestion
 """
 
+import datetime
+import json
 import logging
+import re
 from colorama import Fore
 
+# stage name logs are tagged with ('CREATE_SESSION - Session created successfully')
+STAGE_NAME_PATTERN = re.compile(r"^([A-Z][A-Z0-9_]*) - ")
+
 
 class CustomFormatter(logging.Formatter):
     """
-    Colors log messages according to the log level
+    Colors log messages according to the log level (formatter of every level is built once)
     """
 
-    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
     all_formats = {
-        logging.DEBUG: Fore.LIGHTBLACK_EX + format,
-        logging.INFO: Fore.BLACK + format,
-        logging.WARNING: Fore.MAGENTA + format,
-        logging.ERROR: Fore.LIGHTRED_EX + format,
-        logging.CRITICAL: Fore.RED + format
+        logging.DEBUG: Fore.LIGHTBLACK_EX + log_format,
+        logging.INFO: Fore.BLACK + log_format,
+        logging.WARNING: Fore.MAGENTA + log_format,
+        logging.ERROR: Fore.LIGHTRED_EX + log_format,
+        logging.CRITICAL: Fore.RED + log_format
     }
 
+    def __init__(self):
+        super().__init__(self.log_format)
+        self.formatters = {level: logging.Formatter(level_format) for level, level_format in self.all_formats.items()}
+        self.default_formatter = logging.Formatter(self.log_format)
+
     def format(self, log_line):
-        log_format = self.all_formats.get(log_line.levelno)
-        formatter = logging.Formatter(log_format)
-        return formatter.format(log_line)
+        return self.formatters.get(log_line.levelno, self.default_formatter).format(log_line)
 
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log record as 1-line JSON object: time, level, logger, thread, stage (taken from message tag), message
+    and exception traceback if there is one
+    """
+
+    def format(self, log_line):
+        message = log_line.getMessage()
+        log_record = {"time": datetime.datetime.fromtimestamp(log_line.created, datetime.timezone.utc).isoformat(),
+                      "level": log_line.levelname,
+                      "logger": log_line.name,
+                      "thread": log_line.threadName,
+                      "process": log_line.process}
+        stage_name = STAGE_NAME_PATTERN.match(message)
+        if stage_name:
+            log_record["stage"] = stage_name.group(1)
+        log_record["message"] = message
+        if log_line.exc_info:
+            log_record["exception"] = self.formatException(log_line.exc_info)
+        return json.dumps(log_record, ensure_ascii=False, default=str)
@@ -0,0 +1,245 @@
+"""
+Lightweight in-process metrics: counters and duration histograms of stages, HTTP requests, retries, polls
+and MongoDB writes, labeled with route and mode of the task they belong to.
+Exported in Prometheus text format over HTTP and/or into JSON file rewritten periodically (for long-running process).
+Metrics are switched off by default - every call returns right away until enabled metrics are set.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+METRIC_PREFIX = "flights_"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)  # sec
+
+_NO_TIMER = contextlib.nullcontext()  # returned by disabled metrics instead of timer
+
+# labels of the current task (route, mode) added to all metrics recorded within it (per thread / context)
+_context_labels = contextvars.ContextVar("metrics_context_labels", default={})
+
+
+class Metrics:
+    """
+    Keeps counters and histograms keyed by name and labels.
+    Recording is 1 dict update under the lock, histograms use fixed buckets (memory doesn't grow with observations).
+    """
+
+    def __init__(self, enabled: bool = True, buckets: tuple = DURATION_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._counters = {}  # {(name, labels): value}
+        self._histograms = {}  # {(name, labels): [count per bucket..., +Inf count, sum]}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_labels(labels: dict) -> tuple:
+        return tuple(sorted({**_context_labels.get(), **labels}.items()))
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, self._get_labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, self._get_labels(labels))
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            histogram[bucket_index] += 1
+            histogram[-1] += value
+
+    def time(self, name: str, **labels):
+        """
+        Returns context manager observing duration (sec) of the block (failed blocks as well)
+        """
+
+        if not self.enabled:
+            return _NO_TIMER
+        return self._time(name, labels)
+
+    @contextlib.contextmanager
+    def _time(self, name: str, labels: dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def get_snapshot(self) -> dict:
+        """
+        Returns all metrics: {"counters": [...], "histograms": [...]} (histogram buckets are cumulative)
+        """
+
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, list(histogram)) for key, histogram in self._histograms.items()]
+
+        snapshot = {"counters": [], "histograms": []}
+        for (name, labels), value in sorted(counters):
+            snapshot["counters"].append({"name": name, "labels": dict(labels), "value": value})
+        for (name, labels), histogram in sorted(histograms):
+            cumulative_counts, count = [], 0
+            for bucket_count in histogram[:-1]:
+                count += bucket_count
+                cumulative_counts.append(count)
+            snapshot["histograms"].append({"name": name,
+                                           "labels": dict(labels),
+                                           "buckets": dict(zip([*map(str, self.buckets), "+Inf"], cumulative_counts)),
+                                           "count": count,
+                                           "sum": histogram[-1]})
+        return snapshot
+
+    def to_prometheus_text(self) -> str:
+        """
+        Returns all metrics in Prometheus text exposition format
+        """
+
+        def escape_label_value(value) -> str:
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def format_labels(labels: dict) -> str:
+            if not labels:
+                return ""
+            values = ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items())
+            return f"{{{values}}}"
+
+        snapshot = self.get_snapshot()
+        lines = []
+        typed_names = set()
+        for counter in snapshot["counters"]:
+            name = f"{METRIC_PREFIX}{counter['name']}"
+            if name not in typed_names:
+                typed_names.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{format_labels(counter['labels'])} {counter['value']}")
+        for histogram in snapshot["histograms"]:
+            name = f"{METRIC_PREFIX}{histogram['name']}"
+            if name not in typed_names:
+                typed_names.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            for bucket, count in histogram["buckets"].items():
+                lines.append(f"{name}_bucket{format_labels({**histogram['labels'], 'le': bucket})} {count}")
+            lines.append(f"{name}_sum{format_labels(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{format_labels(histogram['labels'])} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+_default_metrics = Metrics(enabled=False)
+
+
+def get_metrics() -> Metrics:
+    """
+    Returns metrics shared by all modules (switched off until enabled metrics are set)
+    """
+
+    return _default_metrics
+
+
+def set_metrics(metrics: Metrics) -> None:
+    """
+    Replaces metrics shared by all modules
+    """
+
+    global _default_metrics
+    _default_metrics = metrics
+
+
+@contextlib.contextmanager
+def metrics_labels(**labels):
+    """
+    Adds labels (e.g. route and mode) to all metrics recorded within the block in the current thread
+    """
+
+    token = _context_labels.set({**_context_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _context_labels.reset(token)
+
+
+class MetricsServer:
+    """
+    Serves metrics in Prometheus text format on http://<host>:<port>/metrics from background thread
+    """
+
+    stage_name = "METRICS"
+
+    def __init__(self, metrics: Metrics, port: int, logger: logging.Logger, host: str = "0.0.0.0"):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # only processes exporting over HTTP
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:  # scrapes are not logged
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), RequestHandler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        logger.info(f"{self.stage_name} - Serving metrics on http://{host}:{self.server.server_address[1]}/metrics")
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsFileWriter:
+    """
+    Rewrites JSON file with metrics every interval (sec) from background thread and once more on close.
+    File is replaced atomically, so readers never see partially written one.
+    """
+
+    stage_name = "METRICS"
+
+    def __init__(self, metrics: Metrics, file_path: str, interval: float, logger: logging.Logger):
+        self.metrics = metrics
+        self.file_path = file_path
+        self.interval = interval
+        self.logger = logger
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-file-writer", daemon=True)
+        self._thread.start()
+
+    def write(self) -> None:
+        folder_path = os.path.dirname(os.path.abspath(self.file_path))
+        tmp_file_path = None
+        try:
+            file_descriptor, tmp_file_path = tempfile.mkstemp(dir=folder_path, suffix=".tmp")
+            with os.fdopen(file_descriptor, "w") as file:
+                json.dump({"UpdatedAt": time.strftime("%Y-%m-%dT%H:%M:%S%z"), **self.metrics.get_snapshot()}, file)
+            os.replace(tmp_file_path, self.file_path)
+        except OSError as exc:
+            if tmp_file_path is not None and os.path.exists(tmp_file_path):
+                os.remove(tmp_file_path)
+            self.logger.warning(f"{self.stage_name} - Couldn't write metrics into '{self.file_path}' - '{exc}'")
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.write()
@@ -1,77 +1,638 @@
+import datetime
+import re
+import heapq
 import pymongo
 import logging
+from pymongo.write_concern import WriteConcern
+from job_ledger import DONE, FAILED, PENDING, RUNNING
+from metrics import get_metrics
+from price_facts import normalize_results
+from price_rollups import build_rollup, get_percentile, group_facts_by_rollup
+from snapshot_changes import apply_snapshot_changes, build_snapshot, get_snapshot_changes, split_snapshot
 from service_methods import retry
 
 
 def connect_to_mongodb(mongodb_instance: str, mongodb: str, mongodb_collection: str,
-                       logger: logging.Logger)->pymongo.collection.Collection:
+                       logger: logging.Logger, write_concern: dict = None)->pymongo.collection.Collection:
     """
-    Connects to MongoDB and returns collection for further processing
+    Connects to MongoDB and returns collection for further processing.
+    Write concern (e.g. {"w": 1, "j": False}) is applied to all writes into the collection.
     """
     stage_name = "MONGODB"
     client = pymongo.MongoClient(mongodb_instance)
     db = client[mongodb]
-    collection = db[mongodb_collection]
+    collection = db.get_collection(mongodb_collection,
+                                   write_concern=WriteConcern(**write_concern) if write_concern else None)
     logger.info(f"{stage_name} - Connected to db '{mongodb}', collection '{mongodb_collection}'.")
     return collection
 
 
+def build_route(airport_id_orig: str, airport_id_dest: str) -> str:
+    return f"{airport_id_orig}:{airport_id_dest}"
+
+
+def get_fetch_bucket(fetched_at: datetime.datetime, fetch_bucket_minutes: int) -> str:
+    """
+    Returns start of the time bucket fetch time falls into (results fetched within 1 bucket are considered the same)
+    """
+
+    minutes = (fetched_at.hour * 60 + fetched_at.minute) // fetch_bucket_minutes * fetch_bucket_minutes
+    bucket_start = fetched_at.replace(hour=minutes // 60, minute=minutes % 60, second=0, microsecond=0)
+    return bucket_start.strftime("%Y-%m-%dT%H:%M")
+
+
 def record_json_to_mongodb(json_data: list, collection: pymongo.collection.Collection,
-                           max_retries: int, logger: logging.Logger)->bool or None:
+                           max_retries: int, logger: logging.Logger, route: str, outbound_date: str,
+                           fetched_at: datetime.datetime = None, fetch_bucket_minutes: int = 60)->bool or None:
     """
-    Records JSON data to MongoDB
+    Records JSON data to MongoDB with unordered bulk upserts (reruns and resumes don't create duplicates).
+    Document _id is dedup key - route + outbound date + fetch time bucket + part number (Live API polls are merged
+    into 1 document per date), so results fetched again within the same bucket replace the previous ones.
     """
     stage_name = "MONGODB"
+
+    fetched_at = fetched_at or datetime.datetime.now(datetime.timezone.utc)
+    fetch_bucket = get_fetch_bucket(fetched_at, fetch_bucket_minutes)
+    dedup_key_prefix = f"{route}|{outbound_date}|{fetch_bucket}|"
+    bulk_requests = []
+    for part_number, document in enumerate(json_data):
+        document = {field: value for field, value in document.items() if field != "_id"}
+        document.update({"Route": route, "OutboundDate": outbound_date, "FetchedAt": fetched_at,
+                         "FetchBucket": fetch_bucket, "Part": part_number})
+        bulk_requests.append(pymongo.ReplaceOne({"_id": f"{dedup_key_prefix}{part_number}"}, document, upsert=True))
+    # parts left from the previous fetch within the bucket that had more of them (anchored regex uses _id index)
+    bulk_requests.append(pymongo.DeleteMany({"_id": {"$regex": f"^{re.escape(dedup_key_prefix)}"},
+                                             "Part": {"$gte": len(json_data)}}))
+
+    return bulk_write_with_retry(bulk_requests=bulk_requests,
+                                 collection=collection,
+                                 stage_name=stage_name,
+                                 max_retries=max_retries,
+                                 logger=logger)
+
+
+def create_snapshots_indexes(collection: pymongo.collection.Collection, logger: logging.Logger)->None:
+    """
+    Creates indexes for snapshot changes, so the last checkpoint and changes after it are index range scans
+    """
+    stage_name = "MONGODB"
+    collection.create_index([("Route", pymongo.ASCENDING),
+                             ("OutboundDate", pymongo.ASCENDING),
+                             ("FetchBucket", pymongo.ASCENDING)])
+    logger.debug("%s - Ensured indexes for '%s'.", stage_name, collection.name)
+
+
+def load_snapshot_entries(route: str, outbound_date: str, collection: pymongo.collection.Collection,
+                          fetch_bucket_to: str = None)->tuple:
+    """
+    Returns (snapshot entries, number of changes since the last checkpoint) for the latest snapshot
+    fetched up to fetch_bucket_to (including it) or (None, 0) if there are no snapshots
+    """
+
+    query_filter = {"Route": route, "OutboundDate": outbound_date, "Type": "checkpoint"}
+    if fetch_bucket_to is not None:
+        query_filter["FetchBucket"] = {"$lte": fetch_bucket_to}
+    checkpoint = collection.find_one(query_filter, sort=[("FetchBucket", pymongo.DESCENDING)])
+    if checkpoint is None:
+        return None, 0
+
+    query_filter.update({"Type": "changes", "FetchBucket": {"$gt": checkpoint["FetchBucket"]}})
+    if fetch_bucket_to is not None:
+        query_filter["FetchBucket"]["$lte"] = fetch_bucket_to
+    entries = dict(checkpoint["Entries"])
+    changes_count = 0
+    for changes in collection.find(query_filter).sort("FetchBucket", pymongo.ASCENDING):
+        entries = apply_snapshot_changes(entries, dict(changes["Entries"]), changes["Removed"])
+        changes_count += 1
+    return entries, changes_count
+
+
+def record_snapshot_changes(json_data: list, collection: pymongo.collection.Collection, max_retries: int,
+                            logger: logging.Logger, route: str, outbound_date: str,
+                            fetched_at: datetime.datetime = None, fetch_bucket_minutes: int = 60,
+                            checkpoint_every: int = 24)->bool or None:
+    """
+    Records only changes of JSON data against the previous snapshot of route and outbound date
+    (new, removed or changed itineraries, quotes, legs etc.) and full checkpoint every checkpoint_every snapshots.
+    Snapshot fetched within the same fetch bucket replaces the previous one (reruns don't create duplicates).
+    """
+    stage_name = "MONGODB_SNAPSHOT_CHANGES"
+
+    fetched_at = fetched_at or datetime.datetime.now(datetime.timezone.utc)
+    fetch_bucket = get_fetch_bucket(fetched_at, fetch_bucket_minutes)
+    previous_bucket = (datetime.datetime.strptime(fetch_bucket, "%Y-%m-%dT%H:%M")
+                       - datetime.timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M")
+    previous_entries, changes_count = load_snapshot_entries(route=route,
+                                                            outbound_date=outbound_date,
+                                                            collection=collection,
+                                                            fetch_bucket_to=previous_bucket)
+    entries = split_snapshot(json_data)
+
+    document = {"Route": route, "OutboundDate": outbound_date, "FetchedAt": fetched_at, "FetchBucket": fetch_bucket}
+    if previous_entries is None or changes_count + 1 >= checkpoint_every:
+        document.update({"Type": "checkpoint", "Entries": list(entries.items()), "Removed": []})
+    else:
+        changed_entries, removed_keys = get_snapshot_changes(previous_entries, entries)
+        document.update({"Type": "changes", "Entries": list(changed_entries.items()), "Removed": removed_keys})
+        logger.debug("%s - %s - %s of %s entries changed, %s removed",
+                     stage_name, outbound_date, len(changed_entries), len(entries), len(removed_keys))
+
+    return bulk_write_with_retry(bulk_requests=[pymongo.ReplaceOne({"_id": f"{route}|{outbound_date}|{fetch_bucket}"},
+                                                                   document, upsert=True)],
+                                 collection=collection,
+                                 stage_name=stage_name,
+                                 max_retries=max_retries,
+                                 logger=logger)
+
+
+def find_snapshot(route: str, outbound_date: str, collection: pymongo.collection.Collection, logger: logging.Logger,
+                  fetched_at: datetime.datetime = None, fetch_bucket_minutes: int = 60)->list or None:
+    """
+    Rebuilds results of route and outbound date as they were fetched at the given time (the latest ones by default)
+    """
+    stage_name = "GET_SNAPSHOT"
+
+    fetch_bucket_to = get_fetch_bucket(fetched_at, fetch_bucket_minutes) if fetched_at is not None else None
+    entries, changes_count = load_snapshot_entries(route=route,
+                                                   outbound_date=outbound_date,
+                                                   collection=collection,
+                                                   fetch_bucket_to=fetch_bucket_to)
+    if entries is None:
+        logger.info(f"{stage_name} - No snapshots for {route} {outbound_date}")
+        return None
+
+    logger.debug("%s - Rebuilt %s snapshot from checkpoint and %s changes", stage_name, outbound_date, changes_count)
+    return build_snapshot(entries)
+
+
+def iter_snapshots(collection: pymongo.collection.Collection, batch_size: int = 500) -> iter:
+    """
+    Yields (route, outbound date, fetch time, rebuilt results) of every recorded snapshot, dates one by one
+    (changes are applied in fetch order, so every snapshot is rebuilt once)
+    """
+
+    entries, current_date = None, None
+    cursor = collection.find({}, batch_size=batch_size).sort([("Route", pymongo.ASCENDING),
+                                                               ("OutboundDate", pymongo.ASCENDING),
+                                                               ("FetchBucket", pymongo.ASCENDING)])
+    for document in cursor:
+        if document["Type"] == "checkpoint":
+            entries = dict(document["Entries"])
+        elif entries is not None and current_date == (document["Route"], document["OutboundDate"]):
+            entries = apply_snapshot_changes(entries, dict(document["Entries"]), document["Removed"])
+        else:
+            continue  # changes without preceding checkpoint can't be rebuilt
+        current_date = (document["Route"], document["OutboundDate"])
+        yield document["Route"], document["OutboundDate"], document["FetchedAt"], build_snapshot(entries)
+    cursor.close()
+
+
+def bulk_write_with_retry(bulk_requests: list, collection: pymongo.collection.Collection, stage_name: str,
+                          max_retries: int, logger: logging.Logger)->bool:
+    """
+    Runs unordered bulk write, reruns it if it fails or result is not acknowledged
+    """
     try_number = 0
 
+    if not bulk_requests:
+        logger.info(f"{stage_name} - Nothing to record into '{collection.name}'.")
+        return True
+
     while True:
-        result = collection.insert_many(json_data)
+        try:
+            with get_metrics().time("mongodb_write_duration_seconds", collection=collection.name):
+                result = collection.bulk_write(bulk_requests, ordered=False)
+        except pymongo.errors.PyMongoError as exc:
+            try_number += 1
+            retry(stage_name, try_number, max_retries, exc, logger)
+            continue
+        get_metrics().increment("mongodb_documents_written_total", len(bulk_requests), collection=collection.name)
         if result.acknowledged:
-            logger.info(f"{stage_name} - Recorded {len(json_data)} new results. "
-                        f"Overall documents count - {collection.count_documents({})}")
-            logger.debug(f"{stage_name} - Newly recorded IDS: {', '.join([str(id) for id in result.inserted_ids])}")
+            logger.info(f"{stage_name} - Recorded {result.upserted_count} new and "
+                        f"replaced {result.matched_count} existing documents in '{collection.name}'.")
             return True
-        else:
-            try_number += 1
-            err = f"{stage_name} - JSON was not recorded to DB, result is not acknowledged"
-            retry(stage_name, try_number, max_retries, err, logger)
+        if not collection.write_concern.acknowledged:  # w=0 - nothing to check
+            logger.info(f"{stage_name} - Sent {len(bulk_requests)} documents into '{collection.name}' "
+                        f"(unacknowledged write concern).")
+            return True
+        try_number += 1
+        err = f"{stage_name} - JSON was not recorded to DB, result is not acknowledged"
+        retry(stage_name, try_number, max_retries, err, logger)
+
+
+def create_price_facts_indexes(collection: pymongo.collection.Collection, logger: logging.Logger)->None:
+    """
+    Creates indexes for price facts, so threshold and cheapest-N queries are index range scans
+    """
+    stage_name = "MONGODB"
+    collection.create_index([("Route", pymongo.ASCENDING),
+                             ("OutboundDate", pymongo.ASCENDING),
+                             ("Price", pymongo.ASCENDING),
+                             ("FetchedAt", pymongo.ASCENDING)])  # fetch time filter is checked on index keys
+    logger.debug("%s - Ensured indexes for '%s'.", stage_name, collection.name)
+
+
+def record_price_facts(json_data: list, collection: pymongo.collection.Collection, max_retries: int,
+                       logger: logging.Logger, route: str, outbound_date: str,
+                       fetched_at: datetime.datetime, fetch_bucket_minutes: int = 60)->list:
+    """
+    Flattens JSON data into price facts (1 document per itinerary x agent), upserts them into MongoDB
+    and returns recorded facts
+    """
+    stage_name = "MONGODB_PRICE_FACTS"
+
+    facts = normalize_results(json_data=json_data,
+                              route=route,
+                              outbound_date=outbound_date,
+                              fetched_at=fetched_at,
+                              fetch_bucket=get_fetch_bucket(fetched_at, fetch_bucket_minutes))
+    bulk_requests = [pymongo.ReplaceOne({"_id": fact["_id"]}, fact, upsert=True) for fact in facts]
+    bulk_write_with_retry(bulk_requests=bulk_requests,
+                          collection=collection,
+                          stage_name=stage_name,
+                          max_retries=max_retries,
+                          logger=logger)
+    return facts
+
+
+def create_price_rollups_indexes(collection: pymongo.collection.Collection, logger: logging.Logger)->None:
+    """
+    Creates indexes for price rollups, so price trend for route and date is index range scan
+    """
+    stage_name = "MONGODB"
+    collection.create_index([("Route", pymongo.ASCENDING),
+                             ("OutboundDate", pymongo.ASCENDING),
+                             ("FetchDay", pymongo.ASCENDING)])
+    logger.debug("%s - Ensured indexes for '%s'.", stage_name, collection.name)
+
+
+def update_price_rollups(facts: list, collection: pymongo.collection.Collection, max_retries: int,
+                         logger: logging.Logger)->None:
+    """
+    Merges price facts into route x outbound date x fetch day rollups (min, median, p10/p90 price etc.).
+    Rollup is replaced only if it wasn't changed by another worker since it was read (else merge is repeated).
+    """
+    stage_name = "MONGODB_PRICE_ROLLUPS"
+
+    for rollup_id, rollup_facts in group_facts_by_rollup(facts).items():
+        try_number = 0
+        while True:
+            try:
+                rollup = collection.find_one({"_id": rollup_id})
+                new_rollup = build_rollup(rollup, rollup_facts)
+                if rollup is None:
+                    collection.insert_one(new_rollup)
+                    break
+                result = collection.replace_one({"_id": rollup_id, "Version": rollup["Version"]}, new_rollup)
+                if not result.acknowledged or result.matched_count:
+                    break
+                get_metrics().increment("price_rollup_conflicts_total")
+                logger.debug("%s - Rollup '%s' was changed by another worker, merging again.", stage_name, rollup_id)
+            except pymongo.errors.DuplicateKeyError:
+                get_metrics().increment("price_rollup_conflicts_total")
+                logger.debug("%s - Rollup '%s' was created by another worker, merging again.", stage_name, rollup_id)
+            except pymongo.errors.PyMongoError as exc:
+                try_number += 1
+                retry(stage_name, try_number, max_retries, exc, logger)
+
+    logger.info(f"{stage_name} - Updated rollups with {len(facts)} price facts.")
+
+
+def build_price_facts_filter(route: str or list, fetched_after: datetime.datetime = None, **conditions) -> dict:
+    query_filter = {"Route": {"$in": route} if isinstance(route, list) else route, **conditions}
+    if fetched_after is not None:
+        query_filter["FetchedAt"] = {"$gte": fetched_after}
+    return query_filter
+
+
+def get_unique_flights(price_facts: iter, limit: int = None) -> list:
+    """
+    Returns price facts without repeats of the same flight fetched several times
+    (facts should be sorted by price within the date, so the cheapest fetch is kept)
+    """
+
+    seen_flights = set()
+    flights = []
+    for fact in price_facts:
+        flight_key = (fact["OutboundDate"], fact["OutboundLegId"], fact["InboundLegId"], fact["AgentId"])
+        if flight_key in seen_flights:
+            continue
+        seen_flights.add(flight_key)
+        flights.append(fact)
+        if limit is not None and len(flights) >= limit:
+            break
+    return flights
 
 
-def find_flights_with_low_prices(threshold: int, search_date: str, collection: pymongo.collection.Collection,
-                                 logger: logging.Logger)->None:
+def find_cheapest_flights(route: str, date_from: str, date_to: str, collection: pymongo.collection.Collection,
+                          logger: logging.Logger, limit: int = 10, fetched_after: datetime.datetime = None,
+                          dates_per_query: int = 100)->list:
+    """
+    Returns cheapest K flights (all flight info along with link to order tickets) over the date range.
+    Dates are requested with $in, so MongoDB merges per-date index scans already sorted by price
+    and stops after K flights instead of sorting the whole range.
+    """
+    stage_name = "GET_CHEAPEST_FLIGHTS"
+
+    date_from_datetime = datetime.datetime.strptime(date_from, "%Y-%m-%d").date()
+    date_to_datetime = datetime.datetime.strptime(date_to, "%Y-%m-%d").date()
+    dates = [(date_from_datetime + datetime.timedelta(days=n)).strftime("%Y-%m-%d")
+             for n in range((date_to_datetime - date_from_datetime).days + 1)]
+
+    # each query explodes into 1 index scan per date, MongoDB caps the number of merged scans (200 by default)
+    cursors = []
+    for i in range(0, len(dates), dates_per_query):
+        dates_chunk = dates[i:i + dates_per_query]
+        query_filter = build_price_facts_filter(route, fetched_after, OutboundDate={"$in": dates_chunk})
+        cursors.append(collection.find(query_filter).sort("Price", pymongo.ASCENDING))
+
+    cheapest_flights = get_unique_flights(heapq.merge(*cursors, key=lambda fact: fact["Price"]), limit=limit)
+    for cursor in cursors:
+        cursor.close()
+
+    logger.info(f"{stage_name} - Found {len(cheapest_flights)} cheapest flights for {date_from} - {date_to}")
+    return cheapest_flights
+
+
+def find_flights_under_threshold_price(threshold: int, route: str or list, date_from: str,
+                                       collection: pymongo.collection.Collection, logger: logging.Logger,
+                                       date_to: str = None, fetched_after: datetime.datetime = None,
+                                       limit: int = None)->list:
     """
     Finds flights with price lower than a threshold and returns all info for such flights
-    (along with link to order tickets).
+    (along with link to order tickets), sorted by date and price.
+    Route can be list of routes (e.g. all airport pairs of city pair).
     """
     stage_name = "GET_MIN_PRICE"
 
-    # calculate price for each itinerary (can have several Legs)
-    price_per_flight_pipeline = [
-        {"$match": {"Query.OutboundDate": search_date}},
-        {"$unwind": "$Itineraries"},
-        {"$project":
-             {"Itineraries.OutboundLegId":
-                  {"$arrayToObject":
-                       [[{"k": "$Itineraries.OutboundLegId",
-                          "v": {"$reduce":
-                                    {"input": "$Itineraries.PricingOptions",
-                                     "initialValue": 0,
-                                     "in": {"$add":
-                                                ["$$value",
-                                                 "$$this.Price"]}}}
-                          }]]}}}
+    dates_range = {"$gte": date_from}
+    if date_to is not None:
+        dates_range["$lte"] = date_to
+    query_filter = build_price_facts_filter(route, fetched_after, OutboundDate=dates_range, Price={"$lt": threshold})
+    cursor = collection.find(query_filter).sort([("OutboundDate", pymongo.ASCENDING), ("Price", pymongo.ASCENDING)])
+    flights_with_low_prices = get_unique_flights(cursor, limit=limit)
+    cursor.close()
+
+    logger.info(f"{stage_name} - Found {len(flights_with_low_prices)} flights with prices lower than {threshold}")
+    return flights_with_low_prices
+
+
+def find_min_price_per_day(route: str, date_from: str, date_to: str, collection: pymongo.collection.Collection,
+                           logger: logging.Logger, fetched_after: datetime.datetime = None)->list:
+    """
+    Returns cheapest flight (all flight info) for every date in the range
+    """
+    stage_name = "GET_MIN_PRICE_PER_DAY"
+
+    query_filter = build_price_facts_filter(route, fetched_after, OutboundDate={"$gte": date_from, "$lte": date_to})
+    min_price_per_day_pipeline = [
+        {"$match": query_filter},
+        {"$sort": {"Route": 1, "OutboundDate": 1, "Price": 1}},  # same order as index (no in-memory sort)
+        {"$group": {"_id": "$OutboundDate", "Cheapest": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$Cheapest"}},
+        {"$sort": {"OutboundDate": 1}}
     ]
-    price_per_flight_results = collection.aggregate(price_per_flight_pipeline)
+    min_price_per_day = list(collection.aggregate(min_price_per_day_pipeline))
 
-    # find flights with prices < threshold
-    flights_with_low_prices = []
-    for price_per_flight in price_per_flight_results:
-        for k, v in price_per_flight['Itineraries']['OutboundLegId'].items():
-            if v < threshold:
-                flights_with_low_prices.append(k)
+    logger.info(f"{stage_name} - Found min prices for {len(min_price_per_day)} days from {date_from} - {date_to}")
+    return min_price_per_day
 
-    logger.info(f"{stage_name} - Found {len(flights_with_low_prices)} flights with prices lower than {threshold}")
 
-    # return all flight data for resulted flights
-    flights_data_pipeline = []  # TODO - request flights data from MongoDB
+def find_price_trend(route: str, outbound_date: str, collection: pymongo.collection.Collection,
+                     logger: logging.Logger, fetch_day_from: str = None)->list:
+    """
+    Returns daily price rollups (min, median, p10/p90 price etc.) for outbound date sorted by fetch day
+    """
+    stage_name = "GET_PRICE_TREND"
+
+    query_filter = {"Route": route, "OutboundDate": outbound_date}
+    if fetch_day_from is not None:
+        query_filter["FetchDay"] = {"$gte": fetch_day_from}
+    price_trend = list(collection.find(query_filter, {"Offers": 0}).sort("FetchDay", pymongo.ASCENDING))
+
+    logger.info(f"{stage_name} - Found {len(price_trend)} daily rollups for {outbound_date}")
+    return price_trend
+
+
+def is_price_unusually_low(price: float, route: str, outbound_date: str, collection: pymongo.collection.Collection,
+                           logger: logging.Logger, history_days: int = 30)->bool:
+    """
+    Checks if price is lower than usual p10 price of the outbound date (median of daily p10 for previous fetch days)
+    """
+    stage_name = "CHECK_LOW_PRICE"
+
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    fetch_day_from = (today - datetime.timedelta(days=history_days)).strftime("%Y-%m-%d")
+    price_trend = find_price_trend(route=route,
+                                   outbound_date=outbound_date,
+                                   collection=collection,
+                                   logger=logger,
+                                   fetch_day_from=fetch_day_from)
+    daily_p10_prices = sorted(rollup["P10Price"] for rollup in price_trend
+                              if rollup["FetchDay"] < today.strftime("%Y-%m-%d"))
+    if not daily_p10_prices:
+        logger.info(f"{stage_name} - No price history for {outbound_date}")
+        return False
+
+    usual_p10_price = get_percentile(daily_p10_prices, 50)
+    logger.info(f"{stage_name} - Price {price} for {outbound_date} vs usual p10 price {usual_p10_price:.0f}")
+    return price < usual_p10_price
+
+
+def record_fetch_times(route: str, outbound_dates: list, collection: pymongo.collection.Collection, max_retries: int,
+                       logger: logging.Logger, fetched_at: datetime.datetime = None)->bool:
+    """
+    Records last fetch time of route's outbound dates (1 document per route and date, recorded even if fetch
+    returned no prices)
+    """
+    stage_name = "MONGODB_FETCH_TIMES"
+
+    fetched_at = fetched_at or datetime.datetime.now(datetime.timezone.utc)
+    bulk_requests = [pymongo.UpdateOne({"_id": f"{route}|{outbound_date}"},
+                                       {"$set": {"Route": route, "OutboundDate": outbound_date},
+                                        "$max": {"FetchedAt": fetched_at}},
+                                       upsert=True)
+                     for outbound_date in outbound_dates]
+    return bulk_write_with_retry(bulk_requests=bulk_requests,
+                                 collection=collection,
+                                 stage_name=stage_name,
+                                 max_retries=max_retries,
+                                 logger=logger)
+
+
+def find_last_fetch_times(route: str, outbound_dates: list, collection: pymongo.collection.Collection,
+                          logger: logging.Logger, fetch_times_collection: pymongo.collection.Collection = None)->dict:
+    """
+    Returns {outbound date: last time date was fetched} (dates never fetched are missing).
+    Fetch times are taken from fetch times collection (if passed), dates missing there - from price facts.
+    """
+    stage_name = "GET_LAST_FETCH_TIMES"
+
+    last_fetch_times = {}
+    if fetch_times_collection is not None:
+        fetch_time_ids = [f"{route}|{outbound_date}" for outbound_date in outbound_dates]
+        last_fetch_times = {result["OutboundDate"]: result["FetchedAt"]
+                            for result in fetch_times_collection.find({"_id": {"$in": fetch_time_ids}})}
+
+    missing_dates = [outbound_date for outbound_date in outbound_dates if outbound_date not in last_fetch_times]
+    if missing_dates:  # e.g. fetched before fetch times were recorded
+        last_fetch_times_pipeline = [
+            {"$match": {"Route": route, "OutboundDate": {"$in": missing_dates}}},
+            {"$group": {"_id": "$OutboundDate", "FetchedAt": {"$max": "$FetchedAt"}}}
+        ]
+        last_fetch_times.update({result["_id"]: result["FetchedAt"]
+                                 for result in collection.aggregate(last_fetch_times_pipeline)})
+
+    logger.debug("%s - Found last fetch times for %s of %s dates",
+                 stage_name, len(last_fetch_times), len(outbound_dates))
+    return last_fetch_times
+
+
+def find_price_volatility(route: str, outbound_dates: list, collection: pymongo.collection.Collection,
+                          logger: logging.Logger, history_days: int = 7)->dict:
+    """
+    Returns {outbound date: coefficient of variation of daily min price over the last history days}
+    (0 - price doesn't change, dates with less than 2 daily rollups are missing)
+    """
+    stage_name = "GET_PRICE_VOLATILITY"
+
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    fetch_day_from = (today - datetime.timedelta(days=history_days)).strftime("%Y-%m-%d")
+    price_volatility_pipeline = [
+        {"$match": {"Route": route, "OutboundDate": {"$in": outbound_dates}, "FetchDay": {"$gte": fetch_day_from}}},
+        {"$group": {"_id": "$OutboundDate",
+                    "AvgMinPrice": {"$avg": "$MinPrice"},
+                    "StdDevMinPrice": {"$stdDevPop": "$MinPrice"},
+                    "DaysCount": {"$sum": 1}}}
+    ]
+    price_volatility = {result["_id"]: result["StdDevMinPrice"] / result["AvgMinPrice"]
+                        for result in collection.aggregate(price_volatility_pipeline)
+                        if result["DaysCount"] > 1 and result["AvgMinPrice"]}
+
+    logger.debug("%s - Found price volatility for %s of %s dates",
+                 stage_name, len(price_volatility), len(outbound_dates))
+    return price_volatility
+
+
+def create_jobs_indexes(collection: pymongo.collection.Collection, logger: logging.Logger)->None:
+    """
+    Creates indexes for jobs, so workers claim pending and expired jobs without collection scan
+    """
+    stage_name = "MONGODB"
+    collection.create_index([("Status", pymongo.ASCENDING),
+                             ("OutboundDate", pymongo.ASCENDING)])
+    collection.create_index([("Status", pymongo.ASCENDING),
+                             ("LeaseExpiresAt", pymongo.ASCENDING)])
+    logger.debug("%s - Ensured indexes for '%s'.", stage_name, collection.name)
+
+
+def enqueue_jobs(route: str, outbound_dates: list, params: dict, collection: pymongo.collection.Collection,
+                 max_retries: int, logger: logging.Logger, refresh: bool = False)->None:
+    """
+    Adds (route, outbound date) jobs for workers, params are passed to the worker as is (e.g. airport ids).
+    Existing jobs are left as they are, done and failed ones are reset to pending if refresh is set.
+    """
+    stage_name = "MONGODB_ENQUEUE_JOBS"
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    job_ids = [f"{route}|{outbound_date}" for outbound_date in outbound_dates]
+    bulk_requests = [pymongo.UpdateOne({"_id": job_id},
+                                       {"$setOnInsert": {"Route": route,
+                                                         "OutboundDate": outbound_date,
+                                                         "Params": params,
+                                                         "Status": PENDING,
+                                                         "Attempts": 0,
+                                                         "CreatedAt": now}},
+                                       upsert=True)
+                     for job_id, outbound_date in zip(job_ids, outbound_dates)]
+    if refresh:
+        bulk_requests.append(pymongo.UpdateMany({"_id": {"$in": job_ids}, "Status": {"$in": [DONE, FAILED]}},
+                                                {"$set": {"Status": PENDING, "Attempts": 0, "Params": params}}))
+    bulk_write_with_retry(bulk_requests=bulk_requests,
+                          collection=collection,
+                          stage_name=stage_name,
+                          max_retries=max_retries,
+                          logger=logger)
+    logger.info(f"{stage_name} - Enqueued {len(job_ids)} jobs for {route}")
+
+
+def claim_job(collection: pymongo.collection.Collection, worker_id: str, logger: logging.Logger,
+              lease_minutes: float = 10, max_attempts: int = 3)->dict or None:
+    """
+    Atomically leases the nearest pending job (or failed / expired running one with attempts left) to the worker.
+    Returns claimed job or None if there are no jobs to run.
+    """
+    stage_name = "MONGODB_CLAIM_JOB"
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    # worker crashed on the last attempt - job won't be claimed again
+    result = collection.update_many({"Status": RUNNING,
+                                     "LeaseExpiresAt": {"$lt": now},
+                                     "Attempts": {"$gte": max_attempts}},
+                                    {"$set": {"Status": FAILED,
+                                              "Error": "Lease expired on the last attempt",
+                                              "UpdatedAt": now},
+                                     "$unset": {"LeaseExpiresAt": ""}})
+    if result.modified_count:
+        logger.warning(f"{stage_name} - {result.modified_count} jobs failed, their leases expired on the last attempt")
+
+    job = collection.find_one_and_update(
+        {"$or": [{"Status": PENDING},
+                 {"Status": FAILED, "Attempts": {"$lt": max_attempts}},
+                 {"Status": RUNNING, "LeaseExpiresAt": {"$lt": now}, "Attempts": {"$lt": max_attempts}}]},
+        {"$set": {"Status": RUNNING,
+                  "LeaseOwner": worker_id,
+                  "LeaseExpiresAt": now + datetime.timedelta(minutes=lease_minutes),
+                  "UpdatedAt": now},
+         "$inc": {"Attempts": 1}},
+        sort=[("OutboundDate", pymongo.ASCENDING)],
+        return_document=pymongo.ReturnDocument.AFTER)
+    if job is not None:
+        logger.debug("%s - %s claimed %s (attempt #%s)", stage_name, worker_id, job['_id'], job['Attempts'])
+    return job
+
+
+def renew_job_lease(job: dict, collection: pymongo.collection.Collection, worker_id: str, logger: logging.Logger,
+                    lease_minutes: float = 10)->bool:
+    """
+    Extends lease of the job run by the worker (long jobs, e.g. Live API polling, renew it periodically).
+    Returns False if lease has expired and job is already claimed by other worker.
+    """
+    stage_name = "MONGODB_RENEW_JOB_LEASE"
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    result = collection.update_one({"_id": job["_id"], "Status": RUNNING, "LeaseOwner": worker_id},
+                                   {"$set": {"LeaseExpiresAt": now + datetime.timedelta(minutes=lease_minutes),
+                                             "UpdatedAt": now}})
+    if result.matched_count == 0:
+        logger.warning(f"{stage_name} - Lease of {job['_id']} is lost by {worker_id}")
+        return False
+    return True
+
+
+def create_rate_limits_indexes(collection: pymongo.collection.Collection, logger: logging.Logger)->None:
+    """
+    Creates TTL index, so request counters of past minutes and days are removed by MongoDB
+    """
+    stage_name = "MONGODB"
+    collection.create_index("ExpiresAt", expireAfterSeconds=0)
+    logger.debug("%s - Ensured indexes for '%s'.", stage_name, collection.name)
+
+
+def finish_job(job: dict, collection: pymongo.collection.Collection, worker_id: str, logger: logging.Logger,
+               error: str = None)->bool:
+    """
+    Marks leased job done (or failed if error is passed).
+    Returns False if lease has expired and job is already claimed by other worker.
+    """
+    stage_name = "MONGODB_FINISH_JOB"
 
+    result = collection.update_one({"_id": job["_id"], "Status": RUNNING, "LeaseOwner": worker_id},
+                                   {"$set": {"Status": FAILED if error else DONE,
+                                             "Error": error,
+                                             "UpdatedAt": datetime.datetime.now(datetime.timezone.utc)},
+                                    "$unset": {"LeaseExpiresAt": ""}})
+    if result.modified_count == 0:
+        logger.warning(f"{stage_name} - Lease of {job['_id']} is lost by {worker_id}")
+        return False
+    return True
@@ -0,0 +1,103 @@
+"""
+Vectorized price analytics over Parquet dataset of price facts (see export_parquet.py): same queries as
+price queries in mongodb_methods.py, but computed with pandas over millions of rows without touching MongoDB.
+Requires 'pandas' and 'pyarrow' packages.
+"""
+
+import datetime
+
+try:
+    import pandas
+    import pyarrow
+    import pyarrow.dataset
+except ImportError:  # analytics are optional, the rest of the program doesn't need pandas / pyarrow
+    pandas = None
+
+FLIGHT_KEY_COLUMNS = ["OutboundDate", "OutboundLegId", "InboundLegId", "AgentId"]
+
+
+def load_price_facts(dataset_path: str, route: str = None, date_from: str = None, date_to: str = None,
+                     fetched_after: datetime.datetime = None, columns: list = None) -> "pandas.DataFrame":
+    """
+    Loads price facts of the route and date range from Parquet dataset.
+    Filters are pushed down to the dataset, so only matching partitions (route, month) and row groups are read.
+    """
+
+    if pandas is None:
+        raise ImportError("Price analytics require 'pandas' and 'pyarrow' packages (pip install pandas pyarrow)")
+
+    dataset = pyarrow.dataset.dataset(dataset_path, format="parquet", partitioning="hive")
+    conditions = []
+    if route is not None:
+        conditions.append(pyarrow.dataset.field("Route") == route)
+    if date_from is not None:
+        conditions.append(pyarrow.dataset.field("Month") >= date_from[:7])
+        conditions.append(pyarrow.dataset.field("OutboundDate") >= date_from)
+    if date_to is not None:
+        conditions.append(pyarrow.dataset.field("Month") <= date_to[:7])
+        conditions.append(pyarrow.dataset.field("OutboundDate") <= date_to)
+    if fetched_after is not None:
+        conditions.append(pyarrow.dataset.field("FetchedAt") >= pyarrow.scalar(fetched_after,
+                                                                             pyarrow.timestamp("us", tz="UTC")))
+
+    query_filter = None
+    for condition in conditions:
+        query_filter = condition if query_filter is None else query_filter & condition
+    return dataset.to_table(columns=columns, filter=query_filter).to_pandas()
+
+
+def get_unique_flights(facts: "pandas.DataFrame") -> "pandas.DataFrame":
+    """
+    Returns facts without repeats of the same flight fetched several times (the cheapest fetch is kept)
+    """
+
+    return facts.sort_values("Price", kind="stable").drop_duplicates(FLIGHT_KEY_COLUMNS)
+
+
+def find_flights_under_threshold_price(facts: "pandas.DataFrame", threshold: float,
+                                       limit: int = None) -> "pandas.DataFrame":
+    """
+    Returns flights cheaper than threshold sorted by outbound date and price
+    """
+
+    flights = get_unique_flights(facts[facts["Price"] < threshold])
+    flights = flights.sort_values(["OutboundDate", "Price"], kind="stable")
+    return flights if limit is None else flights.head(limit)
+
+
+def find_cheapest_flights(facts: "pandas.DataFrame", limit: int = 10) -> "pandas.DataFrame":
+    """
+    Returns cheapest K flights
+    """
+
+    return get_unique_flights(facts).head(limit)
+
+
+def find_min_price_per_day(facts: "pandas.DataFrame") -> "pandas.DataFrame":
+    """
+    Returns cheapest flight for every outbound date
+    """
+
+    priced_facts = facts[facts["Price"].notna()]
+    return priced_facts.loc[priced_facts.groupby("OutboundDate")["Price"].idxmin()].sort_values("OutboundDate")
+
+
+def find_price_trend(facts: "pandas.DataFrame", outbound_date: str = None) -> "pandas.DataFrame":
+    """
+    Returns daily price stats (min, median, p10/p90 price, offers count) per outbound date x fetch day,
+    computed the same way as daily price rollups (the latest price per offer of the day)
+    """
+
+    if outbound_date is not None:
+        facts = facts[facts["OutboundDate"] == outbound_date]
+    facts = facts[facts["Price"].notna()]
+    facts = facts.assign(FetchDay=facts["FetchedAt"].dt.strftime("%Y-%m-%d"))
+    latest_offers = facts.sort_values("FetchedAt", kind="stable") \
+        .drop_duplicates(FLIGHT_KEY_COLUMNS + ["FetchDay"], keep="last")
+
+    prices = latest_offers.groupby(["OutboundDate", "FetchDay"])["Price"]
+    return pandas.DataFrame({"MinPrice": prices.min(),
+                             "MedianPrice": prices.median(),
+                             "P10Price": prices.quantile(0.1),
+                             "P90Price": prices.quantile(0.9),
+                             "OffersCount": prices.count()}).reset_index()
@@ -0,0 +1,122 @@
+"""
+Flattens raw Live API / Browse Quotes results into price facts - 1 document per itinerary x agent
+with precomputed price, departure/arrival times, stops and carrier (ready for indexed queries).
+"""
+
+import datetime
+
+
+def get_price_fact_id(fact: dict) -> str:
+    return f"{fact['Route']}|{fact['OutboundDate']}|{fact['FetchBucket']}|" \
+           f"{fact['OutboundLegId']}|{fact['InboundLegId']}|{fact['AgentId']}"
+
+
+def get_browse_quote_leg_id(outbound_leg: dict) -> str:
+    """
+    Returns id of Browse Quotes outbound leg (quotes have no leg ids): origin, destination, departure and carriers
+    """
+
+    carrier_ids = outbound_leg.get("CarrierIds") or [None]
+    return f"{outbound_leg.get('OriginId')}-{outbound_leg.get('DestinationId')}-{outbound_leg.get('DepartureDate')}-" \
+           f"{'-'.join(str(carrier_id) for carrier_id in carrier_ids)}"
+
+
+def normalize_live_api_result(document: dict, route: str, outbound_date: str,
+                              fetched_at: datetime.datetime, fetch_bucket: str) -> list:
+    """
+    Returns price facts for Live API result (1 per itinerary x pricing option agent)
+    """
+
+    legs = {leg["Id"]: leg for leg in document.get("Legs", [])}
+    agents = {agent["Id"]: agent for agent in document.get("Agents", [])}
+    carriers = {carrier["Id"]: carrier for carrier in document.get("Carriers", [])}
+
+    facts = []
+    for itinerary in document.get("Itineraries", []):
+        outbound_leg = legs.get(itinerary.get("OutboundLegId"), {})
+        carrier_ids = outbound_leg.get("Carriers") or [None]
+        carrier = carriers.get(carrier_ids[0], {})
+
+        for pricing_option in itinerary.get("PricingOptions", []):
+            agent_ids = pricing_option.get("Agents") or [None]
+            agent = agents.get(agent_ids[0], {})
+            fact = {"Route": route,
+                    "OutboundDate": outbound_date,
+                    "FetchedAt": fetched_at,
+                    "FetchBucket": fetch_bucket,
+                    "Source": "live_api",
+                    "OutboundLegId": itinerary.get("OutboundLegId"),
+                    "InboundLegId": itinerary.get("InboundLegId"),
+                    "AgentId": agent_ids[0],
+                    "AgentName": agent.get("Name"),
+                    "Price": pricing_option.get("Price"),
+                    "DeeplinkUrl": pricing_option.get("DeeplinkUrl"),
+                    "Departure": outbound_leg.get("Departure"),
+                    "Arrival": outbound_leg.get("Arrival"),
+                    "Duration": outbound_leg.get("Duration"),
+                    "Stops": len(outbound_leg.get("Stops", [])),
+                    "CarrierId": carrier_ids[0],
+                    "CarrierName": carrier.get("Name")}
+            fact["_id"] = get_price_fact_id(fact)
+            facts.append(fact)
+    return facts
+
+
+def normalize_browse_quotes_result(document: dict, route: str, outbound_date: str,
+                                   fetched_at: datetime.datetime, fetch_bucket: str) -> list:
+    """
+    Returns price facts for Browse Quotes result (1 per quote, quotes have no agents)
+    """
+
+    carriers = {carrier["CarrierId"]: carrier for carrier in document.get("Carriers", [])}
+
+    facts = []
+    for quote in document.get("Quotes", []):
+        outbound_leg = quote.get("OutboundLeg", {})
+        carrier_ids = outbound_leg.get("CarrierIds") or [None]
+        carrier = carriers.get(carrier_ids[0], {})
+        fact = {"Route": route,
+                "OutboundDate": outbound_date,
+                "FetchedAt": fetched_at,
+                "FetchBucket": fetch_bucket,
+                "Source": "browse_quotes",
+                "OutboundLegId": get_browse_quote_leg_id(outbound_leg),
+                "InboundLegId": None,
+                "AgentId": None,
+                "AgentName": None,
+                "Price": quote.get("MinPrice"),
+                "DeeplinkUrl": None,
+                "Departure": outbound_leg.get("DepartureDate"),
+                "Arrival": None,
+                "Duration": None,
+                "Stops": 0 if quote.get("Direct") else None,
+                "CarrierId": carrier_ids[0],
+                "CarrierName": carrier.get("Name")}
+        fact["_id"] = get_price_fact_id(fact)
+        facts.append(fact)
+    return facts
+
+
+def normalize_results(json_data: list, route: str, outbound_date: str,
+                      fetched_at: datetime.datetime, fetch_bucket: str) -> list:
+    """
+    Returns price facts for all Live API / Browse Quotes results
+    """
+
+    facts = []
+    for document in json_data:
+        normalize = normalize_live_api_result if "Itineraries" in document else normalize_browse_quotes_result
+        facts.extend(normalize(document, route, outbound_date, fetched_at, fetch_bucket))
+    return facts
+
+
+def get_min_price(json_data: list) -> float or None:
+    """
+    Returns min price among all Live API pricing options / Browse Quotes (None if there are no prices)
+    """
+
+    prices = [quote["MinPrice"] for document in json_data for quote in document.get("Quotes", [])
+              if quote.get("MinPrice") is not None]
+    prices += [pricing_option["Price"] for document in json_data for itinerary in document.get("Itineraries", [])
+               for pricing_option in itinerary.get("PricingOptions", []) if pricing_option.get("Price") is not None]
+    return min(prices, default=None)
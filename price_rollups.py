@@ -0,0 +1,71 @@
+"""
+Builds per-route daily price rollups: route x outbound date x fetch day with min, median, p10/p90 price,
+offers count and cheapest carrier. Rollups are updated incrementally with every new batch of price facts.
+"""
+
+import datetime
+
+
+def get_fetch_day(fetched_at: datetime.datetime) -> str:
+    return fetched_at.strftime("%Y-%m-%d")
+
+
+def get_rollup_id(route: str, outbound_date: str, fetch_day: str) -> str:
+    return f"{route}|{outbound_date}|{fetch_day}"
+
+
+def get_offer_key(fact: dict) -> str:
+    return f"{fact['OutboundLegId']}|{fact['InboundLegId']}|{fact['AgentId']}"
+
+
+def get_percentile(sorted_prices: list, percent: float) -> float:
+    """
+    Returns percentile of sorted prices (linear interpolation between closest ranks)
+    """
+
+    position = (len(sorted_prices) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_prices) - 1)
+    return sorted_prices[lower] + (sorted_prices[upper] - sorted_prices[lower]) * (position - lower)
+
+
+def group_facts_by_rollup(facts: list) -> dict:
+    """
+    Returns {rollup id: facts} for facts with price
+    """
+
+    grouped_facts = {}
+    for fact in facts:
+        if fact.get("Price") is None:
+            continue
+        rollup_id = get_rollup_id(fact["Route"], fact["OutboundDate"], get_fetch_day(fact["FetchedAt"]))
+        grouped_facts.setdefault(rollup_id, []).append(fact)
+    return grouped_facts
+
+
+def build_rollup(rollup: dict or None, facts: list) -> dict:
+    """
+    Merges facts of 1 route x outbound date x fetch day into existing rollup (or creates new one).
+    Rollup keeps the latest price per offer (itinerary x agent) of the day, so re-fetches don't skew the stats.
+    """
+
+    first_fact = facts[0]
+    offers = dict(rollup["Offers"]) if rollup else {}
+    for fact in facts:
+        offers[get_offer_key(fact)] = [fact["Price"], fact.get("CarrierName")]
+
+    sorted_offers = sorted(offers.values(), key=lambda offer: offer[0])
+    sorted_prices = [offer[0] for offer in sorted_offers]
+    return {"_id": get_rollup_id(first_fact["Route"], first_fact["OutboundDate"],
+                                 get_fetch_day(first_fact["FetchedAt"])),
+            "Route": first_fact["Route"],
+            "OutboundDate": first_fact["OutboundDate"],
+            "FetchDay": get_fetch_day(first_fact["FetchedAt"]),
+            "MinPrice": sorted_prices[0],
+            "MedianPrice": get_percentile(sorted_prices, 50),
+            "P10Price": get_percentile(sorted_prices, 10),
+            "P90Price": get_percentile(sorted_prices, 90),
+            "OffersCount": len(sorted_prices),
+            "CheapestCarrier": sorted_offers[0][1],
+            "Offers": offers,
+            "Version": rollup["Version"] + 1 if rollup else 1}
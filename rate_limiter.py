@@ -0,0 +1,132 @@
+"""
+Limits request rate to the RapidAPI plan quota (shared by all API requests of the process or, with
+SharedRateLimiter, by all processes using the same MongoDB).
+"""
+
+import datetime
+import threading
+import time
+from retry_policy import AbortRunError
+
+
+class RateLimiter:
+    """
+    Token bucket: bucket holds up to 'burst' tokens and is refilled with 'requests_per_minute' tokens per minute.
+    Each request takes 1 token, if bucket is empty request waits exactly until the next token is added.
+    If requests_per_day is passed, requests over daily budget (UTC day) are not sent - AbortRunError is raised.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1, requests_per_day: int = None):
+        self.rate = requests_per_minute / 60  # tokens per sec
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.requests_per_day = requests_per_day
+        self.day = None
+        self.day_requests_count = 0
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _reset_day(self) -> None:
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        if today != self.day:
+            self.day = today
+            self.day_requests_count = 0
+
+    def get_remaining_daily_requests(self) -> int or None:
+        """
+        Returns number of requests left in today's budget (None if daily budget is not set)
+        """
+
+        if self.requests_per_day is None:
+            return None
+        with self._lock:
+            self._reset_day()
+            return max(self.requests_per_day - self.day_requests_count, 0)
+
+    def acquire(self) -> float:
+        """
+        Takes 1 token (waits for it if needed) and returns waited time (sec)
+        """
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._reset_day()
+                if self.requests_per_day is not None and self.day_requests_count >= self.requests_per_day:
+                    raise AbortRunError(f"Daily budget of {self.requests_per_day} requests is exhausted")
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.day_requests_count += 1
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+
+class SharedRateLimiter:
+    """
+    Rate limit shared by all processes / machines using the same MongoDB collection (e.g. workers of worker.py),
+    so N workers don't send N times more requests than the plan quota allows.
+    Requests are counted per UTC minute and per UTC day in documents of the collection (atomic $inc), request over
+    per-minute limit waits for the next minute, requests over daily budget are not sent - AbortRunError is raised.
+    Local token bucket of the process spreads its requests within the minute.
+    """
+
+    def __init__(self, collection, requests_per_minute: float, burst: int = 1, requests_per_day: int = None,
+                 key: str = "rapidapi"):
+        self.collection = collection
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_day = requests_per_day
+        self.key = key
+        self.local_limiter = RateLimiter(requests_per_minute=requests_per_minute,
+                                         burst=burst)
+
+    def _increment(self, window: str, expires_at: datetime.datetime) -> int:
+        document = self.collection.find_one_and_update({"_id": f"{self.key}|{window}"},
+                                                       {"$inc": {"Count": 1},
+                                                        "$setOnInsert": {"ExpiresAt": expires_at}},
+                                                       upsert=True,
+                                                       return_document=True)
+        return document["Count"]
+
+    def get_remaining_daily_requests(self) -> int or None:
+        """
+        Returns number of requests left in today's budget of all processes (None if daily budget is not set)
+        """
+
+        if self.requests_per_day is None:
+            return None
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        document = self.collection.find_one({"_id": f"{self.key}|day|{today}"}) or {}
+        return max(self.requests_per_day - document.get("Count", 0), 0)
+
+    def acquire(self) -> float:
+        """
+        Takes 1 request of the shared per-minute limit and daily budget (waits for it if needed),
+        returns waited time (sec)
+        """
+
+        waited = 0.0
+        while True:
+            if self.get_remaining_daily_requests() == 0:
+                raise AbortRunError(f"Daily budget of {self.requests_per_day} requests is exhausted")
+            waited += self.local_limiter.acquire()
+            now = datetime.datetime.now(datetime.timezone.utc)
+            minute_start = now.replace(second=0, microsecond=0)
+            next_minute = minute_start + datetime.timedelta(minutes=1)
+            if self._increment(f"minute|{minute_start:%Y-%m-%dT%H:%M}", next_minute) <= self.requests_per_minute:
+                break
+            wait_time = (next_minute - now).total_seconds()  # the minute is used up by other processes
+            time.sleep(wait_time)
+            waited += wait_time
+
+        if self.requests_per_day is not None:
+            if self._increment(f"day|{now.date()}", next_minute + datetime.timedelta(days=1)) > self.requests_per_day:
+                raise AbortRunError(f"Daily budget of {self.requests_per_day} requests is exhausted")
+        return waited
@@ -0,0 +1,131 @@
+"""
+Caches successful API responses in local sqlite file, so re-runs within TTL don't spend API quota
+on the same Browse Quotes / autosuggest requests.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import urllib.parse
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class ResponseCache:
+    """
+    Normalized URL + params -> response cache with TTL per endpoint and size-bounded eviction
+    (least recently used responses are evicted first). Endpoints without TTL are not cached.
+    """
+
+    stage_name = "RESPONSE_CACHE"
+
+    def __init__(self, file_path: str, logger: logging.Logger, endpoint_ttls: dict, max_size_mb: float = 100):
+        self.file_path = file_path
+        self.logger = logger
+        self.endpoint_ttls = endpoint_ttls  # {url path part: ttl in sec}, e.g. {"browsequotes": 3600}
+        self.max_size = max_size_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                 "key TEXT PRIMARY KEY, status_code INTEGER, headers TEXT, content BLOB, "
+                                 "size INTEGER, cached_at REAL, accessed_at REAL)")
+        self._connection.commit()
+
+    @staticmethod
+    def build_key(method: str, url: str, params: dict = None, headers: dict = None) -> str:
+        """
+        Returns method + URL with query params merged and sorted (same request always has the same key)
+        + hash of headers if they are passed, so responses for different API keys/hosts are not mixed up
+        (hash is used not to store API key in the cache file)
+        """
+
+        split_url = urllib.parse.urlsplit(url)
+        query = urllib.parse.parse_qsl(split_url.query) + [(str(key), str(value))
+                                                           for key, value in (params or {}).items()]
+        normalized_url = urllib.parse.urlunsplit((split_url.scheme.lower(), split_url.netloc.lower(),
+                                                  split_url.path, urllib.parse.urlencode(sorted(query)), ""))
+        key = f"{method.upper()} {normalized_url}"
+        if headers:
+            headers_items = sorted((str(name).lower(), str(value)) for name, value in headers.items())
+            key += " " + hashlib.sha256(json.dumps(headers_items).encode("utf-8")).hexdigest()
+        return key
+
+    def get_ttl(self, method: str, url: str) -> float or None:
+        """
+        Returns TTL (sec) of the endpoint or None if responses of the endpoint are not cached (only GET ones are)
+        """
+
+        if method.upper() != "GET":
+            return None
+        path = urllib.parse.urlsplit(url).path
+        for endpoint, ttl in self.endpoint_ttls.items():
+            if endpoint in path:
+                return ttl
+        return None
+
+    def get(self, key: str, ttl: float) -> requests.Response or None:
+        """
+        Returns cached response or None if it's missing or expired
+        """
+
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT status_code, headers, content, cached_at FROM responses "
+                                           "WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[3] > ttl:
+                return None
+            self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+
+        response = requests.Response()
+        response.status_code = row[0]
+        response.headers = CaseInsensitiveDict(json.loads(row[1]))
+        response._content = row[2]
+        response.url = key.split(" ")[1]
+        response.encoding = "utf-8"
+        return response
+
+    def set(self, key: str, response: requests.Response) -> None:
+        """
+        Caches response and evicts least recently used ones if cache exceeds max size
+        """
+
+        now = time.time()
+        content = response.content
+        with self._lock:
+            try:
+                self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                         (key, response.status_code, json.dumps(dict(response.headers)),
+                                          content, len(content), now, now))
+                self._evict()
+                self._connection.commit()
+            except sqlite3.Error as exc:
+                self._connection.rollback()
+                self.logger.warning(f"{self.stage_name} - Couldn't cache response into '{self.file_path}'. "
+                                    f"Occurred exception - '{exc}'")
+
+    def _evict(self) -> None:
+        # keep the most recently used responses that fit into max size
+        cursor = self._connection.execute("DELETE FROM responses WHERE key IN ("
+                                          "SELECT key FROM (SELECT key, SUM(size) OVER "
+                                          "(ORDER BY accessed_at DESC, key) AS total_size FROM responses) "
+                                          "WHERE total_size > ?)", (self.max_size,))
+        if cursor.rowcount > 0:
+            self.logger.debug("%s - Evicted %s responses", self.stage_name, cursor.rowcount)
+
+    def invalidate(self) -> None:
+        """
+        Removes all cached responses
+        """
+
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+        self.logger.info(f"{self.stage_name} - Invalidated all responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,107 @@
+"""
+Defines how failed requests are retried: which errors are worth retrying, skipping or aborting the run,
+and how long to wait before the next try (exponential backoff with jitter or server's Retry-After).
+"""
+
+import datetime
+import email.utils
+import random
+
+RETRY = "retry"
+SKIP = "skip"
+ABORT = "abort"
+
+
+class SkipTaskError(Exception):
+    """
+    Raised when current task (e.g. outbound date) can't be completed, other tasks can go on
+    """
+
+
+class AbortRunError(Exception):
+    """
+    Raised when there is no point in running further (e.g. API key is invalid)
+    """
+
+
+class RetryPolicy:
+    """
+    Classifies errors and calculates delay before the next try
+    """
+
+    abort_status_codes = (401, 403)
+    retry_status_codes = (408, 429)
+
+    def __init__(self, base_delay: float = 2, max_delay: float = 60, jitter: float = 0.5):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def classify(self, err: Exception or str, response=None) -> str:
+        """
+        Returns 'abort' for authorization errors, 'retry' for rate limit, server and connection errors,
+        'skip' for other client errors (request itself is wrong, retrying won't help)
+        """
+
+        response = response if response is not None else getattr(err, "response", None)
+        if response is None:
+            return RETRY  # connection error, timeout, broken JSON etc.
+        status_code = response.status_code
+        if status_code in self.abort_status_codes:
+            return ABORT
+        if status_code in self.retry_status_codes or status_code >= 500 or status_code < 400:
+            return RETRY
+        return SKIP
+
+    @staticmethod
+    def get_retry_after(response) -> float or None:
+        """
+        Returns delay (sec) from Retry-After header (can be either seconds or HTTP date)
+        """
+
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if not retry_after:
+            return None
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+        try:
+            retry_after_date = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        now = datetime.datetime.now(tz=retry_after_date.tzinfo)
+        return max((retry_after_date - now).total_seconds(), 0)
+
+    def get_delay(self, current_try: int, err: Exception or str = None, response=None) -> float:
+        """
+        Returns delay (sec) before the next try - Retry-After if server sent it,
+        else exponential backoff with jitter
+        """
+
+        response = response if response is not None else getattr(err, "response", None)
+        retry_after = self.get_retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        delay = min(self.base_delay * 2 ** (current_try - 1), self.max_delay)
+        return random.uniform(delay * (1 - self.jitter), delay)
+
+
+_default_retry_policy = RetryPolicy()
+
+
+def get_default_retry_policy() -> RetryPolicy:
+    """
+    Returns retry policy used by retry() when policy is not passed explicitly
+    """
+
+    return _default_retry_policy
+
+
+def set_default_retry_policy(retry_policy: RetryPolicy) -> None:
+    """
+    Replaces retry policy used by retry() when policy is not passed explicitly
+    """
+
+    global _default_retry_policy
+    _default_retry_policy = retry_policy
@@ -1,57 +1,249 @@
 """
-Gets Live API results, records them into MongoDB, records into file and finds min price.
+Gets Live API results, records them into MongoDB, archives them into file and finds min price.
 """
 
+import argparse
+import datetime
+import logging
 import os
+import sys
+from typing import TYPE_CHECKING
 from config import *
 from logger import create_logger
-from get_api_results_for_n_days import get_api_results_for_n_days
-from mongodb_methods import connect_to_mongodb, find_flights_under_threshold_price
-from service_methods import files_cleaner
+
+# the rest of modules are imported by the functions using them, so one-shot run (and scripts importing runner
+# helpers) load only what they need
+if TYPE_CHECKING:
+    from airport_id_cache import AirportIdCache
+    from archive_writer import ArchiveWriter
+    from rate_limiter import RateLimiter
+
+
+def connect_to_collections(logger: logging.Logger) -> tuple:
+    """
+    Connects to db and returns results, price facts, price rollups and snapshots collections
+    (indexes are created if missing, snapshots collection is None if full copies of results are stored)
+    """
+
+    from mongodb_methods import (connect_to_mongodb, create_price_facts_indexes, create_price_rollups_indexes,
+                                 create_snapshots_indexes)
+
+    collection = connect_to_mongodb(mongodb_instance=instance,
+                                    mongodb=db,
+                                    mongodb_collection=db_collection,
+                                    logger=logger,
+                                    write_concern=mongodb_write_concern)
+    price_facts_collection = collection.database.get_collection(db_price_facts_collection,
+                                                                write_concern=collection.write_concern)
+    create_price_facts_indexes(collection=price_facts_collection,
+                               logger=logger)
+    price_rollups_collection = collection.database.get_collection(db_price_rollups_collection,
+                                                                  write_concern=collection.write_concern)
+    create_price_rollups_indexes(collection=price_rollups_collection,
+                                 logger=logger)
+    snapshots_collection = None
+    if store_changes_only:
+        snapshots_collection = collection.database.get_collection(db_snapshots_collection,
+                                                                  write_concern=collection.write_concern)
+        create_snapshots_indexes(collection=snapshots_collection,
+                                 logger=logger)
+    return collection, price_facts_collection, price_rollups_collection, snapshots_collection
+
+
+def create_airport_id_cache(logger: logging.Logger, refresh: bool = False) -> "AirportIdCache":
+    """
+    Loads cached airport ids (autosuggest API is requested only for missing or expired ones).
+    If refresh is set, all cached ids are removed, so they are requested again (e.g. after airport is opened).
+    """
+
+    from airport_id_cache import AirportIdCache
+
+    airport_id_cache = AirportIdCache(file_path=airport_ids_cache_file,
+                                      ttl_days=airport_ids_cache_ttl_days,
+                                      logger=logger)
+    if refresh:
+        airport_id_cache.invalidate()
+    return airport_id_cache
+
+
+def create_http_client(logger: logging.Logger, rate_limiter: "RateLimiter" = None) -> tuple:
+    """
+    Sets up retries delays, rate limit and response cache shared by all API requests
+    (rate limiter of the process is created if it's not passed).
+    Returns HTTP client, its rate limiter and response cache (client and cache should be closed after the run).
+    """
+
+    from http_client import HttpClient
+    from rate_limiter import RateLimiter
+    from response_cache import ResponseCache
+    from retry_policy import RetryPolicy, set_default_retry_policy
+
+    set_default_retry_policy(RetryPolicy(base_delay=retry_base_delay,
+                                         max_delay=retry_max_delay))
+    rate_limiter = rate_limiter or RateLimiter(requests_per_minute=rate_limit_requests_per_minute,
+                                               burst=rate_limit_burst,
+                                               requests_per_day=rate_limit_requests_per_day)
+
+    # HTTP client keeps connections alive and caches responses
+    response_cache = ResponseCache(file_path=response_cache_file,
+                                   endpoint_ttls=response_cache_ttls,
+                                   max_size_mb=response_cache_max_size_mb,
+                                   logger=logger)
+    http_client = HttpClient(connect_timeout=http_connect_timeout,
+                             read_timeout=http_read_timeout,
+                             pool_maxsize=http_pool_maxsize,
+                             rate_limiter=rate_limiter,
+                             response_cache=response_cache)
+    return http_client, rate_limiter, response_cache
+
+
+def create_archive_writer(logger: logging.Logger) -> "ArchiveWriter or None":
+    """
+    Returns writer of daily results archive or None if results are not saved to file
+    """
+
+    if not save_to_file:
+        return None
+    from archive_writer import ArchiveWriter
+    return ArchiveWriter(folder_path=os.path.join(os.getcwd(), json_files_folder),
+                         compression=archive_compression,
+                         max_retries=max_retries,
+                         logger=logger)
+
+
+def create_metrics_exporters(logger: logging.Logger, process_number: int = 0) -> list:
+    """
+    Switches metrics on (if they are enabled and exported) and starts their exporters.
+    Returns exporters (they should be closed after the run, metrics file is written once more on close).
+    Processes started on one machine export on metrics_port + process number into '<number>_<metrics_file>'.
+    """
+
+    if not metrics_enabled or (metrics_port is None and metrics_file is None):
+        return []
+    from metrics import Metrics, MetricsFileWriter, MetricsServer, set_metrics
+    metrics = Metrics()
+    set_metrics(metrics)
+    exporters = []
+    if metrics_port is not None:
+        exporters.append(MetricsServer(metrics=metrics,
+                                       port=metrics_port + process_number,
+                                       logger=logger))
+    if metrics_file is not None:
+        exporters.append(MetricsFileWriter(metrics=metrics,
+                                           file_path=f"{process_number}_{metrics_file}" if process_number
+                                           else metrics_file,
+                                           interval=metrics_file_interval,
+                                           logger=logger))
+    return exporters
+
+
+def get_poll_params() -> dict:
+    """
+    Returns Live API polling params from config (json_parser is imported here, only Live API runs need it)
+    """
+
+    from json_parser import LIVE_API_PRICE_FIELDS
+    return {"poll_initial_interval": poll_initial_interval,
+            "poll_max_interval": poll_max_interval,
+            "poll_session_budget": poll_session_budget,
+            "keep_delta_log": keep_delta_log,
+            "result_fields": LIVE_API_PRICE_FIELDS if project_live_api_results else None}
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--refresh-airport-ids", action="store_true", help="request cached airport ids again")
+    args = parser.parse_args()
+
+    from get_api_results_for_n_days import get_api_results_for_n_days
+    from job_ledger import JobLedger
+    from mongodb_methods import find_flights_under_threshold_price
+    from retry_policy import AbortRunError, SkipTaskError
+    from service_methods import files_cleaner
 
     # create logger
     cwd = os.getcwd()
     log_file_folder_path = os.path.join(cwd, log_files_folder)
     logger = create_logger(log_file_folder_path=log_file_folder_path,
-                           log_file_name=log_file)
+                           log_file_name=log_file,
+                           level=log_level,
+                           json_lines=log_json_lines)
 
     # connect to db
-    collection = connect_to_mongodb(mongodb_instance=instance,
-                                    mongodb=db,
-                                    mongodb_collection=db_collection,
-                                    logger=logger)
+    collection, price_facts_collection, price_rollups_collection, snapshots_collection = \
+        connect_to_collections(logger)
+
+    # load cached airport ids (autosuggest API is requested only for missing or expired ones)
+    airport_id_cache = create_airport_id_cache(logger, refresh=args.refresh_airport_ids)
+
+    # open job ledger (tracks done and failed dates of the route)
+    job_ledger = JobLedger(file_path=job_ledger_file,
+                           running_timeout_minutes=job_running_timeout_minutes,
+                           logger=logger)
+
+    # setup HTTP client shared by all API requests and metrics export
+    http_client, rate_limiter, response_cache = create_http_client(logger)
+    metrics_exporters = create_metrics_exporters(logger)
 
     # get LIVE API results, record values to db
-    get_api_results_for_n_days(days=days_to_request,
-                               pickle_file=pickle_file,
-                               base_url=base_url,
-                               headers=headers,
-                               cabin_class=cabin_class,
-                               country=country,
-                               currency=currency,
-                               locale_lang=locale_lang,
-                               city_from=city_from,
-                               city_to=city_to,
-                               country_from=country_from,
-                               country_to=country_to,
-                               outbound_date=outbound_date,
-                               adults_count=adults_count,
-                               max_retries=max_retries,
-                               json_files_folder=json_files_folder,
-                               json_file=json_file,
-                               collection=collection,
-                               logger=logger,
-                               save_to_file=save_to_file,
-                               live_api_mode=live_api_mode)
-
-    # find flights with price < threshold
-    find_flights_under_threshold_price(threshold=price_threshold,
-                                       search_date=outbound_date,
-                                       collection=collection,
-                                       logger=logger)
+    try:
+        route = get_api_results_for_n_days(days=days_to_request,
+                                           job_ledger=job_ledger,
+                                           base_url=base_url,
+                                           headers=headers,
+                                           cabin_class=cabin_class,
+                                           country=country,
+                                           currency=currency,
+                                           locale_lang=locale_lang,
+                                           city_from=city_from,
+                                           city_to=city_to,
+                                           country_from=country_from,
+                                           country_to=country_to,
+                                           outbound_date=outbound_date,
+                                           adults_count=adults_count,
+                                           max_retries=max_retries,
+                                           collection=collection,
+                                           logger=logger,
+                                           archive_writer=create_archive_writer(logger),
+                                           live_api_mode=live_api_mode,
+                                           max_concurrent_dates=max_concurrent_dates,
+                                           airport_id_cache=airport_id_cache,
+                                           http_client=http_client,
+                                           poll_params=get_poll_params(),
+                                           fetch_bucket_minutes=fetch_bucket_minutes,
+                                           price_facts_collection=price_facts_collection,
+                                           price_rollups_collection=price_rollups_collection,
+                                           snapshots_collection=snapshots_collection,
+                                           snapshot_checkpoint_every=snapshot_checkpoint_every,
+                                           browse_quotes_by_month=browse_quotes_by_month,
+                                           hybrid_mode=hybrid_mode,
+                                           price_threshold=price_threshold,
+                                           hybrid_price_margin=hybrid_price_margin,
+                                           hybrid_top_n=hybrid_top_n,
+                                           all_airports=all_airports_mode,
+                                           max_airport_pairs=all_airports_max_pairs,
+                                           request_budget=all_airports_request_budget,
+                                           requests_per_task=scheduler_requests_per_task)
+    except (AbortRunError, SkipTaskError) as exc:  # e.g. invalid API key or airports are not found
+        sys.exit(f"Run is aborted - {exc}")  # no point in running further
+    finally:
+        http_client.close()
+        response_cache.close()
+        job_ledger.close()
+        for metrics_exporter in metrics_exporters:
+            metrics_exporter.close()
+
+    # find flights with price < threshold (among recently fetched ones, across all airport pairs in all-airports mode)
+    fetched_after = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=price_max_age_hours)
+    flights_with_low_prices = find_flights_under_threshold_price(threshold=price_threshold,
+                                                                 route=route,
+                                                                 date_from=outbound_date,
+                                                                 collection=price_facts_collection,
+                                                                 logger=logger,
+                                                                 fetched_after=fetched_after)
+    for flight in flights_with_low_prices:
+        logger.info(f"{flight['OutboundDate']} - {flight['Price']} {currency} - {flight['CarrierName']}, "
+                    f"departure {flight['Departure']}, stops {flight['Stops']} - {flight['DeeplinkUrl']}")
 
     # clean up log files
     log_path_to_clean = os.path.join(cwd, log_files_folder)
@@ -59,6 +251,11 @@ def main():
                   extension='log',
                   to_keep_number=log_files_to_keep,
                   logger=logger)
+    if log_json_lines:
+        files_cleaner(path_to_clean=log_path_to_clean,
+                      extension='jsonl',
+                      to_keep_number=log_files_to_keep,
+                      logger=logger)
 
 
 if __name__ == "__main__":
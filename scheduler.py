@@ -0,0 +1,262 @@
+"""
+Refreshes prices for many routes in one process sharing the same request budget (per minute and per day).
+Every cycle builds a queue of due (route, date) tasks ordered by priority: near dates and dates with volatile prices
+are refreshed more often, the most overdue ones are fetched first.
+Run: python scheduler.py [--once]
+"""
+
+import argparse
+import datetime
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from airport_id_cache import AirportIdCache
+from archive_writer import ArchiveWriter
+from config import *
+from get_airport_id import get_airport_id
+from get_api_results_for_n_days import get_api_results_for_date, get_next_dates, run_for_airport_pair, run_tasks
+from http_client import HttpClient
+from logger import create_logger
+from mongodb_methods import build_route, find_last_fetch_times, find_price_volatility, record_fetch_times
+from rate_limiter import RateLimiter
+from retry_policy import AbortRunError, SkipTaskError
+from runner import (connect_to_collections, create_airport_id_cache, create_archive_writer, create_http_client,
+                    create_metrics_exporters, get_poll_params)
+
+
+def get_refresh_interval(days_until_departure: int, volatility: float, refresh_hours: dict, max_refresh_hours: float,
+                         volatility_weight: float) -> datetime.timedelta:
+    """
+    Returns how often date should be refreshed: interval of the closest days-until-departure threshold,
+    shortened for volatile prices (volatility - coefficient of variation of daily min price)
+    """
+
+    interval_hours = next((hours for days, hours in sorted(refresh_hours.items()) if days_until_departure <= days),
+                          max_refresh_hours)
+    return datetime.timedelta(hours=interval_hours / (1 + volatility_weight * volatility))
+
+
+def get_priority(last_fetched_at: datetime.datetime or None, refresh_interval: datetime.timedelta,
+                 now: datetime.datetime) -> float:
+    """
+    Returns how overdue date is (>= 1 - date is due, never fetched dates go first)
+    """
+
+    if last_fetched_at is None:
+        return math.inf
+    if last_fetched_at.tzinfo is None:  # MongoDB returns naive UTC datetimes by default
+        last_fetched_at = last_fetched_at.replace(tzinfo=datetime.timezone.utc)
+    return (now - last_fetched_at) / refresh_interval
+
+
+def resolve_routes(routes: list, airport_id_cache: AirportIdCache, http_client: HttpClient,
+                   logger: logging.Logger) -> list:
+    """
+    Returns routes config with airport ids, route and outbound dates (starting from today or route's date_from).
+    Route whose airport ids can't be found (e.g. misspelled city) is skipped, so the other routes are refreshed.
+    AbortRunError is raised only if it's raised for every route (e.g. invalid API key or daily budget is exhausted).
+    """
+    stage_name = "RESOLVE_ROUTES"
+
+    today = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
+    resolved_routes = []
+    abort_errors = []
+    for route_config in routes:
+        airport_ids = {}
+        try:
+            for direction in ("from", "to"):
+                airport_ids[direction] = get_airport_id(base_url=base_url,
+                                                        headers=headers,
+                                                        currency=currency,
+                                                        locale_lang=locale_lang,
+                                                        search_city=route_config[f"city_{direction}"],
+                                                        search_country=route_config[f"country_{direction}"],
+                                                        max_retries=max_retries,
+                                                        logger=logger,
+                                                        airport_id_cache=airport_id_cache,
+                                                        http_client=http_client)
+        except (AbortRunError, SkipTaskError) as exc:
+            logger.warning(f"{stage_name} - Route {route_config['city_from']}-{route_config['city_to']} "
+                           f"is skipped - {exc}")
+            if isinstance(exc, AbortRunError):
+                abort_errors.append(exc)
+            continue
+        date_from = max(route_config.get("date_from", today), today)
+        resolved_routes.append(dict(route_config,
+                                    airport_id_orig=airport_ids["from"],
+                                    airport_id_dest=airport_ids["to"],
+                                    route=build_route(airport_ids["from"], airport_ids["to"]),
+                                    outbound_dates=get_next_dates(date_from, route_config["days"])))
+    if abort_errors and len(abort_errors) == len(routes):
+        raise abort_errors[-1]
+    return resolved_routes
+
+
+def build_work_queue(routes: list, price_facts_collection, price_rollups_collection,
+                     logger: logging.Logger, fetch_times_collection=None) -> list:
+    """
+    Returns due (priority, route, outbound date) tasks of all routes, the most overdue first
+    """
+    stage_name = "BUILD_WORK_QUEUE"
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    work_queue = []
+    for route in routes:
+        last_fetch_times = find_last_fetch_times(route=route["route"],
+                                                 outbound_dates=route["outbound_dates"],
+                                                 collection=price_facts_collection,
+                                                 logger=logger,
+                                                 fetch_times_collection=fetch_times_collection)
+        price_volatility = find_price_volatility(route=route["route"],
+                                                 outbound_dates=route["outbound_dates"],
+                                                 collection=price_rollups_collection,
+                                                 logger=logger,
+                                                 history_days=scheduler_volatility_history_days)
+        for outbound_date in route["outbound_dates"]:
+            days_until_departure = (datetime.datetime.strptime(outbound_date, "%Y-%m-%d").date() - now.date()).days
+            refresh_interval = get_refresh_interval(days_until_departure=days_until_departure,
+                                                    volatility=price_volatility.get(outbound_date, 0),
+                                                    refresh_hours=scheduler_refresh_hours,
+                                                    max_refresh_hours=scheduler_max_refresh_hours,
+                                                    volatility_weight=scheduler_volatility_weight)
+            priority = get_priority(last_fetch_times.get(outbound_date), refresh_interval, now)
+            if priority >= 1:
+                work_queue.append((priority, route, outbound_date))
+
+    # the most overdue first, nearer dates first among equally overdue ones
+    work_queue.sort(key=lambda task: (-task[0], task[2]))
+    logger.info(f"{stage_name} - {len(work_queue)} dates of {len(routes)} routes are due for refresh")
+    return work_queue
+
+
+def run_scheduler_cycle(routes: list, collection, price_facts_collection, price_rollups_collection,
+                        airport_id_cache: AirportIdCache, http_client: HttpClient, rate_limiter: RateLimiter,
+                        logger: logging.Logger, snapshots_collection=None,
+                        archive_writer: ArchiveWriter = None, stop_event: threading.Event = None) -> None:
+    """
+    Fetches due dates of all routes (as many as fit into the remaining daily budget) and records the results.
+    Once stop event is set, dates that haven't started yet are left for the next cycle.
+    """
+    stage_name = "SCHEDULER"
+
+    # last fetch times are recorded for every fetched date (dates without prices have no price facts)
+    fetch_times_collection = collection.database.get_collection(db_fetch_times_collection,
+                                                                write_concern=collection.write_concern)
+    work_queue = build_work_queue(routes=resolve_routes(routes, airport_id_cache, http_client, logger),
+                                  price_facts_collection=price_facts_collection,
+                                  price_rollups_collection=price_rollups_collection,
+                                  logger=logger,
+                                  fetch_times_collection=fetch_times_collection)
+
+    remaining_requests = rate_limiter.get_remaining_daily_requests()
+    if remaining_requests is not None:
+        requests_per_task = scheduler_requests_per_task["live_api" if live_api_mode else "browse_quotes"]
+        tasks_in_budget = remaining_requests // requests_per_task
+        if tasks_in_budget < len(work_queue):
+            logger.warning(f"{stage_name} - Daily budget is enough for {tasks_in_budget} of {len(work_queue)} "
+                           f"due dates, the rest is postponed")
+            work_queue = work_queue[:tasks_in_budget]
+
+    tasks = []
+    for _, route, outbound_date in work_queue:
+        record_params = dict(collection=collection,
+                             archive_writer=archive_writer,
+                             fetch_bucket_minutes=fetch_bucket_minutes,
+                             price_facts_collection=price_facts_collection,
+                             price_rollups_collection=price_rollups_collection,
+                             snapshots_collection=snapshots_collection,
+                             snapshot_checkpoint_every=snapshot_checkpoint_every)
+        params = dict(base_url=base_url,
+                      headers=headers,
+                      cabin_class=cabin_class,
+                      country=country,
+                      currency=currency,
+                      locale_lang=locale_lang,
+                      airport_id_orig=route["airport_id_orig"],
+                      airport_id_dest=route["airport_id_dest"],
+                      outbound_date=outbound_date,
+                      adults_count=adults_count,
+                      max_retries=max_retries,
+                      live_api_mode=live_api_mode,
+                      logger=logger,
+                      record_params=record_params,
+                      http_client=http_client,
+                      poll_params=get_poll_params())
+        tasks.append(([outbound_date], run_for_airport_pair, dict(route=route["route"],
+                                                                  function=get_api_results_for_date,
+                                                                  params=params)))
+
+    refreshed_dates = []
+
+    def on_completed(result: tuple) -> None:
+        route, min_prices = result
+        record_fetch_times(route=route,
+                           outbound_dates=list(min_prices),
+                           collection=fetch_times_collection,
+                           max_retries=max_retries,
+                           logger=logger)
+        refreshed_dates.extend(min_prices)
+
+    failed_dates = run_tasks(tasks=tasks,
+                             max_concurrent_tasks=max_concurrent_dates,
+                             on_completed=on_completed,
+                             logger=logger,
+                             stop_event=stop_event)
+    logger.info(f"{stage_name} - Refreshed {len(refreshed_dates)} dates, failed {len(failed_dates)}")
+    if len(refreshed_dates) + len(failed_dates) < len(tasks):
+        logger.warning(f"{stage_name} - Stopped, {len(tasks) - len(refreshed_dates) - len(failed_dates)} due dates "
+                       f"are left for the next cycle")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="run 1 cycle and exit (e.g. to run from cron)")
+    parser.add_argument("--refresh-airport-ids", action="store_true", help="request cached airport ids again")
+    args = parser.parse_args()
+
+    stage_name = "SCHEDULER"
+    logger = create_logger(log_file_folder_path=os.path.join(os.getcwd(), log_files_folder),
+                           log_file_name=log_file,
+                           level=log_level,
+                           json_lines=log_json_lines)
+    collection, price_facts_collection, price_rollups_collection, snapshots_collection = \
+        connect_to_collections(logger)
+    airport_id_cache = create_airport_id_cache(logger, refresh=args.refresh_airport_ids)
+    http_client, rate_limiter, response_cache = create_http_client(logger)
+    archive_writer = create_archive_writer(logger)
+    metrics_exporters = create_metrics_exporters(logger)
+
+    try:
+        while True:
+            cycle_started_at = time.monotonic()
+            try:
+                run_scheduler_cycle(routes=scheduler_routes,
+                                    collection=collection,
+                                    price_facts_collection=price_facts_collection,
+                                    price_rollups_collection=price_rollups_collection,
+                                    airport_id_cache=airport_id_cache,
+                                    http_client=http_client,
+                                    rate_limiter=rate_limiter,
+                                    logger=logger,
+                                    snapshots_collection=snapshots_collection,
+                                    archive_writer=archive_writer)
+            except AbortRunError as exc:
+                if rate_limiter.get_remaining_daily_requests() != 0:
+                    sys.exit(f"Run is aborted - {exc}")  # e.g. invalid API key
+                logger.warning(f"{stage_name} - {exc}, the rest is postponed till the next day")
+
+            if args.once:
+                break
+            time.sleep(max(scheduler_cycle_minutes * 60 - (time.monotonic() - cycle_started_at), 0))
+    finally:
+        http_client.close()
+        response_cache.close()
+        for metrics_exporter in metrics_exporters:
+            metrics_exporter.close()
+
+
+if __name__ == "__main__":
+    main()
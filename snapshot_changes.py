@@ -0,0 +1,81 @@
+"""
+Splits Live API / Browse Quotes results (snapshots of the same route and date) into keyed entries,
+so repeated snapshots are stored as changes only (new, removed or changed entries) and rebuilt back on request.
+"""
+
+import hashlib
+import json
+
+# fields identifying entries of result lists (Live API and Browse Quotes use different ones)
+ENTRY_ID_FIELDS = ("Id", "QuoteId", "PlaceId", "CarrierId", "Code")
+
+
+def get_entry_key(list_name: str, entry) -> str:
+    """
+    Returns key of result list entry: itineraries are identified by legs, other entries by their id field
+    (or by content hash if entry has no id)
+    """
+
+    if list_name == "Itineraries":
+        return f"{entry.get('OutboundLegId')}|{entry.get('InboundLegId')}"
+    if isinstance(entry, dict):
+        for id_field in ENTRY_ID_FIELDS:
+            if id_field in entry:
+                return str(entry[id_field])
+    return hashlib.sha1(json.dumps(entry, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def split_snapshot(json_data: list) -> dict:
+    """
+    Returns {entry key: value} for all results: '<result #>|<field>' for top-level fields (SessionKey, Query etc.),
+    '<result #>|<list>|<entry key>' for list entries (e.g. itinerary with its pricing options)
+    """
+
+    entries = {}
+    for document_number, document in enumerate(json_data):
+        for field, value in document.items():
+            if field == "_id":
+                continue
+            if isinstance(value, list):
+                entries[f"{document_number}|{field}"] = []  # keeps empty lists and their order in result
+                for entry in value:
+                    entries[f"{document_number}|{field}|{get_entry_key(field, entry)}"] = entry
+            else:
+                entries[f"{document_number}|{field}"] = value
+    return entries
+
+
+def get_snapshot_changes(previous_entries: dict, entries: dict) -> tuple:
+    """
+    Returns (changed entries - new or changed ones, removed entry keys) between two snapshots
+    """
+
+    changed_entries = {key: value for key, value in entries.items() if previous_entries.get(key, ...) != value}
+    removed_keys = [key for key in previous_entries if key not in entries]
+    return changed_entries, removed_keys
+
+
+def apply_snapshot_changes(entries: dict, changed_entries: dict, removed_keys: list) -> dict:
+    entries = dict(entries)
+    for key in removed_keys:
+        entries.pop(key, None)
+    entries.update(changed_entries)
+    return entries
+
+
+def build_snapshot(entries: dict) -> list:
+    """
+    Rebuilds results (same format as API response) from snapshot entries
+    """
+
+    documents = {}
+    for key, value in entries.items():
+        document_number, field, *entry_key = key.split("|", 2)
+        document = documents.setdefault(int(document_number), {})
+        if entry_key:
+            document.setdefault(field, []).append(value)
+        elif isinstance(value, list):
+            document.setdefault(field, [])
+        else:
+            document[field] = value
+    return [documents[document_number] for document_number in sorted(documents)]
@@ -0,0 +1,31 @@
+import logging
+import os
+import sys
+import pytest
+
+# modules of the program are in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def logger() -> logging.Logger:
+    return logging.getLogger("tests")
+
+
+@pytest.fixture
+def mongo_database():
+    """
+    In-memory stand-in of MongoDB database (test is skipped if 'mongomock' isn't installed or doesn't support
+    installed pymongo)
+    """
+
+    mongomock = pytest.importorskip("mongomock")
+    import pymongo
+
+    database = mongomock.MongoClient().db
+    try:
+        database.probe.bulk_write([pymongo.ReplaceOne({"_id": 1}, {}, upsert=True)])
+    except TypeError:  # pymongo 4.11+ passes 'sort' to bulk write operations, mongomock 4.3 doesn't accept it
+        pytest.skip(f"installed mongomock doesn't support bulk writes of pymongo {pymongo.version}")
+    database.drop_collection("probe")
+    return database
@@ -0,0 +1,44 @@
+import json
+from airport_id_cache import AirportIdCache
+
+
+def test_cached_ids_are_persisted_into_file(tmp_path, logger):
+    file_path = str(tmp_path / "airport_ids.json")
+    AirportIdCache(file_path=file_path, logger=logger).set("Krakow", "Poland", "en-US", ["KRK-sky"])
+
+    airport_id_cache = AirportIdCache(file_path=file_path, logger=logger)
+    assert airport_id_cache.get("krakow", "POLAND", "en-us") == ["KRK-sky"]  # key is case insensitive
+    assert airport_id_cache.get("Tokyo", "Japan", "en-US") is None
+
+
+def test_expired_entry_is_not_returned(tmp_path, logger, monkeypatch):
+    airport_id_cache = AirportIdCache(file_path=str(tmp_path / "airport_ids.json"), logger=logger, ttl_days=1)
+    monkeypatch.setattr("airport_id_cache.time.time", lambda: 1000000)
+    airport_id_cache.set("Krakow", "Poland", "en-US", ["KRK-sky"])
+
+    monkeypatch.setattr("airport_id_cache.time.time", lambda: 1000000 + 23 * 60 * 60)
+    assert airport_id_cache.get("Krakow", "Poland", "en-US") == ["KRK-sky"]
+    monkeypatch.setattr("airport_id_cache.time.time", lambda: 1000000 + 25 * 60 * 60)
+    assert airport_id_cache.get("Krakow", "Poland", "en-US") is None
+
+
+def test_invalidate(tmp_path, logger):
+    file_path = str(tmp_path / "airport_ids.json")
+    airport_id_cache = AirportIdCache(file_path=file_path, logger=logger)
+    airport_id_cache.set("Krakow", "Poland", "en-US", ["KRK-sky"])
+    airport_id_cache.set("Tokyo", "Japan", "en-US", ["TYOA-sky"])
+
+    airport_id_cache.invalidate("Krakow", "Poland", "en-US")
+    assert airport_id_cache.get("Krakow", "Poland", "en-US") is None
+    assert airport_id_cache.get("Tokyo", "Japan", "en-US") == ["TYOA-sky"]
+
+    airport_id_cache.invalidate()
+    assert airport_id_cache.get("Tokyo", "Japan", "en-US") is None
+    with open(file_path) as file:
+        assert json.load(file) == {}
+
+
+def test_broken_file_starts_empty_cache(tmp_path, logger):
+    file_path = tmp_path / "airport_ids.json"
+    file_path.write_text("{broken")
+    assert AirportIdCache(file_path=str(file_path), logger=logger).get("Krakow", "Poland", "en-US") is None
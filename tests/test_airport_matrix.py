@@ -0,0 +1,34 @@
+from airport_matrix import CityPairMinPrices, ItineraryDeduplicator, build_airport_pairs
+
+
+def test_build_airport_pairs_most_relevant_first():
+    assert build_airport_pairs(["A", "B"], ["X", "Y", "Z"], max_pairs=4) == \
+        [("A", "X"), ("A", "Y"), ("B", "X"), ("B", "Y")]
+    assert build_airport_pairs(["A", "X"], ["X"]) == [("A", "X")]  # same airport isn't paired
+
+
+def test_city_pair_min_prices_complete_date_once_all_pairs_are_done():
+    min_prices = CityPairMinPrices(pairs_count=2)
+    assert min_prices.add("A:X", {"2030-01-01": 300, "2030-01-02": None}) == {}
+    assert min_prices.add("B:X", {"2030-01-01": 200, "2030-01-02": None}) == {"2030-01-01": 200, "2030-01-02": None}
+    assert min_prices.min_prices == {"2030-01-01": (200, "B:X"), "2030-01-02": (None, None)}
+
+
+def test_itinerary_deduplicator_drops_itineraries_of_other_pairs(logger):
+    deduplicator = ItineraryDeduplicator(logger)
+    first_result = {"Itineraries": [{"OutboundLegId": "L1"}, {"OutboundLegId": "L2"}, {"OutboundLegId": "L1"}]}
+    second_result = {"Itineraries": [{"OutboundLegId": "L2"}, {"OutboundLegId": "L3"}]}
+
+    assert deduplicator.filter_results([first_result], "2030-01-01", "A:X") == [first_result]  # own repeats kept
+    assert deduplicator.filter_results([second_result], "2030-01-01", "B:X") == \
+        [{"Itineraries": [{"OutboundLegId": "L3"}]}]
+    assert deduplicator.filter_results([second_result], "2030-01-02", "B:X") == [second_result]  # other date
+
+
+def test_itinerary_deduplicator_browse_quotes(logger):
+    deduplicator = ItineraryDeduplicator(logger)
+    quote = {"QuoteId": 1, "MinPrice": 100, "OutboundLeg": {"CarrierIds": [1], "OriginId": 1, "DestinationId": 2,
+                                                            "DepartureDate": "2030-01-01T00:00:00"}}
+    deduplicator.filter_results([{"Quotes": [quote]}], "2030-01-01", "A:X")
+    assert deduplicator.filter_results([{"Quotes": [dict(quote, QuoteId=2)], "Places": []}], "2030-01-01", "B:X") == \
+        [{"Quotes": [], "Places": []}]
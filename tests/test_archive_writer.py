@@ -0,0 +1,41 @@
+import gzip
+import json
+import os
+import pytest
+from archive_writer import ArchiveWriter
+
+
+def read_lines(file_path: str) -> list:
+    with gzip.open(file_path, "rt") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_write_appends_records_to_daily_file(tmp_path, logger):
+    archive_writer = ArchiveWriter(folder_path=str(tmp_path), logger=logger)
+    assert archive_writer.write("KRK-sky_TYOA-sky", [{"Price": 1}, {"Price": 2}])
+    assert archive_writer.write("KRK-sky_TYOA-sky", [{"Price": 3}])
+
+    file_path = archive_writer.get_file_path("KRK-sky_TYOA-sky")
+    assert read_lines(file_path) == [{"Price": 1}, {"Price": 2}, {"Price": 3}]
+    assert not [file_name for file_name in os.listdir(tmp_path) if file_name.endswith(".tmp")]
+
+
+def test_failed_append_is_truncated_back(tmp_path, logger, monkeypatch):
+    archive_writer = ArchiveWriter(folder_path=str(tmp_path), logger=logger, max_retries=2, retry_delay=0)
+    archive_writer.write("route", [{"Price": 1}])
+    file_path = archive_writer.get_file_path("route")
+    file_size = os.path.getsize(file_path)
+
+    def fail_fsync(file_descriptor: int) -> None:
+        raise OSError("disk is full")
+
+    monkeypatch.setattr("archive_writer.os.fsync", fail_fsync)
+    assert not archive_writer.write("route", [{"Price": 2}])
+    assert os.path.getsize(file_path) == file_size
+    assert read_lines(file_path) == [{"Price": 1}]
+    assert not [file_name for file_name in os.listdir(tmp_path) if file_name.endswith(".tmp")]
+
+
+def test_unsupported_compression(tmp_path, logger):
+    with pytest.raises(ValueError):
+        ArchiveWriter(folder_path=str(tmp_path), logger=logger, compression="bz2")
@@ -0,0 +1,74 @@
+"""
+Fetches dates of 1 route against fake Skyscanner API (MongoDB is replaced with mongomock)
+"""
+
+import datetime
+import threading
+import pytest
+from archive_writer import ArchiveWriter
+from fake_skyscanner_server import FakeSkyscannerApi, create_server
+from get_api_results_for_n_days import get_api_results_for_n_days
+from http_client import HttpClient
+from job_ledger import JobLedger
+from mongodb_methods import find_min_price_per_day
+
+
+@pytest.fixture
+def base_url():
+    server = create_server(FakeSkyscannerApi(countries=["Poland", "Japan"],
+                                             itineraries_count=20,
+                                             polls_count=2))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/apiservices/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("live_api_mode", [True, False])
+def test_fetch_record_and_resume(base_url, mongo_database, tmp_path, logger, live_api_mode):
+    http_client = HttpClient()
+    job_ledger = JobLedger(file_path=str(tmp_path / "job_ledger.sqlite"),
+                           logger=logger)
+    archive_writer = ArchiveWriter(folder_path=str(tmp_path / "json_files"),
+                                   logger=logger)
+    outbound_date = (datetime.date.today() + datetime.timedelta(days=10)).strftime("%Y-%m-%d")
+    params = dict(days=3,
+                  job_ledger=job_ledger,
+                  base_url=base_url,
+                  headers={},
+                  cabin_class="Economy",
+                  country="PL",
+                  currency="UAH",
+                  locale_lang="en-US",
+                  city_from="Krakow",
+                  city_to="Tokyo",
+                  country_from="Poland",
+                  country_to="Japan",
+                  outbound_date=outbound_date,
+                  adults_count=1,
+                  max_retries=2,
+                  collection=mongo_database.itineraries,
+                  live_api_mode=live_api_mode,
+                  logger=logger,
+                  archive_writer=archive_writer,
+                  max_concurrent_dates=2,
+                  http_client=http_client,
+                  poll_params={"poll_initial_interval": 0.01, "poll_max_interval": 0.05, "poll_session_budget": 10},
+                  price_facts_collection=mongo_database.price_facts,
+                  price_rollups_collection=mongo_database.price_rollups)
+    try:
+        route = get_api_results_for_n_days(**params)
+        assert route == "KRAK-sky:TOKY-sky"
+        assert job_ledger.get_status_counts("Krakow-Tokyo") == {"done": 3}
+        assert mongo_database.itineraries.count_documents({}) == 3
+        assert len(find_min_price_per_day(route, outbound_date, "2100-01-01", mongo_database.price_facts, logger)) == 3
+        assert mongo_database.price_rollups.count_documents({}) == 3
+        assert len(list((tmp_path / "json_files").glob("*.ndjson.gz"))) == 1
+
+        # next run continues after done dates (they are not fetched again)
+        get_api_results_for_n_days(**params)
+        assert job_ledger.get_status_counts("Krakow-Tokyo") == {"done": 6}
+        assert len(mongo_database.itineraries.distinct("OutboundDate")) == mongo_database.itineraries.count_documents({}) == 6
+    finally:
+        http_client.close()
+        job_ledger.close()
@@ -0,0 +1,33 @@
+from get_api_results_for_n_days import get_dates_in_budget, select_dates_for_live_api
+
+MIN_PRICES = {"2030-01-01": 500, "2030-01-02": 100, "2030-01-03": 300, "2030-01-04": None, "2030-01-05": 200}
+
+
+def test_select_top_n_cheapest_dates():
+    assert select_dates_for_live_api(min_prices=MIN_PRICES,
+                                     price_threshold=None,
+                                     price_margin=0.1,
+                                     top_n=2) == ["2030-01-02", "2030-01-05"]
+
+
+def test_select_dates_within_threshold_margin():
+    assert select_dates_for_live_api(min_prices=MIN_PRICES,
+                                     price_threshold=280,
+                                     price_margin=0.1,
+                                     top_n=1) == ["2030-01-02", "2030-01-03", "2030-01-05"]  # 300 <= 280 * 1.1
+
+
+def test_dates_without_quotes_are_not_selected():
+    assert select_dates_for_live_api(min_prices={"2030-01-01": None},
+                                     price_threshold=1000,
+                                     price_margin=0.1,
+                                     top_n=5) == []
+
+
+def test_dates_in_budget():
+    budget_params = dict(browse_quotes_requests=3, live_api_requests=18, hybrid_top_n=2)
+    assert get_dates_in_budget(request_budget=60, live_api_mode=True, hybrid_mode=False, **budget_params) == 3
+    assert get_dates_in_budget(request_budget=60, live_api_mode=False, hybrid_mode=False, **budget_params) == 20
+    # hybrid: every date is swept with Browse Quotes, Live API requests of top 2 dates are reserved
+    assert get_dates_in_budget(request_budget=80, live_api_mode=False, hybrid_mode=True, **budget_params) == 14
+    assert get_dates_in_budget(request_budget=30, live_api_mode=False, hybrid_mode=True, **budget_params) == 1
@@ -0,0 +1,29 @@
+from get_browse_quotes import split_browse_quotes_by_date
+
+
+def make_quote(quote_id: int, departure_date: str, carrier_id: int, destination_id: int = 2) -> dict:
+    return {"QuoteId": quote_id, "MinPrice": 100 * quote_id,
+            "OutboundLeg": {"CarrierIds": [carrier_id], "OriginId": 1, "DestinationId": destination_id,
+                            "DepartureDate": f"{departure_date}T00:00:00"}}
+
+
+def test_month_results_are_split_per_date():
+    month_result = {"Quotes": [make_quote(1, "2030-02-01", 10), make_quote(2, "2030-02-02", 20, destination_id=3),
+                               make_quote(3, "2030-02-01", 20)],
+                    "Places": [{"PlaceId": 1}, {"PlaceId": 2}, {"PlaceId": 3}],
+                    "Carriers": [{"CarrierId": 10}, {"CarrierId": 20}],
+                    "Currencies": [{"Code": "UAH"}]}
+
+    results_by_date = split_browse_quotes_by_date([month_result], ["2030-02-01", "2030-02-02", "2030-02-03"])
+    first_day, = results_by_date["2030-02-01"]
+    assert [quote["QuoteId"] for quote in first_day["Quotes"]] == [1, 3]
+    assert first_day["Places"] == [{"PlaceId": 1}, {"PlaceId": 2}]
+    assert first_day["Carriers"] == [{"CarrierId": 10}, {"CarrierId": 20}]
+    assert first_day["Currencies"] == [{"Code": "UAH"}]
+
+    second_day, = results_by_date["2030-02-02"]
+    assert [quote["QuoteId"] for quote in second_day["Quotes"]] == [2]
+    assert second_day["Places"] == [{"PlaceId": 1}, {"PlaceId": 3}]
+    assert second_day["Carriers"] == [{"CarrierId": 20}]
+
+    assert results_by_date["2030-02-03"] == [{**month_result, "Quotes": [], "Places": [], "Carriers": []}]
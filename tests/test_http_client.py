@@ -0,0 +1,39 @@
+import threading
+import time
+import requests
+from http_client import HttpClient
+from response_cache import ResponseCache
+
+
+def test_identical_concurrent_requests_are_sent_once(tmp_path, logger, monkeypatch):
+    response_cache = ResponseCache(file_path=str(tmp_path / "cache.sqlite"),
+                                   logger=logger,
+                                   endpoint_ttls={"browsequotes": 60})
+    http_client = HttpClient(response_cache=response_cache)
+    sent_urls = []
+
+    def send(method: str, url: str, **kwargs) -> requests.Response:
+        sent_urls.append(url)
+        time.sleep(0.2)  # the other requests arrive while this one is in flight
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"Quotes": []}'
+        return response
+
+    monkeypatch.setattr(http_client.session, "request", send)
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(
+        http_client.request("GET", "http://host/browsequotes/v1.0/PL", params={"a": 1}))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sent_urls == ["http://host/browsequotes/v1.0/PL"]
+    assert [response.json() for response in responses] == [{"Quotes": []}] * 5
+
+    http_client.request("GET", "http://host/pricing/uk2/v1.0/session")  # not cached endpoint
+    http_client.request("GET", "http://host/pricing/uk2/v1.0/session")
+    assert len(sent_urls) == 3
+    http_client.close()
+    response_cache.close()
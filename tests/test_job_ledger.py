@@ -0,0 +1,31 @@
+from job_ledger import JobLedger
+
+
+def test_claim_skips_done_and_running_dates(tmp_path, logger):
+    job_ledger = JobLedger(file_path=str(tmp_path / "job_ledger.sqlite"), logger=logger)
+    other_job_ledger = JobLedger(file_path=str(tmp_path / "job_ledger.sqlite"), logger=logger)  # other process
+
+    assert job_ledger.claim("A-B", ["2030-01-01", "2030-01-02", "2030-01-03"]) == \
+        ["2030-01-01", "2030-01-02", "2030-01-03"]
+    assert other_job_ledger.claim("A-B", ["2030-01-03", "2030-01-04"]) == ["2030-01-04"]
+
+    job_ledger.mark_done("A-B", ["2030-01-01"])
+    job_ledger.mark_failed("A-B", ["2030-01-02"], error="timeout")
+    job_ledger.release("A-B", ["2030-01-03"])
+    assert other_job_ledger.claim("A-B", ["2030-01-01", "2030-01-02", "2030-01-03"]) == ["2030-01-02", "2030-01-03"]
+    assert job_ledger.get_done_dates("A-B", date_from="2030-01-01") == {"2030-01-01"}
+    assert job_ledger.get_status_counts("A-B") == {"done": 1, "running": 3}
+    job_ledger.close()
+    other_job_ledger.close()
+
+
+def test_running_date_of_killed_process_is_reclaimed_after_timeout(tmp_path, logger, monkeypatch):
+    job_ledger = JobLedger(file_path=str(tmp_path / "job_ledger.sqlite"), logger=logger, running_timeout_minutes=1)
+    monkeypatch.setattr("job_ledger.time.time", lambda: 1000)
+    assert job_ledger.claim("A-B", ["2030-01-01"]) == ["2030-01-01"]
+
+    monkeypatch.setattr("job_ledger.time.time", lambda: 1030)
+    assert job_ledger.claim("A-B", ["2030-01-01"]) == []
+    monkeypatch.setattr("job_ledger.time.time", lambda: 1061)
+    assert job_ledger.claim("A-B", ["2030-01-01"]) == ["2030-01-01"]
+    job_ledger.close()
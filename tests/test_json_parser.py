@@ -0,0 +1,38 @@
+import pytest
+import requests
+from json_parser import LIVE_API_PRICE_FIELDS, parse_response, project_result
+
+
+def make_response(content: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    return response
+
+
+def test_projection_keeps_only_listed_fields():
+    result = {"SessionKey": "session",
+              "Status": "UpdatesComplete",
+              "Itineraries": [{"OutboundLegId": "L1", "BookingDetailsLink": {"Uri": "/"}}],
+              "Legs": [{"Id": "L1", "Departure": "2030-01-01T10:00:00", "SegmentIds": [1, 2]}],
+              "Segments": [{"Id": 1}],
+              "Places": [{"Id": 2}]}
+    assert project_result(result, LIVE_API_PRICE_FIELDS) == {
+        "SessionKey": "session",
+        "Status": "UpdatesComplete",
+        "Itineraries": [{"OutboundLegId": "L1", "BookingDetailsLink": {"Uri": "/"}}],  # kept whole
+        "Legs": [{"Id": "L1", "Departure": "2030-01-01T10:00:00"}]}
+
+
+def test_parse_response_from_bytes():
+    content = '{"Status": "UpdatesPending", "Segments": [], "Query": {"Locale": "uk-UA"}}'.encode()
+    assert parse_response(make_response(content)) == {"Status": "UpdatesPending", "Segments": [],
+                                                      "Query": {"Locale": "uk-UA"}}
+    assert parse_response(make_response(content), LIVE_API_PRICE_FIELDS) == {"Status": "UpdatesPending",
+                                                                             "Query": {"Locale": "uk-UA"}}
+    assert parse_response(make_response(b"[1, 2]"), LIVE_API_PRICE_FIELDS) == [1, 2]
+
+
+def test_broken_json_raises_value_error():
+    with pytest.raises(ValueError):
+        parse_response(make_response(b"<html>"))
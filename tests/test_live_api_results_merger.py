@@ -0,0 +1,40 @@
+from live_api_results_merger import LiveApiResultsMerger
+
+
+def make_poll(status: str, prices: dict, legs: list) -> dict:
+    return {"SessionKey": "session",
+            "Status": status,
+            "Itineraries": [{"OutboundLegId": leg_id, "InboundLegId": None,
+                             "PricingOptions": [{"Agents": [agent_id], "Price": price}
+                                                for agent_id, price in agent_prices.items()]}
+                            for leg_id, agent_prices in prices.items()],
+            "Legs": [{"Id": leg_id} for leg_id in legs],
+            "Agents": [{"Id": 1, "Name": "Agent"}]}
+
+
+def test_polls_are_merged_by_itinerary_and_agents():
+    merger = LiveApiResultsMerger(keep_delta_log=True)
+    first_delta = merger.merge(make_poll("UpdatesPending", {"L1": {1: 100}}, ["L1"]))
+    second_delta = merger.merge(make_poll("UpdatesComplete", {"L1": {1: 90, 2: 120}, "L2": {1: 200}}, ["L1", "L2"]))
+
+    assert (first_delta["NewItineraries"], first_delta["NewPricingOptions"]) == (1, 1)
+    assert (second_delta["NewItineraries"], second_delta["NewPricingOptions"], second_delta["RepricedOptions"]) == \
+        (1, 2, 1)
+
+    result = merger.get_result()
+    assert result["Status"] == "UpdatesComplete"
+    assert result["PollsCount"] == 2
+    assert [(itinerary["OutboundLegId"], [(option["Agents"], option["Price"])
+                                          for option in itinerary["PricingOptions"]])
+            for itinerary in result["Itineraries"]] == [("L1", [([1], 90), ([2], 120)]), ("L2", [([1], 200)])]
+    assert result["Legs"] == [{"Id": "L1"}, {"Id": "L2"}]  # lookups are not repeated
+    assert result["Agents"] == [{"Id": 1, "Name": "Agent"}]
+    assert [delta["Poll"] for delta in result["DeltaLog"]] == [1, 2]
+
+
+def test_itineraries_are_keyed_by_inbound_leg_as_well():
+    merger = LiveApiResultsMerger()
+    merger.merge({"Itineraries": [{"OutboundLegId": "L1", "InboundLegId": "R1", "PricingOptions": []},
+                                  {"OutboundLegId": "L1", "InboundLegId": "R2", "PricingOptions": []}]})
+    assert merger.itineraries_count == 2
+    assert "DeltaLog" not in merger.get_result()
@@ -0,0 +1,34 @@
+from metrics import Metrics, metrics_labels
+
+
+def test_prometheus_exposition():
+    metrics = Metrics(buckets=(0.1, 1))
+    with metrics_labels(route="KRK-sky:TYOA-sky"):
+        metrics.increment("http_requests_total", endpoint="browsequotes", status=200)
+        metrics.increment("http_requests_total", endpoint="browsequotes", status=200)
+        metrics.observe("stage_duration_seconds", 0.5, stage="RECORD")
+        metrics.observe("stage_duration_seconds", 5, stage="RECORD")
+
+    assert metrics.to_prometheus_text().splitlines() == [
+        '# TYPE flights_http_requests_total counter',
+        'flights_http_requests_total{endpoint="browsequotes",route="KRK-sky:TYOA-sky",status="200"} 2',
+        '# TYPE flights_stage_duration_seconds histogram',
+        'flights_stage_duration_seconds_bucket{route="KRK-sky:TYOA-sky",stage="RECORD",le="0.1"} 0',
+        'flights_stage_duration_seconds_bucket{route="KRK-sky:TYOA-sky",stage="RECORD",le="1"} 1',
+        'flights_stage_duration_seconds_bucket{route="KRK-sky:TYOA-sky",stage="RECORD",le="+Inf"} 2',
+        'flights_stage_duration_seconds_sum{route="KRK-sky:TYOA-sky",stage="RECORD"} 5.5',
+        'flights_stage_duration_seconds_count{route="KRK-sky:TYOA-sky",stage="RECORD"} 2']
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.increment("errors_total", error='say "hi"\n')
+    assert 'flights_errors_total{error="say \\"hi\\"\\n"} 1' in metrics.to_prometheus_text()
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+    metrics.increment("http_requests_total")
+    with metrics.time("stage_duration_seconds"):
+        pass
+    assert metrics.get_snapshot() == {"counters": [], "histograms": []}
@@ -0,0 +1,72 @@
+import pytest
+from mongodb_methods import claim_job, enqueue_jobs, finish_job, renew_job_lease
+
+
+@pytest.fixture
+def jobs_collection(mongo_database, logger):
+    collection = mongo_database.jobs
+    enqueue_jobs(route="A:B",
+                 outbound_dates=["2030-01-02", "2030-01-01"],
+                 params={"airport_id_orig": "A", "airport_id_dest": "B"},
+                 collection=collection,
+                 max_retries=1,
+                 logger=logger)
+    return collection
+
+
+def test_jobs_are_leased_to_one_worker_nearest_date_first(jobs_collection, logger):
+    first_job = claim_job(jobs_collection, "worker-1", logger)
+    second_job = claim_job(jobs_collection, "worker-2", logger)
+    assert (first_job["_id"], first_job["Attempts"], first_job["Params"]) == \
+        ("A:B|2030-01-01", 1, {"airport_id_orig": "A", "airport_id_dest": "B"})
+    assert second_job["_id"] == "A:B|2030-01-02"
+    assert claim_job(jobs_collection, "worker-3", logger) is None
+
+    assert finish_job(first_job, jobs_collection, "worker-1", logger)
+    assert finish_job(second_job, jobs_collection, "worker-2", logger, error="timeout")
+    assert {job["_id"]: (job["Status"], job["Error"]) for job in jobs_collection.find()} == \
+        {"A:B|2030-01-01": ("done", None), "A:B|2030-01-02": ("failed", "timeout")}
+
+
+def test_failed_job_is_retried_while_attempts_are_left(jobs_collection, logger):
+    for attempt in range(2):
+        job = claim_job(jobs_collection, "worker-1", logger, max_attempts=2)
+        assert (job["_id"], job["Attempts"]) == ("A:B|2030-01-01", attempt + 1)
+        finish_job(job, jobs_collection, "worker-1", logger, error="timeout")
+    assert claim_job(jobs_collection, "worker-1", logger, max_attempts=2)["_id"] == "A:B|2030-01-02"
+
+
+def test_expired_lease_is_claimed_by_other_worker(jobs_collection, logger):
+    expired_job = claim_job(jobs_collection, "worker-1", logger, lease_minutes=-1)
+    job = claim_job(jobs_collection, "worker-2", logger)
+    assert (job["_id"], job["LeaseOwner"], job["Attempts"]) == (expired_job["_id"], "worker-2", 2)
+    assert not finish_job(expired_job, jobs_collection, "worker-1", logger)  # lease is lost
+    assert finish_job(job, jobs_collection, "worker-2", logger)
+
+
+def test_refresh_resets_done_jobs(jobs_collection, logger):
+    finish_job(claim_job(jobs_collection, "worker-1", logger), jobs_collection, "worker-1", logger)
+    enqueue_jobs(route="A:B",
+                 outbound_dates=["2030-01-01"],
+                 params={},
+                 collection=jobs_collection,
+                 max_retries=1,
+                 logger=logger,
+                 refresh=True)
+    job = jobs_collection.find_one({"_id": "A:B|2030-01-01"})
+    assert (job["Status"], job["Attempts"], job["Params"]) == ("pending", 0, {})
+
+
+def test_job_expired_on_the_last_attempt_is_failed(jobs_collection, logger):
+    claim_job(jobs_collection, "worker-1", logger, lease_minutes=-1, max_attempts=1)
+    assert claim_job(jobs_collection, "worker-2", logger, max_attempts=1)["_id"] == "A:B|2030-01-02"
+    job = jobs_collection.find_one({"_id": "A:B|2030-01-01"})
+    assert (job["Status"], job["Error"]) == ("failed", "Lease expired on the last attempt")
+
+
+def test_renewed_lease_is_not_claimed_by_other_worker(jobs_collection, logger):
+    job = claim_job(jobs_collection, "worker-1", logger, lease_minutes=-1)
+    assert renew_job_lease(job, jobs_collection, "worker-1", logger, lease_minutes=10)
+    assert claim_job(jobs_collection, "worker-2", logger)["_id"] == "A:B|2030-01-02"
+    assert not renew_job_lease(job, jobs_collection, "worker-2", logger)  # not leased by worker-2
+    assert finish_job(job, jobs_collection, "worker-1", logger)
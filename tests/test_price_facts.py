@@ -0,0 +1,44 @@
+import datetime
+from price_facts import normalize_results
+
+FETCHED_AT = datetime.datetime(2030, 1, 1, 12, 0)
+
+LIVE_API_RESULT = {"Itineraries": [{"OutboundLegId": "L1", "InboundLegId": None,
+                                    "PricingOptions": [{"Agents": [1], "Price": 100, "DeeplinkUrl": "http://a"},
+                                                       {"Agents": [2], "Price": 120, "DeeplinkUrl": "http://b"}]}],
+                   "Legs": [{"Id": "L1", "Departure": "2030-02-01T10:00:00", "Arrival": "2030-02-02T08:00:00",
+                             "Duration": 1320, "Stops": [5, 6], "Carriers": [7]}],
+                   "Agents": [{"Id": 1, "Name": "Agent 1"}, {"Id": 2, "Name": "Agent 2"}],
+                   "Carriers": [{"Id": 7, "Name": "LOT"}]}
+
+BROWSE_QUOTES_RESULT = {"Quotes": [{"QuoteId": 1, "MinPrice": 90, "Direct": True,
+                                    "OutboundLeg": {"CarrierIds": [3], "OriginId": 1, "DestinationId": 2,
+                                                    "DepartureDate": "2030-02-01T00:00:00"}}],
+                        "Carriers": [{"CarrierId": 3, "Name": "KLM"}]}
+
+
+def test_live_api_result_gives_fact_per_pricing_option():
+    facts = normalize_results([LIVE_API_RESULT], "KRK-sky:TYOA-sky", "2030-02-01", FETCHED_AT, "2030-01-01T12:00")
+    assert [(fact["AgentName"], fact["Price"], fact["DeeplinkUrl"]) for fact in facts] == \
+        [("Agent 1", 100, "http://a"), ("Agent 2", 120, "http://b")]
+    fact = facts[0]
+    assert (fact["Source"], fact["Departure"], fact["Arrival"], fact["Duration"], fact["Stops"],
+            fact["CarrierName"]) == ("live_api", "2030-02-01T10:00:00", "2030-02-02T08:00:00", 1320, 2, "LOT")
+    assert fact["_id"] == "KRK-sky:TYOA-sky|2030-02-01|2030-01-01T12:00|L1|None|1"
+
+
+def test_browse_quotes_result_gives_fact_per_quote():
+    facts = normalize_results([BROWSE_QUOTES_RESULT], "KRK-sky:TYOA-sky", "2030-02-01", FETCHED_AT,
+                              "2030-01-01T12:00")
+    assert len(facts) == 1
+    fact = facts[0]
+    assert (fact["Source"], fact["Price"], fact["Stops"], fact["CarrierName"], fact["AgentId"]) == \
+        ("browse_quotes", 90, 0, "KLM", None)
+    assert fact["OutboundLegId"] == "1-2-2030-02-01T00:00:00-3"
+
+
+def test_itinerary_without_known_lookups():
+    facts = normalize_results([{"Itineraries": [{"OutboundLegId": "L9", "PricingOptions": [{"Price": 50}]}]}],
+                              "KRK-sky:TYOA-sky", "2030-02-01", FETCHED_AT, "2030-01-01T12:00")
+    assert [(fact["Price"], fact["AgentId"], fact["CarrierId"], fact["Stops"]) for fact in facts] == \
+        [(50, None, None, 0)]
@@ -0,0 +1,38 @@
+import datetime
+import pytest
+from price_rollups import build_rollup, get_percentile, group_facts_by_rollup
+
+FETCHED_AT = datetime.datetime(2030, 1, 1, 12, 0)
+
+
+def make_fact(leg_id: str, price: float or None, carrier_name: str = "LOT", agent_id: int = 1,
+              fetched_at: datetime.datetime = FETCHED_AT) -> dict:
+    return {"Route": "KRK-sky:TYOA-sky", "OutboundDate": "2030-02-01", "FetchedAt": fetched_at,
+            "OutboundLegId": leg_id, "InboundLegId": None, "AgentId": agent_id, "Price": price,
+            "CarrierName": carrier_name}
+
+
+def test_get_percentile():
+    assert get_percentile([10], 90) == 10
+    assert get_percentile([10, 20, 30, 40, 50], 50) == 30
+    assert get_percentile([10, 20], 10) == pytest.approx(11)
+
+
+def test_group_facts_by_rollup_skips_facts_without_price():
+    next_day = FETCHED_AT + datetime.timedelta(days=1)
+    grouped_facts = group_facts_by_rollup([make_fact("L1", 100), make_fact("L2", None),
+                                           make_fact("L3", 300, fetched_at=next_day)])
+    assert {rollup_id: len(facts) for rollup_id, facts in grouped_facts.items()} == \
+        {"KRK-sky:TYOA-sky|2030-02-01|2030-01-01": 1, "KRK-sky:TYOA-sky|2030-02-01|2030-01-02": 1}
+
+
+def test_build_rollup_keeps_latest_price_per_offer():
+    rollup = build_rollup(None, [make_fact("L1", 300, "KLM"), make_fact("L2", 100), make_fact("L3", 200)])
+    assert (rollup["MinPrice"], rollup["MedianPrice"], rollup["OffersCount"], rollup["CheapestCarrier"],
+            rollup["Version"]) == (100, 200, 3, "LOT", 1)
+
+    # re-fetch of the same offers replaces their prices instead of adding offers
+    rollup = build_rollup(rollup, [make_fact("L2", 400), make_fact("L1", 50, "KLM")])
+    assert (rollup["MinPrice"], rollup["MedianPrice"], rollup["OffersCount"], rollup["CheapestCarrier"],
+            rollup["Version"]) == (50, 200, 3, "KLM", 2)
+    assert rollup["_id"] == "KRK-sky:TYOA-sky|2030-02-01|2030-01-01"
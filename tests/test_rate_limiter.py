@@ -0,0 +1,61 @@
+import pytest
+from rate_limiter import RateLimiter, SharedRateLimiter
+from retry_policy import AbortRunError
+
+
+def test_burst_is_sent_at_once_then_requests_wait_for_tokens(monkeypatch):
+    rate_limiter = RateLimiter(requests_per_minute=60, burst=3)
+    sleeps = []
+    monkeypatch.setattr("rate_limiter.time.sleep", sleeps.append)
+    clock = [1000.0]
+    monkeypatch.setattr("rate_limiter.time.monotonic", lambda: clock[0])
+    rate_limiter.updated_at = clock[0]
+
+    assert [rate_limiter.acquire() for _ in range(3)] == [0, 0, 0]
+
+    def sleep(wait_time: float) -> None:
+        sleeps.append(wait_time)
+        clock[0] += wait_time
+
+    monkeypatch.setattr("rate_limiter.time.sleep", sleep)
+    assert rate_limiter.acquire() == pytest.approx(1)  # 1 token per sec
+    assert sleeps == [pytest.approx(1)]
+
+
+def test_daily_budget():
+    rate_limiter = RateLimiter(requests_per_minute=6000, burst=10, requests_per_day=2)
+    assert rate_limiter.get_remaining_daily_requests() == 2
+    rate_limiter.acquire()
+    rate_limiter.acquire()
+    assert rate_limiter.get_remaining_daily_requests() == 0
+    with pytest.raises(AbortRunError):
+        rate_limiter.acquire()
+
+
+def test_no_daily_budget():
+    assert RateLimiter(requests_per_minute=60).get_remaining_daily_requests() is None
+
+
+def test_shared_rate_limit_is_counted_across_processes(mongo_database, monkeypatch):
+    collection = mongo_database.rate_limits
+    rate_limiters = [SharedRateLimiter(collection=collection, requests_per_minute=3, burst=3, requests_per_day=4)
+                     for _ in range(2)]  # e.g. 2 worker processes
+    sleeps = []
+    monkeypatch.setattr("rate_limiter.time.sleep", sleeps.append)
+
+    for rate_limiter in (rate_limiters[0], rate_limiters[1], rate_limiters[0]):
+        rate_limiter.acquire()
+    assert sleeps == []
+    assert rate_limiters[1].get_remaining_daily_requests() == 1
+
+    # the minute is used up by both processes, 4th request waits for the next minute
+    def sleep(wait_time: float) -> None:
+        sleeps.append(wait_time)
+        collection.delete_many({"_id": {"$regex": "minute"}})  # the next minute has started
+
+    monkeypatch.setattr("rate_limiter.time.sleep", sleep)
+    rate_limiters[1].acquire()
+    assert len(sleeps) == 1 and 0 < sleeps[0] <= 60
+    assert rate_limiters[0].get_remaining_daily_requests() == 0
+    with pytest.raises(AbortRunError):
+        rate_limiters[0].acquire()
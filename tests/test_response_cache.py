@@ -0,0 +1,65 @@
+import requests
+from response_cache import ResponseCache
+
+
+def make_response(content: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/json"
+    response._content = content
+    return response
+
+
+def test_key_is_normalized():
+    assert ResponseCache.build_key("get", "HTTP://Host/browsequotes?b=2", {"a": 1}) == \
+        ResponseCache.build_key("GET", "http://host/browsequotes?a=1&b=2")
+
+
+def test_key_depends_on_headers():
+    key = ResponseCache.build_key("GET", "http://host/browsequotes", headers={"x-rapidapi-key": "first"})
+    assert key == ResponseCache.build_key("GET", "http://host/browsequotes", headers={"X-RapidAPI-Key": "first"})
+    assert key != ResponseCache.build_key("GET", "http://host/browsequotes", headers={"x-rapidapi-key": "second"})
+    assert "first" not in key
+
+
+def test_ttl_per_endpoint(tmp_path, logger):
+    response_cache = ResponseCache(file_path=str(tmp_path / "cache.sqlite"),
+                                   logger=logger,
+                                   endpoint_ttls={"browsequotes": 60})
+    assert response_cache.get_ttl("GET", "http://host/browsequotes/v1.0/PL") == 60
+    assert response_cache.get_ttl("POST", "http://host/browsequotes/v1.0/PL") is None
+    assert response_cache.get_ttl("GET", "http://host/pricing/uk2/v1.0/session") is None
+    response_cache.close()
+
+
+def test_expired_response_is_not_returned(tmp_path, logger, monkeypatch):
+    response_cache = ResponseCache(file_path=str(tmp_path / "cache.sqlite"),
+                                   logger=logger,
+                                   endpoint_ttls={"browsequotes": 60})
+    monkeypatch.setattr("response_cache.time.time", lambda: 1000)
+    response_cache.set("GET http://host/browsequotes", make_response(b'{"Quotes": []}'))
+
+    cached_response = response_cache.get("GET http://host/browsequotes", ttl=60)
+    assert (cached_response.status_code, cached_response.json(), cached_response.headers["content-type"]) == \
+        (200, {"Quotes": []}, "application/json")
+    monkeypatch.setattr("response_cache.time.time", lambda: 1061)
+    assert response_cache.get("GET http://host/browsequotes", ttl=60) is None
+    response_cache.close()
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path, logger, monkeypatch):
+    response_cache = ResponseCache(file_path=str(tmp_path / "cache.sqlite"),
+                                   logger=logger,
+                                   endpoint_ttls={"browsequotes": 60},
+                                   max_size_mb=25 / 1024 / 1024)  # 2 responses of 10 bytes
+    keys = [f"GET http://host/browsequotes/{number}" for number in range(3)]
+    for now, key in ((1, keys[0]), (2, keys[1])):
+        monkeypatch.setattr("response_cache.time.time", lambda: now)
+        response_cache.set(key, make_response(b"0123456789"))
+    monkeypatch.setattr("response_cache.time.time", lambda: 3)
+    assert response_cache.get(keys[0], ttl=60) is not None  # 1st response is used more recently now
+
+    monkeypatch.setattr("response_cache.time.time", lambda: 4)
+    response_cache.set(keys[2], make_response(b"0123456789"))
+    assert [key for key in keys if response_cache.get(key, ttl=60) is not None] == [keys[0], keys[2]]
+    response_cache.close()
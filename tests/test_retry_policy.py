@@ -0,0 +1,41 @@
+import datetime
+import email.utils
+import requests
+from retry_policy import ABORT, RETRY, SKIP, RetryPolicy
+
+
+def make_response(status_code: int, headers: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+def test_classify():
+    retry_policy = RetryPolicy()
+    assert retry_policy.classify(requests.exceptions.ConnectionError()) == RETRY
+    assert retry_policy.classify("timeout") == RETRY
+    assert retry_policy.classify("", response=make_response(401)) == ABORT
+    assert retry_policy.classify("", response=make_response(403)) == ABORT
+    assert retry_policy.classify("", response=make_response(429)) == RETRY
+    assert retry_policy.classify("", response=make_response(503)) == RETRY
+    assert retry_policy.classify("", response=make_response(400)) == SKIP
+    assert retry_policy.classify(requests.exceptions.HTTPError(response=make_response(404))) == SKIP
+
+
+def test_backoff_is_exponential_with_jitter_and_capped():
+    retry_policy = RetryPolicy(base_delay=2, max_delay=10, jitter=0.5)
+    for current_try, max_delay in ((1, 2), (2, 4), (3, 8), (4, 10), (10, 10)):
+        for _ in range(20):
+            assert max_delay * 0.5 <= retry_policy.get_delay(current_try) <= max_delay
+
+
+def test_retry_after_seconds_and_http_date():
+    retry_policy = RetryPolicy(max_delay=60)
+    assert retry_policy.get_delay(1, response=make_response(429, {"Retry-After": "7"})) == 7
+    assert retry_policy.get_delay(1, response=make_response(429, {"Retry-After": "600"})) == 60
+
+    retry_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=30)
+    headers = {"Retry-After": email.utils.format_datetime(retry_at, usegmt=True)}
+    assert 25 <= retry_policy.get_delay(1, response=make_response(503, headers)) <= 30
+    assert RetryPolicy.get_retry_after(make_response(503, {"Retry-After": "soon"})) is None
@@ -0,0 +1,33 @@
+import copy
+from snapshot_changes import apply_snapshot_changes, build_snapshot, get_snapshot_changes, split_snapshot
+
+LIVE_API_RESULT = {"SessionKey": "session",
+                   "Status": "UpdatesComplete",
+                   "Itineraries": [{"OutboundLegId": "L1", "InboundLegId": None, "PricingOptions": [{"Price": 100}]},
+                                   {"OutboundLegId": "L2", "InboundLegId": None, "PricingOptions": [{"Price": 200}]}],
+                   "Legs": [{"Id": "L1"}, {"Id": "L2"}],
+                   "Segments": []}
+
+
+def test_split_and_build_round_trip():
+    json_data = [LIVE_API_RESULT, {"Quotes": [{"QuoteId": 1, "MinPrice": 100}], "Places": []}]
+    assert build_snapshot(split_snapshot(json_data)) == json_data
+
+
+def test_changes_applied_to_previous_snapshot_rebuild_current_one():
+    current_result = copy.deepcopy(LIVE_API_RESULT)
+    current_result["SessionKey"] = "next session"
+    current_result["Itineraries"][0]["PricingOptions"][0]["Price"] = 90  # repriced
+    del current_result["Itineraries"][1]  # removed
+    current_result["Itineraries"].append({"OutboundLegId": "L3", "InboundLegId": None, "PricingOptions": []})
+    previous_entries, entries = split_snapshot([LIVE_API_RESULT]), split_snapshot([current_result])
+
+    changed_entries, removed_keys = get_snapshot_changes(previous_entries, entries)
+    assert set(changed_entries) == {"0|SessionKey", "0|Itineraries|L1|None", "0|Itineraries|L3|None"}
+    assert removed_keys == ["0|Itineraries|L2|None"]
+    assert build_snapshot(apply_snapshot_changes(previous_entries, changed_entries, removed_keys)) == [current_result]
+
+
+def test_no_changes_for_same_snapshot():
+    entries = split_snapshot([LIVE_API_RESULT])
+    assert get_snapshot_changes(entries, split_snapshot([copy.deepcopy(LIVE_API_RESULT)])) == ({}, [])
@@ -0,0 +1,222 @@
+"""
+Runs fetching on several processes / machines against one MongoDB: (route, date) jobs are enqueued into jobs
+collection and workers lease them one by one with atomic find_one_and_update. Lease of running job is renewed
+periodically, lease of crashed worker expires and its job is claimed by another worker.
+Rate limit and daily budget are shared by all workers (request counters in MongoDB).
+Enqueue jobs of scheduler_routes: python worker.py --enqueue [--refresh]
+Run workers:                      python worker.py [--processes 4] [--wait]
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from config import *
+from get_api_results_for_n_days import get_api_results_for_date
+from logger import create_logger, stop_logger
+from mongodb_methods import (claim_job, create_jobs_indexes, create_rate_limits_indexes, enqueue_jobs, finish_job,
+                             renew_job_lease)
+from rate_limiter import SharedRateLimiter
+from retry_policy import AbortRunError, SkipTaskError
+from runner import (connect_to_collections, create_airport_id_cache, create_archive_writer, create_http_client,
+                    create_metrics_exporters, get_poll_params)
+from scheduler import resolve_routes
+
+
+def get_jobs_collection(collection, logger: logging.Logger):
+    jobs_collection = collection.database.get_collection(db_jobs_collection,
+                                                         write_concern=collection.write_concern)
+    create_jobs_indexes(collection=jobs_collection,
+                        logger=logger)
+    return jobs_collection
+
+
+def create_shared_rate_limiter(collection, logger: logging.Logger) -> SharedRateLimiter:
+    """
+    Returns rate limiter shared by workers of all processes and machines (rate limit and daily budget are
+    of the whole RapidAPI plan, not per worker)
+    """
+
+    rate_limits_collection = collection.database.get_collection(db_rate_limits_collection,
+                                                                write_concern=collection.write_concern)
+    create_rate_limits_indexes(collection=rate_limits_collection,
+                               logger=logger)
+    return SharedRateLimiter(collection=rate_limits_collection,
+                             requests_per_minute=rate_limit_requests_per_minute,
+                             burst=rate_limit_burst,
+                             requests_per_day=rate_limit_requests_per_day)
+
+
+def keep_lease_renewed(job: dict, jobs_collection, worker_id: str, logger: logging.Logger,
+                       stop_event: threading.Event) -> None:
+    """
+    Renews lease of the running job every job_lease_renew_minutes until stop event is set (runs in background thread),
+    so job running longer than job_lease_minutes isn't claimed by other worker
+    """
+    stage_name = "WORKER"
+
+    while not stop_event.wait(job_lease_renew_minutes * 60):
+        try:
+            if not renew_job_lease(job=job,
+                                   collection=jobs_collection,
+                                   worker_id=worker_id,
+                                   logger=logger,
+                                   lease_minutes=job_lease_minutes):
+                return
+        except Exception:  # e.g. MongoDB is unavailable for a while - renewed next time
+            logger.exception(f"{stage_name} - Couldn't renew lease of {job['_id']}")
+
+
+def enqueue_route_jobs(refresh: bool, refresh_airport_ids: bool = False) -> None:
+    """
+    Enqueues jobs for all dates of scheduler_routes (airport ids are resolved once, workers get them with the job)
+    """
+
+    logger = create_logger(log_file_folder_path=os.path.join(os.getcwd(), log_files_folder),
+                           log_file_name=log_file,
+                           level=log_level,
+                           json_lines=log_json_lines)
+    collection, _, _, _ = connect_to_collections(logger)
+    jobs_collection = get_jobs_collection(collection, logger)
+    airport_id_cache = create_airport_id_cache(logger, refresh=refresh_airport_ids)
+    http_client, _, response_cache = create_http_client(logger)
+    try:
+        for route in resolve_routes(scheduler_routes, airport_id_cache, http_client, logger):
+            enqueue_jobs(route=route["route"],
+                         outbound_dates=route["outbound_dates"],
+                         params={"airport_id_orig": route["airport_id_orig"],
+                                 "airport_id_dest": route["airport_id_dest"],
+                                 "city_from": route["city_from"],
+                                 "city_to": route["city_to"]},
+                         collection=jobs_collection,
+                         max_retries=max_retries,
+                         logger=logger,
+                         refresh=refresh)
+    finally:
+        http_client.close()
+        response_cache.close()
+
+
+def run_worker(worker_id: str, wait: bool, process_number: int = 0) -> None:
+    """
+    Claims and runs jobs until there are no jobs left (or forever if wait is set).
+    Each worker process has its own MongoDB connection, HTTP client, log file and metrics export,
+    rate limit and daily budget are shared by all workers.
+    """
+    stage_name = "WORKER"
+
+    logger = create_logger(log_file_folder_path=os.path.join(os.getcwd(), log_files_folder),
+                           log_file_name=f"{worker_id}_{log_file}",
+                           level=log_level,
+                           json_lines=log_json_lines)
+    collection, price_facts_collection, price_rollups_collection, snapshots_collection = \
+        connect_to_collections(logger)
+    jobs_collection = get_jobs_collection(collection, logger)
+    http_client, _, response_cache = create_http_client(logger, create_shared_rate_limiter(collection, logger))
+    archive_writer = create_archive_writer(logger)
+    metrics_exporters = create_metrics_exporters(logger, process_number)
+
+    done_jobs_count = 0
+    try:
+        while True:
+            job = claim_job(collection=jobs_collection,
+                            worker_id=worker_id,
+                            logger=logger,
+                            lease_minutes=job_lease_minutes,
+                            max_attempts=job_max_attempts)
+            if job is None:
+                if not wait:
+                    break
+                time.sleep(job_idle_sleep)
+                continue
+
+            params = job["Params"]
+            record_params = dict(collection=collection,
+                                 archive_writer=archive_writer,
+                                 fetch_bucket_minutes=fetch_bucket_minutes,
+                                 price_facts_collection=price_facts_collection,
+                                 price_rollups_collection=price_rollups_collection,
+                                 snapshots_collection=snapshots_collection,
+                                 snapshot_checkpoint_every=snapshot_checkpoint_every)
+            lease_renewal_stop = threading.Event()
+            lease_renewal = threading.Thread(target=keep_lease_renewed,
+                                             args=(job, jobs_collection, worker_id, logger, lease_renewal_stop),
+                                             daemon=True)
+            lease_renewal.start()
+            try:
+                get_api_results_for_date(base_url=base_url,
+                                         headers=headers,
+                                         cabin_class=cabin_class,
+                                         country=country,
+                                         currency=currency,
+                                         locale_lang=locale_lang,
+                                         airport_id_orig=params["airport_id_orig"],
+                                         airport_id_dest=params["airport_id_dest"],
+                                         outbound_date=job["OutboundDate"],
+                                         adults_count=adults_count,
+                                         max_retries=max_retries,
+                                         live_api_mode=live_api_mode,
+                                         logger=logger,
+                                         record_params=record_params,
+                                         http_client=http_client,
+                                         poll_params=get_poll_params())
+            except SkipTaskError as exc:  # only this job fails, it's retried later (while attempts are left)
+                finish_job(job, jobs_collection, worker_id, logger, error=str(exc))
+                continue
+            except AbortRunError as exc:  # e.g. invalid API key, no point in claiming other jobs
+                finish_job(job, jobs_collection, worker_id, logger, error=str(exc))
+                logger.critical(f"{stage_name} - {worker_id} is stopped - {exc}")
+                break
+            except Exception as exc:  # unexpected error of 1 job (e.g. malformed response) doesn't stop the worker
+                logger.exception(f"{stage_name} - {job['_id']} failed")
+                finish_job(job, jobs_collection, worker_id, logger, error=str(exc))
+                continue
+            finally:
+                lease_renewal_stop.set()
+                lease_renewal.join()
+
+            if finish_job(job, jobs_collection, worker_id, logger):
+                done_jobs_count += 1
+    except Exception:
+        logger.exception(f"{stage_name} - {worker_id} crashed")
+        raise
+    finally:
+        http_client.close()
+        response_cache.close()
+        for metrics_exporter in metrics_exporters:
+            metrics_exporter.close()
+        logger.info(f"{stage_name} - {worker_id} is finished, done {done_jobs_count} jobs")
+        stop_logger()  # worker process exits without running exit handlers (crashed one as well)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--enqueue", action="store_true", help="enqueue jobs for scheduler_routes and exit")
+    parser.add_argument("--refresh", action="store_true", help="reset done and failed jobs to pending on enqueue")
+    parser.add_argument("--refresh-airport-ids", action="store_true", help="request cached airport ids again")
+    parser.add_argument("--processes", type=int, default=1, help="number of worker processes on this machine")
+    parser.add_argument("--wait", action="store_true", help="keep waiting for new jobs when queue is empty")
+    args = parser.parse_args()
+
+    if args.enqueue:
+        enqueue_route_jobs(refresh=args.refresh, refresh_airport_ids=args.refresh_airport_ids)
+        return
+
+    worker_id_prefix = f"{socket.gethostname()}-{os.getpid()}"
+    if args.processes <= 1:
+        run_worker(worker_id_prefix, args.wait)
+        return
+
+    processes = [multiprocessing.Process(target=run_worker, args=(f"{worker_id_prefix}-{number}", args.wait, number))
+                 for number in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()